@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Compare parsing the same timemap from link-format and from JSON, whole and
+streamed.
+
+Usage: python benchmarks/formats.py [COUNT ...]
+"""
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import io
+import sys
+import time
+
+from pymemento import LinkTimemap
+
+import synthetic
+
+
+def timed(function, *args, **kwargs):
+    """
+    Return the best of three wall-clock timings of 'function', in seconds.
+    """
+    best = None
+    for _ in range(3):
+        start = time.time()
+        function(*args, **kwargs)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(counts):
+    print('{0:>10} {1:>10} {2:>10} {3:>12} {4:>10} {5:>10}'.format(
+        'mementos', 'link KiB', 'JSON KiB', 'link s', 'JSON s',
+        'stream s'))
+    for count in counts:
+        text = synthetic.timemap_text(count)
+        document = LinkTimemap.from_string(text, synthetic.ARCHIVE).to_json()
+        print('{0:>10} {1:>10} {2:>10} {3:>12.3f} {4:>10.3f} {5:>10.3f}'.format(
+            count, len(text) // 1024, len(document) // 1024,
+            timed(LinkTimemap.from_string, text, synthetic.ARCHIVE),
+            timed(LinkTimemap.from_json, document, synthetic.ARCHIVE),
+            timed(lambda: LinkTimemap.from_json(io.BytesIO(document),
+                                                synthetic.ARCHIVE))))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the memory used by the mementos of a regular and a compact
+'LinkTimemap'.
+
+Usage: python benchmarks/memory.py [COUNT ...]
+"""
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import array
+import sys
+
+from pymemento import LinkTimemap
+
+import synthetic
+
+
+def deep_size(obj, seen=None):
+    """
+    Return the size in bytes of 'obj' and everything reachable from it.
+    Shared immutable singletons (None, small ints, tzinfo) are counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_size(item, seen)
+    elif isinstance(obj, (basestring, int, long, float, array.array)):
+        pass
+    else:
+        for name in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, name):
+                size += deep_size(getattr(obj, name), seen)
+        if hasattr(obj, '__dict__'):
+            size += deep_size(obj.__dict__, seen)
+    return size
+
+
+def main(counts):
+    print('{0:>10} {1:>14} {2:>14} {3:>7}'.format(
+        'mementos', 'dict bytes', 'compact bytes', 'ratio'))
+    for count in counts:
+        text = synthetic.timemap_text(count)
+        regular = LinkTimemap.from_string(text, synthetic.ARCHIVE)
+        compact = LinkTimemap.from_string(text, synthetic.ARCHIVE,
+                                          compact=True)
+        regular_size = deep_size(regular.mementos)
+        compact_size = deep_size(compact.mementos)
+        print('{0:>10} {1:>14} {2:>14} {3:>7.2f}'.format(
+            count, regular_size, compact_size, regular_size / compact_size))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite: parsing throughput and memory, datetime lookups and
+Resource probing against a local HTTP stub.
+
+Results are written as JSON; given a previous result file with --compare,
+every timing is reported relative to it and the exit status is 1 if any is
+slower by more than --tolerance.
+
+Usage: python benchmarks/suite.py [--sizes 10,1000,100000]
+                                  [--output FILE] [--compare FILE]
+"""
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'pymemento', 'test'))
+
+from pymemento import LinkTimemap, Resource, Session
+from stubserver import StubServer
+
+import synthetic
+
+
+# Sizes above this are only parsed from a file, never held as a string
+STRING_LIMIT = 1000000
+
+
+def best_of(repeat, function, *args):
+    """
+    Return the best wall-clock time of 'repeat' calls of 'function', and
+    its last result.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory(function, *args):
+    """
+    Return the growth of the peak resident set size, in KiB, while running
+    'function' in a forked child process.
+    """
+    def child(pipe):
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        function(*args)
+        pipe.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+
+    parent, pipe = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=child, args=(pipe,))
+    process.start()
+    growth = parent.recv()
+    process.join()
+    return growth
+
+
+def parsing(results, count, directory, repeat):
+    path = os.path.join(directory, 'timemap-{0}.txt'.format(count))
+    with open(path, 'wb') as tmfile:
+        synthetic.write_timemap(tmfile, count, varied=True)
+    size = os.path.getsize(path)
+
+    for compact in (False, True):
+        name = 'from_file{0}/{1}'.format('_compact' if compact else '', count)
+        seconds, timemap = best_of(repeat, LinkTimemap.from_file, path,
+                                   synthetic.ARCHIVE, 'utf-8', compact)
+        results[name] = {
+            'seconds': seconds,
+            'mementos_per_second': count / seconds,
+            'megabytes_per_second': size / 1e6 / seconds,
+            'peak_kib': peak_memory(LinkTimemap.from_file, path,
+                                    synthetic.ARCHIVE, 'utf-8', compact),
+        }
+        if not compact:
+            lookups(results, count, timemap, repeat)
+        del timemap
+
+    if count <= STRING_LIMIT:
+        with open(path, 'rb') as tmfile:
+            text = tmfile.read()
+        seconds, _ = best_of(repeat, LinkTimemap.from_string, text,
+                             synthetic.ARCHIVE)
+        results['from_string/{0}'.format(count)] = {
+            'seconds': seconds,
+            'mementos_per_second': count / seconds,
+            'megabytes_per_second': size / 1e6 / seconds,
+        }
+    os.remove(path)
+
+
+def lookups(results, count, timemap, repeat, samples=10000):
+    keys = timemap.range()
+    rng = random.Random(count)
+    hits = [rng.choice(keys) for _ in range(samples)]
+
+    def getitem():
+        for key in hits:
+            timemap[key]
+
+    def nearest():
+        for key in hits:
+            timemap.nearest(key)
+
+    for name, function in (('getitem', getitem), ('nearest', nearest)):
+        seconds, _ = best_of(repeat, function)
+        results['{0}/{1}'.format(name, count)] = {
+            'seconds': seconds,
+            'microseconds_per_lookup': seconds / samples * 1e6,
+        }
+
+
+def probing(results, count, repeat):
+    def route(method, path, headers):
+        return (200, {'Link': '<{0}>; rel="timegate", <{1}>; rel="timemap"'
+                      .format('http://arxiv.example.net/timegate' + path,
+                              'http://arxiv.example.net/timemap' + path)}, '')
+
+    class Routes(dict):
+        def get(self, path, default=None):
+            return route
+
+    with StubServer(Routes()) as server:
+        session = Session(max_retries=0)
+        uris = [server.url('/page/{0}'.format(i)) for i in range(count)]
+
+        def sequential():
+            for uri in uris:
+                Resource(uri, session=session).getURIFromRelation('timegate')
+
+        def concurrent():
+            Resource.probe_many(uris, session=session)
+
+        for name, function in (('probe_sequential', sequential),
+                               ('probe_many', concurrent)):
+            seconds, _ = best_of(repeat, function)
+            results['{0}/{1}'.format(name, count)] = {
+                'seconds': seconds,
+                'requests_per_second': count / seconds,
+            }
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print every timing relative to 'baseline'; return the names of those
+    slower by more than 'tolerance'.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name]['seconds'] / baseline[name]['seconds']
+        flag = ''
+        if ratio > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{0:<32} {1:>8.3f}x{2}'.format(name, ratio, flag),
+              file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='10,1000,100000',
+                        help='comma-separated memento counts, up to 10000000')
+    parser.add_argument('--probes', type=int, default=200,
+                        help='URIs probed against the stub server')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--compare', help='a previous JSON result file')
+    parser.add_argument('--tolerance', type=float, default=1.2,
+                        help='slowdown ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = {}
+    directory = tempfile.mkdtemp()
+    try:
+        for count in [int(size) for size in args.sizes.split(',')]:
+            parsing(results, count, directory, args.repeat)
+    finally:
+        shutil.rmtree(directory)
+    if args.probes:
+        probing(results, args.probes, args.repeat)
+
+    report = json.dumps({'environment': environment(), 'results': results},
+                        indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            if compare(results, json.load(baseline)['results'],
+                       args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic link timemaps for the benchmarks.
+"""
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+import io
+
+
+ORIGINAL = 'http://a.example.org/'
+ARCHIVE  = 'http://arxiv.example.net'
+LICENSE  = 'http://creativecommons.org/publicdomain/zero/1.0/'
+LICENSES = [LICENSE, 'http://creativecommons.org/licenses/by/4.0/']
+
+
+def timemap_text(count, start=datetime(1996, 1, 1), step=timedelta(hours=7),
+                 varied=False):
+    """
+    Return a link timemap for ORIGINAL with 'count' Wayback-style mementos.
+    """
+    with io.BytesIO() as tmfile:
+        write_timemap(tmfile, count, start, step, varied)
+        return tmfile.getvalue()
+
+
+def write_timemap(tmfile, count, start=datetime(1996, 1, 1),
+                  step=timedelta(hours=7), varied=False):
+    """
+    Write a link timemap for ORIGINAL with 'count' mementos to 'tmfile', one
+    link at a time, so that timemaps far larger than memory can be made.
+
+    With 'varied', the timemap mixes what real archives serve: relative and
+    absolute URI-Ms, several mementos sharing a datetime, two licenses, and
+    dates with a numeric zone or in ISO 8601 form besides RFC 1123.
+    """
+    tmfile.write('\n'.join([
+        '<{0}>;rel="original",'.format(ORIGINAL),
+        '<{0}/timemap/link/{1}>;rel="self";type="application/link-format",'
+            .format(ARCHIVE, ORIGINAL),
+        '<{0}/timegate/{1}>;rel="timegate",'.format(ARCHIVE, ORIGINAL),
+        '']).encode('utf-8'))
+    memento_dt = start
+    lines = []
+    for i in range(count):
+        if i == 0:
+            rels = 'first memento'
+        elif i == count - 1:
+            rels = 'last memento'
+        else:
+            rels = 'memento'
+        timestamp = memento_dt.strftime('%Y%m%d%H%M%S')
+        date = memento_dt.strftime('%a, %d %b %Y %H:%M:%S GMT')
+        archive = ARCHIVE
+        license = LICENSE if i % 2 else None
+        if varied:
+            if i % 10 == 3:
+                date = memento_dt.strftime('%a, %d %b %Y %H:%M:%S +0000')
+            elif i % 10 == 7:
+                date = memento_dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+            if i % 4 == 1:
+                archive = ''
+            license = LICENSES[i % 3] if i % 3 < 2 else None
+        lines.append('<{0}/web/{1}/{2}>; rel="{3}"; datetime="{4}"{5}'.format(
+            archive, timestamp, ORIGINAL, rels, date,
+            '; license="{0}"'.format(license) if license else ''))
+        if varied and i % 50 == 25:
+            lines.append('<{0}/mirror/{1}/{2}>; rel="memento"; '
+                         'datetime="{3}"'.format(ARCHIVE, timestamp, ORIGINAL,
+                                                 date))
+        if len(lines) >= 10000:
+            tmfile.write(',\n'.join(lines).encode('utf-8') + b',\n')
+            lines = []
+        memento_dt += step
+    if lines:
+        tmfile.write(',\n'.join(lines).encode('utf-8'))
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import json
+import mmap
+import struct
+
+from .LinkTimemap import LinkTimemap, TimemapLink, CompactMementos
+
+
+#==========================================================================
+# Binary timemap format
+#==========================================================================
+#
+# All integers are little-endian.  The file consists of:
+#
+#   header      magic, row count, datetime count, literal URI count and
+#               metadata length (HEADER)
+#   metadata    UTF-8 JSON: original URI, timegate URIs, timemap links,
+#               and the URI template, rel and license tables
+#   epochs      int64 per row, sorted
+#   keys        int64 per distinct datetime
+#   starts      int64 per distinct datetime: its first row
+#   uri codes   int64 per row (see CompactMementos)
+#   rel codes   uint32 per row (uint16 in version 1)
+#   licenses    uint32 per row (uint16 in version 1)
+#   offsets     uint64 per literal URI, plus one: offsets into the data
+#   data        the UTF-8 literal URIs, back to back
+#
+# Each section starts on an 8 byte boundary.
+
+MAGIC  = b'PYMTM\x02\x00\x00'
+HEADER = struct.Struct(str('<8sQQQQ'))
+
+# The struct code of the rel and license columns of each version
+CODES = {b'PYMTM\x01\x00\x00': 'H', MAGIC: 'I'}
+
+
+def save(timemap, path):
+    """
+    Write 'timemap' to 'path' in the binary timemap format.
+    """
+    mementos = timemap.mementos
+    if not isinstance(mementos, CompactMementos):
+        mementos = CompactMementos(memento
+                                   for links in (mementos or {}).itervalues()
+                                   for memento in links)
+    mementos._finish()
+    literals = [_utf8(uri) for uri in mementos._literals]
+    meta = json.dumps({
+        'original_uri': _text(timemap.original_uri),
+        'timegate_uris': [_text(uri) for uri in timemap.timegate_uris],
+        'timemaps': [link.to_row() for link in timemap.timemaps],
+        'templates': [[_text(prefix), _text(suffix)]
+                      for prefix, suffix in mementos._templates],
+        'rels': [[_text(rel) for rel in rels] for rels in mementos._rels],
+        'licenses': [_text(uri) for uri in mementos._licenses],
+    }, sort_keys=True).encode('utf-8')
+    with open(path, 'wb') as tmfile:
+        tmfile.write(HEADER.pack(MAGIC, len(mementos._epochs),
+                                 len(mementos._keys), len(literals),
+                                 len(meta)))
+        _write(tmfile, meta)
+        _write_column(tmfile, 'q', mementos._epochs)
+        _write_column(tmfile, 'q', mementos._keys)
+        _write_column(tmfile, 'q', mementos._starts)
+        _write_column(tmfile, 'q', mementos._uri_codes)
+        _write_column(tmfile, CODES[MAGIC], mementos._rel_codes)
+        _write_column(tmfile, CODES[MAGIC], mementos._license_codes)
+        offsets = [0]
+        for literal in literals:
+            offsets.append(offsets[-1] + len(literal))
+        _write_column(tmfile, 'Q', offsets)
+        _write(tmfile, b''.join(literals))
+
+
+def load(path, use_mmap=True):
+    """
+    Read a timemap written by 'save'.
+
+    With 'use_mmap' the file is memory-mapped and mementos are read
+    straight from the mapping when they are looked up; otherwise it is
+    read into memory first.  Either way nothing is decoded up front.
+
+    Returns:
+        A LinkTimemap whose mementos are a read-only 'MappedMementos'.
+    """
+    with open(path, 'rb') as tmfile:
+        if use_mmap:
+            buf = mmap.mmap(tmfile.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = tmfile.read()
+    mementos = MappedMementos(buf)
+    meta = mementos._meta
+    timemap = LinkTimemap(meta['original_uri'], meta['timegate_uris'],
+                          [TimemapLink.from_row(row)
+                           for row in meta['timemaps']],
+                          mementos)
+    return timemap
+
+
+class MappedMementos(CompactMementos):
+    """
+    A 'CompactMementos' whose columns are views of a binary timemap held in
+    a buffer (typically a memory map).  Rows are decoded only when read.
+    """
+
+    def __init__(self, buf):
+        magic, rows, keys, literals, meta_len = HEADER.unpack_from(buf, 0)
+        code = CODES.get(magic)
+        if code is None:
+            raise ValueError('Not a binary timemap')
+        super(MappedMementos, self).__init__()
+        self._buf = buf
+        offset = HEADER.size
+        self._meta = json.loads(bytes(buf[offset:offset + meta_len])
+                                .decode('utf-8'))
+        offset = _aligned(offset + meta_len)
+        self._epochs, offset = _Column.at(buf, offset, 'q', rows)
+        self._keys, offset = _Column.at(buf, offset, 'q', keys)
+        self._starts, offset = _Column.at(buf, offset, 'q', keys)
+        self._uri_codes, offset = _Column.at(buf, offset, 'q', rows)
+        self._rel_codes, offset = _Column.at(buf, offset, code, rows)
+        self._license_codes, offset = _Column.at(buf, offset, code, rows)
+        offsets, offset = _Column.at(buf, offset, 'Q', literals + 1)
+        self._literals = _StringTable(buf, offset, offsets)
+        self._templates = [tuple(template)
+                           for template in self._meta['templates']]
+        self._rels = [tuple(rels) for rels in self._meta['rels']]
+        self._licenses = self._meta['licenses']
+
+    def add(self, memento):
+        raise TypeError('MappedMementos is read-only')
+
+    def close(self):
+        """
+        Release the memory map, if any.
+        """
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+
+class _Column(object):
+    """
+    Read-only sequence of fixed-size integers stored in a buffer.
+    """
+    __slots__ = ('_buf', '_offset', '_count', '_struct')
+
+    def __init__(self, buf, offset, code, count):
+        self._buf    = buf
+        self._offset = offset
+        self._count  = count
+        self._struct = struct.Struct(str('<' + code))
+
+    @staticmethod
+    def at(buf, offset, code, count):
+        """
+        Return the column at 'offset' and the offset of the next section.
+        """
+        column = _Column(buf, offset, code, count)
+        return column, _aligned(offset + count * column._struct.size)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._struct.unpack_from(self._buf,
+                                        self._offset + i * self._struct.size)[0]
+
+
+class _StringTable(object):
+    """
+    Read-only sequence of UTF-8 strings stored back to back in a buffer.
+    """
+    __slots__ = ('_buf', '_offset', '_offsets')
+
+    def __init__(self, buf, offset, offsets):
+        self._buf     = buf
+        self._offset  = offset
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start = self._offset + self._offsets[i]
+        end = self._offset + self._offsets[i + 1]
+        return self._buf[start:end].decode('utf-8')
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def _write(tmfile, data):
+    tmfile.write(data)
+    padding = _aligned(len(data)) - len(data)
+    tmfile.write(b'\0' * padding)
+
+
+def _write_column(tmfile, code, values, chunk=65536):
+    size = struct.calcsize(str(code))
+    for start in xrange(0, len(values), chunk):
+        part = values[start:start + chunk]
+        tmfile.write(struct.pack(str('<%d%s' % (len(part), code)), *part))
+    padding = _aligned(len(values) * size) - len(values) * size
+    tmfile.write(b'\0' * padding)
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _utf8(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import array
+import bisect
+import calendar
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .LinkTimemap import CompactMementos, to_epoch, from_epoch
+
+
+#==========================================================================
+# Temporal coverage of timemaps
+#==========================================================================
+#
+# Statistics are computed over the sorted epochs of a timemap's mementos,
+# one per memento, taken as they are from 'CompactMementos' (and from the
+# memory map of a loaded binary timemap) or built from the datetime keys
+# of a regular timemap; no 'MementoLink's are made.  With NumPy installed
+# the epochs are a NumPy array and every step is vectorized, and 'coverage'
+# concatenates the epochs of all timemaps to compute their statistics
+# together; otherwise the histograms still take one binary search per
+# month, and only the gaps need a pass over the epochs.
+
+
+class TimemapStats(object):
+    """
+    Temporal coverage of one timemap.
+
+    Attributes:
+        original_uri: the URI-R of the timemap.
+        count: the number of mementos.
+        datetimes: the number of distinct memento datetimes.
+        first: the earliest memento datetime, or None.
+        last: the latest memento datetime, or None.
+        gaps: a list of (start, end) memento datetime pairs with no memento
+            in between, for every interval longer than the gap threshold.
+        per_month: an OrderedDict of (year, month) to the number of
+            mementos, for every month from 'first' to 'last'.
+        per_year: an OrderedDict of year to the number of mementos.
+    """
+
+    def __init__(self, original_uri=None):
+        self.original_uri = original_uri
+        self.count        = 0
+        self.datetimes    = 0
+        self.first        = None
+        self.last         = None
+        self.gaps         = []
+        self.per_month    = OrderedDict()
+        self.per_year     = OrderedDict()
+
+    def __repr__(self):
+        return ('TimemapStats<original: {0}, mementos: {1}, first: {2}, '
+                'last: {3}, gaps: {4}>').format(
+                    self.original_uri, self.count, self.first, self.last,
+                    len(self.gaps))
+
+
+def stats(timemap, gap_days=30):
+    """
+    Compute the temporal coverage of 'timemap'.
+
+    Args:
+        timemap: a 'LinkTimemap'.
+        gap_days: the length, in days, beyond which an interval without
+            mementos is reported as a gap.
+
+    Returns:
+        A 'TimemapStats'.
+    """
+    return epoch_stats(memento_epochs(timemap), gap_days,
+                       timemap.original_uri)
+
+
+def coverage(timemaps, gap_days=30):
+    """
+    Compute the temporal coverage of many timemaps.
+
+    Args:
+        timemaps: an iterable of 'LinkTimemap's.
+        gap_days: see 'stats'.
+
+    Returns:
+        A list of 'TimemapStats', in the order of 'timemaps'.
+    """
+    timemaps = list(timemaps)
+    if numpy is None:
+        return [stats(timemap, gap_days) for timemap in timemaps]
+    return batch_epoch_stats([memento_epochs(timemap) for timemap in timemaps],
+                             gap_days,
+                             [timemap.original_uri for timemap in timemaps])
+
+
+def memento_epochs(timemap):
+    """
+    Return the sorted epochs of the mementos of 'timemap', one per memento,
+    as a NumPy array if NumPy is available.
+    """
+    mementos = timemap.mementos
+    if isinstance(mementos, CompactMementos):
+        mementos.datetimes()  # sorts the rows
+        return _as_array(mementos._epochs)
+    epochs = array.array(str('l'))
+    if mementos:
+        for memento_datetime in timemap._datetimes():
+            epochs.extend([to_epoch(memento_datetime)]
+                          * len(mementos[memento_datetime]))
+    return _as_array(epochs)
+
+
+def epoch_stats(epochs, gap_days=30, original_uri=None):
+    """
+    Compute a 'TimemapStats' from a sorted sequence of memento epochs.
+    """
+    result = TimemapStats(original_uri)
+    count = len(epochs)
+    if not count:
+        return result
+    result.count = count
+    result.first = from_epoch(int(epochs[0]))
+    result.last = from_epoch(int(epochs[-1]))
+    gap = gap_days * 86400
+
+    if numpy is not None and isinstance(epochs, numpy.ndarray):
+        steps = numpy.diff(epochs)
+        result.datetimes = int(numpy.count_nonzero(steps)) + 1
+        starts = numpy.flatnonzero(steps > gap)
+        result.gaps = [(from_epoch(int(epochs[i])),
+                        from_epoch(int(epochs[i + 1]))) for i in starts]
+    else:
+        distinct = 1
+        for before, after in itertools.izip(
+                epochs, itertools.islice(epochs, 1, None)):
+            if after != before:
+                distinct += 1
+                if after - before > gap:
+                    result.gaps.append((from_epoch(before), from_epoch(after)))
+        result.datetimes = distinct
+
+    months = _months(result.first, result.last)
+    bounds = [calendar.timegm((year, month, 1, 0, 0, 0))
+              for year, month in months[1:]]
+    if numpy is not None and isinstance(epochs, numpy.ndarray):
+        offsets = [0] + numpy.searchsorted(epochs, bounds).tolist() + [count]
+    else:
+        offsets = [0] + [bisect.bisect_left(epochs, bound)
+                         for bound in bounds] + [count]
+    for i, (year, month) in enumerate(months):
+        mementos = offsets[i + 1] - offsets[i]
+        result.per_month[(year, month)] = mementos
+        result.per_year[year] = result.per_year.get(year, 0) + mementos
+    return result
+
+
+def batch_epoch_stats(columns, gap_days=30, original_uris=None):
+    """
+    Compute a 'TimemapStats' for each of several sorted sequences of memento
+    epochs at once, with the same results as 'epoch_stats'.  Requires NumPy.
+
+    The epochs are concatenated, and the distinct datetimes, the gaps and
+    the per-month counts are computed over the whole array; only building
+    the resulting dicts takes a pass per timemap.
+    """
+    results = [TimemapStats(uri) for uri in original_uris
+               or [None] * len(columns)]
+    lengths = numpy.array([len(column) for column in columns],
+                          dtype=numpy.int64)
+    if not lengths.sum():
+        return results
+    epochs = numpy.concatenate([numpy.asarray(column, dtype=numpy.int64)
+                                for column in columns])
+    ends = numpy.cumsum(lengths)
+    starts = ends - lengths
+    owners = numpy.repeat(numpy.arange(len(columns)), lengths)
+
+    # Steps between the epochs of one timemap, not across two of them
+    steps = numpy.diff(epochs)
+    inner = owners[1:] == owners[:-1]
+    distinct = numpy.bincount(owners[1:][inner & (steps != 0)],
+                              minlength=len(columns)) + 1
+    for i in numpy.flatnonzero(inner & (steps > gap_days * 86400)).tolist():
+        results[owners[i]].gaps.append((from_epoch(int(epochs[i])),
+                                        from_epoch(int(epochs[i + 1]))))
+
+    # Months since January 1970, counted per (timemap, month)
+    months = epochs.astype(str('datetime64[s]')) \
+        .astype(str('datetime64[M]')).astype(numpy.int64)
+    base = int(months.min())
+    span = int(months.max()) - base + 1
+    keys, counts = numpy.unique(owners * span + (months - base),
+                                return_counts=True)
+    per_month = [dict() for _ in columns]
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        owner, month = divmod(key, span)
+        year, month = divmod(base + month, 12)
+        per_month[owner][(1970 + year, month + 1)] = count
+
+    for i, result in enumerate(results):
+        count = int(lengths[i])
+        if not count:
+            continue
+        result.count = count
+        result.datetimes = int(distinct[i])
+        result.first = from_epoch(int(epochs[starts[i]]))
+        result.last = from_epoch(int(epochs[ends[i] - 1]))
+        for year, month in _months(result.first, result.last):
+            mementos = per_month[i].get((year, month), 0)
+            result.per_month[(year, month)] = mementos
+            result.per_year[year] = result.per_year.get(year, 0) + mementos
+    return results
+
+
+def _months(first, last):
+    """
+    Return the (year, month) pairs from 'first' to 'last', inclusive.
+    """
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _as_array(column):
+    """
+    Return an epoch column (an 'array.array' or a column of a binary
+    timemap) as a NumPy array, without copying where possible, or as it is
+    without NumPy.
+    """
+    if numpy is None:
+        return column
+    if not len(column):
+        return numpy.zeros(0, dtype=numpy.int64)
+    if isinstance(column, array.array):
+        return numpy.frombuffer(column, dtype=numpy.dtype(
+            str('i{0}').format(column.itemsize)))
+    if hasattr(column, '_buf'):
+        return numpy.frombuffer(column._buf, dtype=numpy.dtype(str('<i8')),
+                                count=len(column), offset=column._offset)
+    return numpy.fromiter(column, dtype=numpy.int64, count=len(column))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class HeaderCache(object):
+    """
+        Process-wide cache of response headers, keyed on URI.
+
+        Entries are fresh for 'ttl' seconds.  Once stale they are kept,
+        so that the next request for the URI can be made conditional on
+        their ETag or Last-Modified validators; a 304 response makes the
+        entry fresh again without transferring it.  At most 'maxsize'
+        entries are kept, the least recently used being evicted first.
+
+        The counters 'hits', 'misses' and 'revalidations' record how
+        lookups were answered.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600, clock=time.time):
+        """
+            Initialize an empty cache.
+
+            Args:
+                maxsize: the maximum number of entries.
+                ttl: the number of seconds an entry stays fresh.
+                clock: a callable returning the current time in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get(self, uri):
+        """
+            Return the headers cached for 'uri' if they are fresh,
+            otherwise None.
+        """
+        with self._lock:
+            entry = self._entries.pop(uri, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[uri] = entry
+            if entry[0] < self._clock():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def validators(self, uri):
+        """
+            Return the request headers that make a request for 'uri'
+            conditional on the cached entry, if there is one.
+        """
+        with self._lock:
+            entry = self._entries.get(uri)
+        conditions = dict()
+        if entry is not None:
+            headers = entry[1]
+            if 'etag' in headers:
+                conditions['If-None-Match'] = headers['etag']
+            if 'last-modified' in headers:
+                conditions['If-Modified-Since'] = headers['last-modified']
+        return conditions
+
+    def store(self, uri, headers):
+        """
+            Cache 'headers' as the fresh response headers of 'uri'.
+        """
+        with self._lock:
+            self._entries.pop(uri, None)
+            self._entries[uri] = (self._clock() + self.ttl, headers)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def revalidate(self, uri):
+        """
+            Mark the entry of 'uri' as fresh after a 304 response and
+            return its headers, or None if it has been evicted meanwhile.
+        """
+        with self._lock:
+            entry = self._entries.pop(uri, None)
+            if entry is None:
+                return None
+            self.revalidations += 1
+            self._entries[uri] = (self._clock() + self.ttl, entry[1])
+            return entry[1]
+
+    def clear(self):
+        """
+            Remove all entries and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.revalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return ''.join(['HeaderCache<',
+               'entries: ', repr(len(self)),
+               ', hits: ', repr(self.hits),
+               ', misses: ', repr(self.misses),
+               ', revalidations: ', repr(self.revalidations),
+               '>'])
+
+
+_cache = None
+
+
+def get_cache():
+    """
+        Return the process-wide cache, or None if caching is disabled
+        (the default).
+    """
+    return _cache
+
+
+def set_cache(cache):
+    """
+        Install 'cache' as the process-wide cache used by every
+        'Resource'; None disables caching.
+    """
+    global _cache
+    _cache = cache
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import argparse
+import collections
+import fnmatch
+import multiprocessing
+import os
+import sys
+import time
+import urllib
+import urlparse
+
+from .LinkTimemap import LinkTimemap
+
+
+#==========================================================================
+# Bulk ingestion
+#==========================================================================
+
+def ingest(paths, base_uri=None, processes=None, chunksize=64,
+           max_pending=None, store=None, encoding='utf-8', errors=None,
+           progress=None):
+    """
+    Parse many timemap files on a pool of processes.
+
+    Files are handed to the workers in chunks of 'chunksize'; at most
+    'max_pending' chunks are in flight, so that neither the list of files
+    nor the parsed timemaps pile up when the consumer is slower than the
+    workers.  Each worker parses with 'LinkTimemap.from_file' into a
+    'CompactMementos', which is cheap to send back; with 'store', it
+    instead saves the timemap in the binary format (see 'LinkTimemap.save')
+    and only the name of that file is sent back.
+
+    Args:
+        paths: an iterable of (path, target) pairs as generated by
+            'find_timemaps', or of plain file names.
+        base_uri: the URI against which relative URIs are resolved, or None
+            to use the 'file:' URI of each file.
+        processes: the number of worker processes; by default one per CPU.
+        chunksize: the number of files per task.
+        max_pending: the maximum number of tasks in flight; by default
+            twice the number of processes.
+        store: an optional directory in which to save the timemaps.
+        encoding: the character encoding of the files.
+        errors: an optional dict receiving the error message for each file
+            that could not be parsed.
+        progress: an optional callable, called as progress(stats) with an
+            'IngestStats' after every chunk.
+
+    Returns:
+        A generator of (path, result) pairs in the order of 'paths', the
+        result being a LinkTimemap, or the name of the file written under
+        'store'.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    max_pending = max_pending or 2 * processes
+    stats = IngestStats()
+    pending = collections.deque()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for chunk in _chunks(paths, chunksize, store):
+            pending.append(pool.apply_async(
+                _ingest_chunk, (chunk, base_uri, encoding, store)))
+            while len(pending) >= max_pending:
+                for result in _collect(pending.popleft(), stats, errors,
+                                       progress):
+                    yield result
+        while pending:
+            for result in _collect(pending.popleft(), stats, errors,
+                                   progress):
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def find_timemaps(root, pattern='*'):
+    """
+    Generate the (path, target) pairs of the files below 'root' whose names
+    match 'pattern', the target being the path relative to 'root'.
+    """
+    if os.path.isfile(root):
+        yield root, os.path.basename(root)
+        return
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(fnmatch.filter(filenames, pattern)):
+            path = os.path.join(directory, filename)
+            yield path, os.path.relpath(path, root)
+
+
+class IngestStats(object):
+    """
+    Running totals of an 'ingest'.
+    """
+
+    def __init__(self, clock=time.time):
+        self.files    = 0
+        self.failures = 0
+        self.mementos = 0
+        self.bytes    = 0
+        self._clock   = clock
+        self._started = clock()
+
+    @property
+    def elapsed(self):
+        return self._clock() - self._started
+
+    @property
+    def files_per_second(self):
+        return self.files / max(self.elapsed, 1e-9)
+
+    @property
+    def mementos_per_second(self):
+        return self.mementos / max(self.elapsed, 1e-9)
+
+    @property
+    def megabytes_per_second(self):
+        return self.bytes / 1e6 / max(self.elapsed, 1e-9)
+
+    def __repr__(self):
+        return ('{0} files ({1} failed), {2} mementos in {3:.1f}s: '
+                '{4:.1f} files/s, {5:.0f} mementos/s, {6:.2f} MB/s'.format(
+                    self.files, self.failures, self.mementos, self.elapsed,
+                    self.files_per_second, self.mementos_per_second,
+                    self.megabytes_per_second))
+
+
+def _chunks(paths, chunksize, store):
+    chunk = []
+    for entry in paths:
+        if isinstance(entry, basestring):
+            entry = (entry, os.path.basename(entry))
+        path, target = entry
+        if store is not None:
+            target = os.path.join(store, target + '.tm')
+        chunk.append((path, target))
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _collect(async_result, stats, errors, progress):
+    """
+    Wait for a chunk, account for it and generate its results.
+    """
+    results = async_result.get()
+    for path, result, error, mementos, size in results:
+        stats.files += 1
+        stats.bytes += size
+        if error is not None:
+            stats.failures += 1
+            if errors is not None:
+                errors[path] = error
+            continue
+        stats.mementos += mementos
+        yield path, result
+    if progress is not None:
+        progress(stats)
+
+
+def _ingest_chunk(chunk, base_uri, encoding, store):
+    """
+    Parse a chunk of files in a worker process.
+
+    Returns:
+        A list of (path, result, error, memento count, size) tuples.
+    """
+    results = []
+    for path, target in chunk:
+        try:
+            size = os.path.getsize(path)
+            uri = base_uri or urlparse.urljoin(
+                'file:', urllib.pathname2url(os.path.abspath(path)))
+            timemap = LinkTimemap.from_file(path, uri, encoding, compact=True)
+            count = len(timemap.mementos._epochs)
+            if store is not None:
+                _makedirs(os.path.dirname(target))
+                timemap.save(target)
+                timemap = target
+            results.append((path, timemap, None, count, size))
+        except Exception as e:
+            results.append((path, None, '{0}: {1}'.format(type(e).__name__, e),
+                            0, 0))
+    return results
+
+
+def _makedirs(directory):
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+
+#==========================================================================
+# Command line
+#==========================================================================
+
+def main(argv=None):
+    """
+    Entry point of 'pymemento-ingest'.
+    """
+    parser = argparse.ArgumentParser(
+        prog='pymemento-ingest',
+        description='Parse directories of link-format timemaps in parallel.')
+    parser.add_argument('roots', metavar='DIR', nargs='+',
+                        help='a directory (searched recursively) or file')
+    parser.add_argument('--pattern', default='*',
+                        help='only parse files matching this pattern')
+    parser.add_argument('--store', metavar='DIR',
+                        help='save the parsed timemaps in binary format here')
+    parser.add_argument('--base-uri',
+                        help='resolve relative URIs against this URI')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=64,
+                        help='files per task (default: %(default)s)')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='tasks in flight (default: twice --processes)')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not report progress')
+    args = parser.parse_args(argv)
+
+    paths = (entry for root in args.roots
+             for entry in find_timemaps(root, args.pattern))
+    errors = dict()
+    stats = []
+    reported = [0]
+
+    def progress(current):
+        stats[:] = [current]
+        if not args.quiet and time.time() - reported[0] >= 1:
+            reported[0] = time.time()
+            print(repr(current), file=sys.stderr)
+
+    for _ in ingest(paths, args.base_uri, args.processes, args.chunksize,
+                    args.max_pending, args.store, args.encoding, errors,
+                    progress):
+        pass
+
+    for path in sorted(errors):
+        print('{0}: {1}'.format(path, errors[path]), file=sys.stderr)
+    print(repr(stats[0]) if stats else 'No timemaps found')
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+
+from datetime import datetime
+import json
+
+from .LinkParser import LinkParser
+
+
+#==========================================================================
+# JSON timemap parser
+#==========================================================================
+
+class JsonParser(object):
+    """
+    Parser for JSON timemaps, as served by the Memento aggregator and many
+    archives:
+
+        {"original_uri": "http://a.example.org/",
+         "timegate_uri": "http://arxiv.example.net/timegate/...",
+         "timemap_uri": {"link_format": "...", "json_format": "..."},
+         "mementos": {"first": {"datetime": "...", "uri": "..."},
+                      "last": {"datetime": "...", "uri": "..."},
+                      "list": [{"datetime": "2000-06-20T18:02:59Z",
+                                "uri": "..."}, ...]},
+         "pages": {"prev": {"uri": "...", "from": "...", "until": "..."}}}
+
+    The document is turned into the same link tuples as 'LinkParser'
+    produces, so that 'LinkTimemap' builds identical objects from either
+    format; in particular, URIs are byte strings if the document is.
+    Mementos get the 'first'/'last' relations from the 'first' and 'last'
+    members; when streaming, only if those precede the list.
+    """
+
+    JSON_TYPE = 'application/json'
+    LINK_TYPE = 'application/link-format'
+
+
+    def parse(self, text):
+        """
+        Generate the links of a complete JSON timemap.
+
+        Args:
+            text: a string containing the JSON document.
+
+        Returns:
+            A generator of link tuples.
+        """
+        self._bytes = isinstance(text, bytes)
+        document = json.loads(text)
+        mementos = document.get('mementos') or {}
+        first = JsonParser._uri_of(mementos.get('first'))
+        last = JsonParser._uri_of(mementos.get('last'))
+        for key, value in document.iteritems():
+            for link in self._header_links(key, value):
+                yield link
+        for item in mementos.get('list') or ():
+            yield self._memento_link(item, first, last)
+
+
+    def parse_blocks(self, blocks):
+        """
+        Generate the links of a JSON timemap read in blocks.
+
+        Only one memento of the 'list' array is decoded at a time, so memory
+        use does not grow with the size of the timemap.
+
+        Args:
+            blocks: an iterable of strings, e.g. successive 'read' results.
+
+        Returns:
+            A generator of link tuples.
+        """
+        reader = _JsonReader(blocks)
+        reader.expect('{')
+        self._bytes = isinstance(reader.buffer, bytes)
+        first = last = None
+        while reader.peek() != '}':
+            key = reader.value()
+            reader.expect(':')
+            if key != 'mementos':
+                for link in self._header_links(key, reader.value()):
+                    yield link
+            else:
+                reader.expect('{')
+                while reader.peek() != '}':
+                    member = reader.value()
+                    reader.expect(':')
+                    if member == 'list':
+                        reader.expect('[')
+                        while reader.peek() != ']':
+                            yield self._memento_link(reader.value(),
+                                                     first, last)
+                            reader.separator(']')
+                        reader.expect(']')
+                    elif member == 'first':
+                        first = JsonParser._uri_of(reader.value())
+                    elif member == 'last':
+                        last = JsonParser._uri_of(reader.value())
+                    else:
+                        reader.value()
+                    reader.separator('}')
+                reader.expect('}')
+            reader.separator('}')
+
+
+    @staticmethod
+    def parse_date(raw_dt):
+        """
+        Parse a JSON timemap datetime; ISO 8601 UTC datetimes
+        ('2000-06-20T18:02:59Z') are decoded directly.
+        """
+        if len(raw_dt) == 20 and raw_dt[4] == '-' and raw_dt[7] == '-' \
+               and raw_dt[10] == 'T' and raw_dt[13] == ':' \
+               and raw_dt[16] == ':' and raw_dt[19] == 'Z':
+            try:
+                return datetime(int(raw_dt[0:4]), int(raw_dt[5:7]),
+                                int(raw_dt[8:10]), int(raw_dt[11:13]),
+                                int(raw_dt[14:16]), int(raw_dt[17:19]),
+                                tzinfo=LinkParser.UTC)
+            except ValueError:
+                pass
+        return LinkParser.parse_http_date(raw_dt)
+
+
+    def _memento_link(self, item, first, last):
+        uri = item['uri']
+        rels = ['memento']
+        if uri == last:
+            rels.insert(0, 'last')
+        if uri == first:
+            rels.insert(0, 'first')
+        return (rels, self._uri(uri), JsonParser.parse_date(item['datetime']),
+                None, self._uri(item.get('license')), None, None)
+
+
+    def _header_links(self, key, value):
+        if key == 'original_uri':
+            yield (['original'], self._uri(value), None, None, None, None, None)
+        elif key == 'timegate_uri':
+            for uri_g in value if isinstance(value, list) else [value]:
+                yield (['timegate'], self._uri(uri_g), None, None, None, None,
+                       None)
+        elif key == 'timemap_uri':
+            if 'json_format' in value:
+                yield (['self'], self._uri(value['json_format']), None,
+                       JsonParser.JSON_TYPE, None, None, None)
+            if 'link_format' in value:
+                yield (['timemap'], self._uri(value['link_format']), None,
+                       JsonParser.LINK_TYPE, None, None, None)
+        elif key == 'pages':
+            for name in sorted(value):
+                page = value[name]
+                yield (['timemap'], self._uri(page['uri']), None,
+                       JsonParser.JSON_TYPE,
+                       None, JsonParser._optional_date(page.get('from')),
+                       JsonParser._optional_date(page.get('until')))
+
+
+    def _uri(self, value):
+        """
+        Return a URI as the same kind of string as the document.
+        """
+        if self._bytes and value is not None:
+            return value.encode('utf-8')
+        return value
+
+
+    @staticmethod
+    def _optional_date(raw_dt):
+        return None if raw_dt is None else JsonParser.parse_date(raw_dt)
+
+
+    @staticmethod
+    def _uri_of(item):
+        return None if item is None else item.get('uri')
+
+
+class _JsonReader(object):
+    """
+    Pull reader decoding one JSON value at a time from a stream of blocks.
+    """
+
+    WHITESPACE = frozenset(str(' \t\r\n'))
+
+    def __init__(self, blocks):
+        self._blocks  = iter(blocks)
+        self._buf     = str('')
+        self._pos     = 0
+        self._decoder = json.JSONDecoder()
+
+    @property
+    def buffer(self):
+        return self._buf
+
+    def peek(self):
+        """
+        Return the next non-whitespace character, or None at the end.
+        """
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _JsonReader.WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected {0!r} in JSON timemap at {1!r}'
+                             .format(char, self._buf[self._pos:][:20]))
+        self._pos += 1
+
+    def separator(self, closing):
+        """
+        Consume a ',' between members, or leave the closing bracket.
+        """
+        if self.peek() == ',':
+            self._pos += 1
+        elif self.peek() != closing:
+            self.expect(closing)
+
+    def value(self):
+        """
+        Decode the next complete value, reading more blocks as needed.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            # A number may continue in the next block
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _fill(self):
+        for block in self._blocks:
+            if block:
+                self._buf = self._buf[self._pos:] + block
+                self._pos = 0
+                return True
+        return False
+
+
+#==========================================================================
+# JSON timemap serializer
+#==========================================================================
+
+class JsonWriter(object):
+    """
+    Streaming serializer producing JSON timemaps in the format read by
+    'JsonParser', written to 'fileobj' in chunks of about 'chunk_size' bytes.
+    """
+
+    def __init__(self, fileobj, chunk_size=64 * 1024):
+        self._write      = getattr(fileobj, 'sendall', None) or fileobj.write
+        self._chunk      = []
+        self._size       = 0
+        self._chunk_size = chunk_size
+
+
+    def write_timemap(self, timemap, mementos=None):
+        """
+        Write a complete timemap.
+
+        Args:
+            timemap: the 'LinkTimemap' to write.
+            mementos: an iterable of 'MementoLink's to write instead of
+                those of 'timemap'.
+        """
+        from .LinkWriter import LinkWriter
+        self._emit('{"original_uri": ')
+        self._emit(_dumps(timemap.original_uri))
+        timegate_uris = [_text(uri) for uri in timemap.timegate_uris]
+        if timegate_uris:
+            self._emit(', "timegate_uri": ')
+            self._emit(json.dumps(timegate_uris if len(timegate_uris) > 1
+                                  else timegate_uris[0]))
+        formats, pages = JsonWriter._timemap_links(timemap)
+        if formats:
+            self._emit(', "timemap_uri": ')
+            self._emit(json.dumps(formats, sort_keys=True))
+        if pages:
+            self._emit(', "pages": ')
+            self._emit(json.dumps(pages, sort_keys=True))
+        self._emit(', "mementos": {')
+        if mementos is None:
+            if timemap.first is not None:
+                self._emit('"first": ')
+                self._emit(self._memento(min(timemap[timemap.first],
+                                             key=_uri_key)))
+                self._emit(', "last": ')
+                self._emit(self._memento(max(timemap[timemap.last],
+                                             key=_uri_key)))
+                self._emit(', ')
+            mementos = LinkWriter.sorted_mementos(timemap)
+        self._emit('"list": [')
+        separator = ''
+        for memento in mementos:
+            self._emit(separator)
+            self._emit(self._memento(memento))
+            separator = ', '
+        self._emit(']}}\n')
+        self.flush()
+
+
+    def flush(self):
+        if self._chunk:
+            self._write(b''.join(self._chunk))
+        self._chunk = []
+        self._size  = 0
+
+
+    @staticmethod
+    def format_date(dt):
+        """
+        Format 'dt' as an ISO 8601 UTC datetime, e.g. '2000-06-20T18:02:59Z'.
+        """
+        if dt.tzinfo is not None and dt.utcoffset():
+            dt = dt.astimezone(LinkParser.UTC)
+        return '%04d-%02d-%02dT%02d:%02d:%02dZ' % (
+            dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+
+
+    @staticmethod
+    def _timemap_links(timemap):
+        """
+        Split the timemap links of 'timemap' into the 'timemap_uri' and
+        'pages' members.
+
+        The 'self' link goes into 'timemap_uri' under its format, along with
+        an undated link in the other format, i.e. the other representation
+        of the same timemap.  Every other link is a page, keeping its
+        'from' and 'until'; pages are named in the order of the links, as
+        'JsonParser' reads them back in the order of their names.
+        """
+        formats = dict()
+        pages = dict()
+        self_link = timemap.self_link
+        if self_link is not None:
+            formats[JsonWriter._format(self_link)] = _text(self_link.uri_t)
+        links = [link for link in timemap.timemaps if link is not self_link]
+        width = len(str(len(links)))
+        for link in links:
+            name = JsonWriter._format(link)
+            if self_link is not None and name not in formats \
+                   and link.from_dt is None and link.until_dt is None:
+                formats[name] = _text(link.uri_t)
+                continue
+            page = {'uri': _text(link.uri_t)}
+            if link.from_dt is not None:
+                page['from'] = JsonWriter.format_date(link.from_dt)
+            if link.until_dt is not None:
+                page['until'] = JsonWriter.format_date(link.until_dt)
+            pages['page{0:0{1}d}'.format(len(pages) + 1, width)] = page
+        return formats, pages
+
+
+    @staticmethod
+    def _format(link):
+        return 'json_format' if link.mime_type == JsonParser.JSON_TYPE \
+            else 'link_format'
+
+
+    def _memento(self, memento):
+        item = '{"datetime": "%s", "uri": %s' % (
+            JsonWriter.format_date(memento.memento_datetime),
+            _dumps(memento.uri_m))
+        if memento.license_uri is not None:
+            item += ', "license": ' + _dumps(memento.license_uri)
+        return item + '}'
+
+
+    def _emit(self, text):
+        data = text.encode('utf-8')
+        self._chunk.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _dumps(value):
+    return json.dumps(_text(value))
+
+
+def _uri_key(memento):
+    return _text(memento.uri_m)
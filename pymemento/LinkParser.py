@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+
+import codecs
+import collections
+from datetime import datetime
+import dateutil.parser
+import dateutil.tz
+import re
+
+
+#==========================================================================
+# Link-format parser engine
+#==========================================================================
+
+class LinkParser(object):
+    """
+    Single-pass parser for RFC 6690 link-format, as used by RFC 7089
+    timemaps.
+
+    The parser scans a buffer once with a compiled token expression and
+    dispatches on the matched group rather than on token prefixes.  Dates in
+    the RFC 1123 form mandated by RFC 7089 (e.g. 'Tue, 20 Jun 2000 18:02:59
+    GMT') are decoded by a fixed-format fast path; anything else falls back
+    to 'dateutil.parser.parse'.
+
+    Each link is produced as a tuple:
+
+        (rels, uri, datetime, mime_type, license, from_dt, until_dt)
+
+    where 'uri' is exactly as it appears in the representation (unresolved)
+    and the datetimes are not yet currated (see LinkTimemap._currate_datetime).
+
+    'tokens' counts the tokens scanned so far.
+
+    A parser made with 'strict=False' reads HTTP 'Link' headers (RFC 8288)
+    rather than timemaps: parameters other than those of RFC 7089 are
+    skipped, values may be unquoted, and unparseable dates become None.
+
+    Input is either pulled ('parse_blocks') or pushed as it arrives:
+
+        parser = LinkParser('utf-8')
+        for chunk in chunks:
+            for link in parser.feed(chunk):
+                ...
+        for link in parser.close():
+            ...
+    """
+
+    # Groups: 1 = URI, 2/3 = parameter name/value, 4 = separator
+    TOKEN_RE = re.compile('<([^>]+)>\\s*'
+                          '|([a-zA-Z]+)="([^"]*)"\\s*'
+                          '|([;,])\\s*')
+
+    # The same groups, with any parameter name and unquoted values
+    HEADER_TOKEN_RE = re.compile('<([^>]+)>\\s*'
+                                 '|([a-zA-Z][a-zA-Z0-9*_-]*)='
+                                 '"?((?<=")[^"]*|[^\\s;,"]*)"?\\s*'
+                                 '|([;,])\\s*')
+
+    # A token cut short by the end of a block: '<uri', 'name', 'name=' or
+    # 'name="value'.
+    PARTIAL_TOKEN_RE = re.compile('(?:<[^>]*|[a-zA-Z]+(?:="[^"]*|=)?)\\Z')
+
+    NAME_CHARS = frozenset(str('abcdefghijklmnopqrstuvwxyz'
+                               'ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+
+    MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+              'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+    UTC = dateutil.tz.tzutc()
+
+    # Parsed date strings kept by a parser before its memo is cleared
+    DATE_CACHE_SIZE = 4096
+
+
+    def __init__(self, encoding=None, strict=True):
+        """
+        Initialize a new 'LinkParser'.
+
+        Args:
+            encoding: the character encoding of the byte strings given to
+                'feed', which are then decoded incrementally; None to scan
+                them as they are.
+            strict: False to parse 'Link' headers, skipping unknown
+                parameters instead of raising.
+        """
+        self._decoder = None
+        if encoding is not None:
+            self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._pending = collections.deque()
+        self._closed  = False
+        self._links   = None
+        self.tokens   = 0
+        self._dates   = dict()
+        self._strict  = strict
+
+
+    def feed(self, data):
+        """
+        Push the next chunk of a representation.
+
+        Chunks may be cut anywhere, including in the middle of a token or of
+        a multi-byte character; whatever cannot be parsed yet is kept until
+        the next chunk.
+
+        Args:
+            data: a string.
+
+        Returns:
+            A list of the link tuples completed by 'data'.
+        """
+        if self._closed:
+            raise ValueError('feed() after close()')
+        if self._decoder is not None:
+            data = self._decoder.decode(data)
+        self._pending.append(data)
+        return self._drain()
+
+
+    def close(self):
+        """
+        Signal the end of the representation pushed with 'feed'.
+
+        Returns:
+            A list of the remaining link tuples.
+        """
+        if self._decoder is not None:
+            self._pending.append(self._decoder.decode(b'', True))
+        self._closed = True
+        return self._drain()
+
+
+    def _drain(self):
+        """
+        Run the scanner over the pushed chunks until it needs more input.
+        """
+        if self._links is None:
+            self._links = self._scan(self._segments(self._pushed()))
+        links = []
+        for link in self._links:
+            if link is None:
+                break
+            links.append(link)
+        return links
+
+
+    def _pushed(self):
+        """
+        Generate the chunks given to 'feed', and None whenever they have
+        all been consumed before 'close'.
+        """
+        while True:
+            while self._pending:
+                yield self._pending.popleft()
+            if self._closed:
+                return
+            yield None
+
+
+    def parse(self, text):
+        """
+        Generate the links contained in 'text'.
+
+        Args:
+            text: a string containing link-format data.
+
+        Returns:
+            A generator of link tuples.
+        """
+        return self._scan([text])
+
+
+    def parse_blocks(self, blocks):
+        """
+        Generate the links contained in an iterable of text blocks.
+
+        Blocks may be cut anywhere, including in the middle of a token; only
+        the unfinished tail of a block is held back until the next one
+        arrives, so memory use is bounded by the block size.
+
+        Args:
+            blocks: an iterable of strings, e.g. successive 'read' results.
+
+        Returns:
+            A generator of link tuples.
+        """
+        return self._scan(self._segments(blocks))
+
+
+    def _segments(self, blocks):
+        """
+        Re-cut 'blocks' so that every segment ends on a token boundary.
+        """
+        partial_re = LinkParser.PARTIAL_TOKEN_RE
+        tail = ''
+        for block in blocks:
+            if block is None:
+                yield None
+                continue
+            if not block:
+                continue
+            buf = tail + block if tail else block
+            partial = partial_re.search(buf, LinkParser._partial_floor(buf))
+            if partial is None:
+                tail = ''
+                yield buf
+            else:
+                tail = buf[partial.start():]
+                yield buf[:partial.start()]
+        if tail:
+            yield tail
+
+
+    @staticmethod
+    def _partial_floor(buf):
+        """
+        Return the leftmost position at which an unfinished token could start
+        in 'buf', so that 'PARTIAL_TOKEN_RE' need not try the whole block.
+        """
+        # Native string literals, so that byte strings holding non-ASCII
+        # characters are never coerced to unicode
+        def name_start(end):
+            if end > 0 and buf[end - 1] == str('='):
+                end -= 1
+            while end > 0 and buf[end - 1] in LinkParser.NAME_CHARS:
+                end -= 1
+            return end
+        floor = name_start(len(buf))
+        quote = buf.rfind(str('"'))
+        if quote >= 0:
+            floor = min(floor, name_start(quote))
+        bracket = buf.find(str('<'), buf.rfind(str('>')) + 1)
+        if bracket >= 0:
+            floor = min(floor, bracket)
+        return floor
+
+
+    def _scan(self, segments):
+        """
+        Generate the links contained in an iterable of text segments.  Each
+        segment must end on a token boundary; the state of the link being
+        parsed is carried across segments.  A None segment, meaning that no
+        more input is available yet, is passed on as a None link.
+        """
+        strict     = self._strict
+        parse_date = self._parse_date if strict else self._lenient_date
+        token_re   = LinkParser.TOKEN_RE if strict \
+                     else LinkParser.HEADER_TOKEN_RE
+        uri        = None
+        rels       = []
+        memento_dt = None
+        from_dt    = None
+        until_dt   = None
+        mime_type  = None
+        license    = None
+        for segment in segments:
+            if segment is None:
+                yield None
+                continue
+            tokens = 0
+            for match in token_re.finditer(segment):
+                tokens += 1
+                kind = match.lastindex
+                if kind == 1:
+                    uri = match.group(1)
+                elif kind == 3:
+                    name, value = match.group(2, 3)
+                    if name == 'rel':
+                        rels = value.split()
+                    elif name == 'datetime':
+                        memento_dt = parse_date(value)
+                    elif name == 'from':
+                        from_dt = parse_date(value)
+                    elif name == 'until':
+                        until_dt = parse_date(value)
+                    elif name == 'type':
+                        mime_type = value
+                    elif name == 'license':
+                        license = value
+                    elif strict:
+                        raise Exception('Unexpected timemap token',
+                                        match.group(0).rstrip())
+                elif match.group(4) == ',':
+                    if uri is not None:
+                        yield (rels, uri, memento_dt, mime_type, license,
+                               from_dt, until_dt)
+                    uri        = None
+                    rels       = []
+                    memento_dt = None
+                    from_dt    = None
+                    until_dt   = None
+                    mime_type  = None
+                    license    = None
+            self.tokens += tokens
+        if uri is not None:
+            yield (rels, uri, memento_dt, mime_type, license,
+                   from_dt, until_dt)
+
+
+    def _parse_date(self, raw_dt):
+        """
+        'parse_http_date', memoized: the mementos of a timemap often share
+        datetimes, and its pages overlap.
+        """
+        dates = self._dates
+        dt = dates.get(raw_dt)
+        if dt is None:
+            dt = LinkParser.parse_http_date(raw_dt)
+            if len(dates) >= LinkParser.DATE_CACHE_SIZE:
+                dates.clear()
+            dates[raw_dt] = dt
+        return dt
+
+
+    def _lenient_date(self, raw_dt):
+        try:
+            return self._parse_date(raw_dt)
+        except (ValueError, OverflowError, TypeError):
+            return None
+
+
+    @staticmethod
+    def parse_http_date(raw_dt):
+        """
+        Parse a datetime string as found in a timemap.
+
+        RFC 1123 dates ('Tue, 20 Jun 2000 18:02:59 GMT') are decoded directly;
+        any other form is handed to 'dateutil.parser.parse'.
+
+        Args:
+            raw_dt: a string containing a date and time.
+
+        Returns:
+            A datetime.
+        """
+        if len(raw_dt) == 29 and raw_dt[25:] == ' GMT' \
+               and raw_dt[3:5] == ', ' and raw_dt[7] == ' ' \
+               and raw_dt[11] == ' ' and raw_dt[16] == ' ' \
+               and raw_dt[19] == ':' and raw_dt[22] == ':':
+            month = LinkParser.MONTHS.get(raw_dt[8:11])
+            if month is not None:
+                try:
+                    return datetime(int(raw_dt[12:16]), month,
+                                    int(raw_dt[5:7]), int(raw_dt[17:19]),
+                                    int(raw_dt[20:22]), int(raw_dt[23:25]),
+                                    tzinfo=LinkParser.UTC)
+                except ValueError:
+                    pass
+        return dateutil.parser.parse(raw_dt)
+
+
+#end
@@ -4,14 +4,202 @@ from __future__ import unicode_literals
 
 
 import codecs
-from datetime import datetime
+import collections
+from datetime import datetime, timedelta
 import dateutil.parser
 import dateutil.tz
+import array
+import bisect
+import calendar
+import functools
+import heapq
+import itertools
 import re
 import io
-import urllib2
+from multiprocessing.pool import ThreadPool
 import urlparse
 
+from .JsonTimemap import JsonParser, JsonWriter
+from .LinkParser import LinkParser
+from .LinkWriter import LinkWriter
+from .Metrics import get_metrics
+from .Session import get_session
+
+
+#==========================================================================
+# Epoch conversion
+#==========================================================================
+
+EPOCH = datetime(1970, 1, 1, tzinfo=LinkParser.UTC)
+
+
+def to_epoch(dt):
+    """
+    Return the whole number of seconds between the epoch and 'dt'.  A naive
+    'dt' is taken to be in UTC.
+    """
+    if dt.tzinfo is None:
+        return calendar.timegm(dt.timetuple())
+    return calendar.timegm(dt.utctimetuple())
+
+
+def from_epoch(epoch):
+    """
+    Return the UTC datetime 'epoch' seconds after the epoch.
+    """
+    return EPOCH + timedelta(seconds=epoch)
+
+
+#==========================================================================
+# URI resolution and datetime curation
+#==========================================================================
+
+class BaseURI(object):
+    """
+    A base URI parsed once, against which the URIs of a timemap are
+    resolved with the result 'urlparse.urljoin' would give.
+
+    Absolute URIs are returned as they are and root-relative ones
+    ('/web/...', as most archives list their mementos) are appended to the
+    base's scheme and authority; only other relative forms, and URIs with
+    an empty query or fragment (which 'urljoin' drops), are handed to
+    'urljoin'.
+    """
+
+    # A lowercase 'scheme://' not followed by another '/'
+    ABSOLUTE_RE = re.compile('[a-z][a-z0-9+.-]*://(?!/)')
+
+    def __init__(self, base_uri):
+        self.base_uri = base_uri
+        parts = urlparse.urlsplit(base_uri or '')
+        self._root = None
+        if parts.scheme in urlparse.uses_netloc and parts.netloc:
+            self._root = parts.scheme + str('://') + parts.netloc
+
+    def resolve(self, uri):
+        # 'urljoin' drops an empty query or fragment
+        if uri[-1:] in (str('?'), str('#')) or str('?#') in uri:
+            return urlparse.urljoin(self.base_uri, uri)
+        if uri[:1] == '/':
+            if uri[1:2] != '/' and self._root is not None:
+                return self._root + uri
+        elif BaseURI.ABSOLUTE_RE.match(uri) is not None:
+            return uri
+        return urlparse.urljoin(self.base_uri, uri)
+
+
+class DatetimeCurator(object):
+    """
+    'LinkTimemap._currate_datetime' with bounded memos of its conversions
+    to UTC and of the timestamps it reads from URIs, which repeat heavily
+    in archive timemaps.  Each memo is cleared once it holds 'maxsize'
+    entries.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize     = maxsize
+        self._utc        = dict()
+        self._timestamps = dict()
+
+    def __call__(self, dt, uri=None):
+        if dt is None:
+            return None
+        if dt.tzinfo is not LinkParser.UTC and dt.tzname() != 'UTC':
+            utc = self._utc.get(dt)
+            if utc is None:
+                utc = dt.astimezone(LinkParser.UTC)
+                self._remember(self._utc, dt, utc)
+            dt = utc
+        if uri is None:
+            return dt
+        # See if the time looks fishy (time == 00:00:00)
+        if dt.hour != 0 or dt.minute != 0 or dt.second != 0:
+            return dt
+        # See if the uri has a YYYYMMDDHHMMSS dt in it, if so fix the time
+        match = LinkTimemap.URI_DATETIME_RE.search(uri)
+        if match is None:
+            return dt
+        timestamp = match.group(1)
+        uri_datetime = self._timestamps.get(timestamp)
+        if uri_datetime is None:
+            uri_datetime = datetime(int(timestamp[0:4]), int(timestamp[4:6]),
+                                    int(timestamp[6:8]), int(timestamp[8:10]),
+                                    int(timestamp[10:12]),
+                                    int(timestamp[12:14]))
+            self._remember(self._timestamps, timestamp, uri_datetime)
+        # If the date is the same, replace the time with the URI time
+        if uri_datetime.year == dt.year \
+               and uri_datetime.month == dt.month \
+               and uri_datetime.day == dt.day:
+            return dt.replace(hour = uri_datetime.hour,
+                              minute = uri_datetime.minute,
+                              second = uri_datetime.second)
+        return dt
+
+    def _remember(self, memo, key, value):
+        if len(memo) >= self.maxsize:
+            memo.clear()
+        memo[key] = value
+
+
+_curate = DatetimeCurator()
+
+
+class MementoFilter(object):
+    """
+    Selection of the mementos kept while parsing a timemap: those dated
+    'since'..'until' (inclusive; naive datetimes are taken to be UTC) and
+    accepted by 'predicate', called as predicate(uri_m, memento_datetime).
+
+    Memento links are first dropped on their datetime as parsed, before it
+    is currated: currating only moves a midnight time later within the same
+    day, so a link dated more than a day before 'since' or after 'until'
+    can never be selected.  The remaining links are then checked exactly,
+    with the predicate last, before their URI-M is resolved or a
+    'MementoLink' is made.
+    """
+
+    SLACK = timedelta(days=1)
+
+    def __init__(self, since=None, until=None, predicate=None):
+        self.since     = None if since is None else LinkTimemap._as_utc(since)
+        self.until     = None if until is None else LinkTimemap._as_utc(until)
+        self.predicate = predicate
+        self._lo       = None if since is None else self.since - self.SLACK
+
+    def prefilter(self, links):
+        """
+        Drop the parsed memento links that are certainly out of range.
+        """
+        lo, hi = self._lo, self.until
+        if lo is None and hi is None:
+            for link in links:
+                yield link
+            return
+        for link in links:
+            memento_dt = link[2]
+            if memento_dt is not None and memento_dt.tzinfo is not None \
+                   and ((lo is not None and memento_dt < lo)
+                        or (hi is not None and memento_dt > hi)) \
+                   and 'memento' in link[0]:
+                continue
+            yield link
+
+    def in_range(self, memento_datetime):
+        if memento_datetime is None:
+            return self.since is None and self.until is None
+        return (self.since is None or memento_datetime >= self.since) and \
+               (self.until is None or memento_datetime <= self.until)
+
+    @staticmethod
+    def create(since=None, until=None, predicate=None):
+        """
+        Return a 'MementoFilter', or None if it would select everything.
+        """
+        if since is None and until is None and predicate is None:
+            return None
+        return MementoFilter(since, until, predicate)
+
 
 #==========================================================================
 # Container classes for complex links
@@ -32,6 +220,8 @@ class MementoLink(object):
         license_uri: an optional unicode string containing the URI of a license.
                      If a license is not associated with this memento, use None.
     """
+    __slots__ = ('memento_datetime', 'uri_m', 'rels', 'license_uri')
+
     def __init__(self, memento_datetime, uri_m, rels=None, license_uri=None):
         """
         Initialize a new MementoLink from a specified URI-M, list of link
@@ -43,6 +233,36 @@ class MementoLink(object):
         self.rels             = rels
         self.license_uri      = license_uri
 
+    def _key(self):
+        return (self.memento_datetime, self.uri_m,
+                tuple(self.rels or ()), self.license_uri)
+
+    def __eq__(self, other):
+        if not isinstance(other, MementoLink):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        if not isinstance(other, MementoLink):
+            return NotImplemented
+        return self._key() != other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def to_link(self):
+        """
+        Serialize this 'MementoLink' as a UTF-8 encoded link-format link.
+        """
+        return LinkWriter().memento_link(self)
+
     def __repr__(self):
         """
         Dump a 'MementoLink' in human-readable form.
@@ -64,13 +284,61 @@ class TimemapLink(object):
         from_datetime: a datetime with timezone set to GMT (RFC 7089 'from').
         until_datetime: a datetime with timezone set to GMT (RFC 7089 'until').
         mime_type: a unicode string containing the media type (RFC 7089 'type').
+        rel: 'self' for the link to the timemap it was read from, otherwise
+             'timemap'.
     """
-    def __init__(self, uri_t, from_dt, until_dt, mime_type):
+    __slots__ = ('uri_t', 'from_dt', 'until_dt', 'mime_type', 'rel')
+
+    def __init__(self, uri_t, from_dt, until_dt, mime_type, rel='timemap'):
         super(TimemapLink, self).__init__()
         self.uri_t     = uri_t
         self.from_dt   = from_dt
         self.until_dt  = until_dt
         self.mime_type = mime_type
+        self.rel       = rel
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def to_link(self, rel=None):
+        """
+        Serialize this 'TimemapLink' as a UTF-8 encoded link-format link
+        with the link relation 'rel', by default its own.
+        """
+        return LinkWriter().timemap_link(self, rel)
+
+    def with_rel(self, rel):
+        """
+        Return a copy of this 'TimemapLink' with the link relation 'rel'.
+        """
+        return TimemapLink(self.uri_t, self.from_dt, self.until_dt,
+                           self.mime_type, rel)
+
+    def to_row(self):
+        """
+        Return this 'TimemapLink' as a JSON-serializable list, with its
+        datetimes as epochs, for storage.
+        """
+        return [_text(self.uri_t),
+                None if self.from_dt is None else to_epoch(self.from_dt),
+                None if self.until_dt is None else to_epoch(self.until_dt),
+                _text(self.mime_type), self.rel]
+
+    @staticmethod
+    def from_row(row):
+        """
+        Build a 'TimemapLink' from a list made by 'to_row'; rows stored
+        before links had a relation are read as 'timemap' links.
+        """
+        uri_t, from_dt, until_dt, mime_type = row[:4]
+        return TimemapLink(uri_t,
+                           None if from_dt is None else from_epoch(from_dt),
+                           None if until_dt is None else from_epoch(until_dt),
+                           mime_type, *row[4:])
 
     def __repr__(self):
         """
@@ -81,8 +349,339 @@ class TimemapLink(object):
                ', from_dt: ', repr(self.from_dt),
                ', until_dt: ', repr(self.until_dt),
                ', mime_type: ', repr(self.mime_type),
+               ', rel: ', repr(self.rel),
+               '>'])
+
+
+class TimemapDiff(object):
+    """
+    The changes between two versions of a timemap, as computed by
+    'LinkTimemap.diff'.
+
+    Attributes:
+        added: the 'MementoLink's only in the new timemap, by datetime.
+        removed: the 'MementoLink's only in the old timemap, by datetime.
+        original: an (old, new) pair of URI-Rs if the original changed,
+            otherwise None.
+        added_timegates, removed_timegates: lists of URI-Gs.
+        added_timemaps, removed_timemaps: lists of 'TimemapLink's.
+        changed_timemaps: (old, new) pairs of 'TimemapLink's with the same
+            URI-T but different bounds or type.
+    """
+
+    def __init__(self):
+        self.added             = []
+        self.removed           = []
+        self.original          = None
+        self.added_timegates   = []
+        self.removed_timegates = []
+        self.added_timemaps    = []
+        self.removed_timemaps  = []
+        self.changed_timemaps  = []
+
+    def __nonzero__(self):
+        return any([self.added, self.removed, self.original is not None,
+                    self.added_timegates, self.removed_timegates,
+                    self.added_timemaps, self.removed_timemaps,
+                    self.changed_timemaps])
+
+    def __repr__(self):
+        return ''.join(['TimemapDiff<',
+               'added: ', repr(len(self.added)),
+               ', removed: ', repr(len(self.removed)),
+               ', original: ', repr(self.original),
+               ', timegates: +', repr(self.added_timegates),
+               ' -', repr(self.removed_timegates),
+               ', timemaps: +', repr(self.added_timemaps),
+               ' -', repr(self.removed_timemaps),
+               ' ~', repr(self.changed_timemaps),
+               '>'])
+
+
+class CompactMementos(object):
+    """
+    Columnar store for the mementos of a 'LinkTimemap'.
+
+    Behaves like the 'mementos' dict of a regular 'LinkTimemap' (a mapping of
+    memento datetimes to sets of 'MementoLink's) but keeps one row per
+    memento in parallel arrays instead of one object per memento:
+
+        epochs: memento datetimes as whole seconds since the epoch.
+        uri codes: an index into a table of interned URI templates (URIs of
+                   the form '.../YYYYMMDDHHMMSS/...' whose timestamp matches
+                   the memento datetime), or, if negative, into a table of
+                   literal URIs.
+        rel codes: an index into a table of distinct link relation lists.
+        license codes: an index into a table of license URIs (0 is None).
+
+    'MementoLink's are built on demand whenever a row is read.  Datetimes
+    are stored to the second, which is the resolution of RFC 1123 dates.
+    """
+
+    URI_TIMESTAMP_RE = re.compile('/([0-9]{14})/')
+
+    def __init__(self, mementos=()):
+        """
+        Initialize a new 'CompactMementos', optionally with an iterable of
+        'MementoLink's.
+        """
+        self._epochs        = array.array(str('l'))
+        self._uri_codes     = array.array(str('l'))
+        self._rel_codes     = array.array(str('I'))
+        self._license_codes = array.array(str('I'))
+        self._templates     = []
+        self._literals      = []
+        self._rels          = []
+        self._licenses      = [None]
+        self._interned      = dict()
+        self._keys          = None  # distinct epochs, once sorted
+        self._starts        = None  # row offset of each distinct epoch
+        self._sorted        = True
+        for memento in mementos:
+            self.add(memento)
+
+    def add(self, memento):
+        """
+        Append a 'MementoLink'.
+        """
+        epoch = to_epoch(memento.memento_datetime)
+        if self._epochs and epoch < self._epochs[-1]:
+            self._sorted = False
+        self._epochs.append(epoch)
+        self._uri_codes.append(self._uri_code(memento.uri_m, epoch))
+        self._rel_codes.append(self._code(self._rels, 'rels',
+                                          tuple(memento.rels or ())))
+        self._license_codes.append(self._code(self._licenses, 'license',
+                                              memento.license_uri))
+        self._keys = None
+
+    def datetimes(self):
+        """
+        Return a sorted, lazily converted sequence of the memento datetimes.
+        """
+        self._finish()
+        return _EpochSequence(self._keys, from_epoch)
+
+    def __getitem__(self, memento_datetime):
+        self._finish()
+        epoch = to_epoch(memento_datetime)
+        i = bisect.bisect_left(self._keys, epoch)
+        if i == len(self._keys) or self._keys[i] != epoch:
+            raise KeyError(memento_datetime)
+        end = self._starts[i + 1] if i + 1 < len(self._starts) \
+            else len(self._epochs)
+        return set(self._row(j) for j in xrange(self._starts[i], end))
+
+    def get(self, memento_datetime, default=None):
+        try:
+            return self[memento_datetime]
+        except KeyError:
+            return default
+
+    def __contains__(self, memento_datetime):
+        self._finish()
+        epoch = to_epoch(memento_datetime)
+        i = bisect.bisect_left(self._keys, epoch)
+        return i < len(self._keys) and self._keys[i] == epoch
+
+    def __len__(self):
+        self._finish()
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self.datetimes())
+
+    def keys(self):
+        return list(self.datetimes())
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for memento_datetime in self:
+            yield self[memento_datetime]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        for memento_datetime in self:
+            yield memento_datetime, self[memento_datetime]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itermementos(self):
+        """
+        Generate every 'MementoLink' in datetime order.
+        """
+        self._finish()
+        for j in xrange(len(self._epochs)):
+            yield self._row(j)
+
+    def __repr__(self):
+        return ''.join(['CompactMementos<',
+               'mementos: ', repr(len(self._epochs)),
+               ', datetimes: ', repr(len(self)),
                '>'])
 
+    def _row(self, j):
+        """
+        Build the 'MementoLink' view of row 'j'.
+        """
+        epoch = self._epochs[j]
+        memento_datetime = from_epoch(epoch)
+        code = self._uri_codes[j]
+        if code < 0:
+            uri_m = self._literals[-code - 1]
+        else:
+            prefix, suffix = self._templates[code]
+            timestamp = self._timestamp(memento_datetime)
+            if isinstance(prefix, bytes):
+                timestamp = timestamp.encode('ascii')
+            uri_m = prefix + timestamp + suffix
+        rels = self._rels[self._rel_codes[j]]
+        return MementoLink(memento_datetime, uri_m,
+                           list(rels) if rels else None,
+                           self._licenses[self._license_codes[j]])
+
+    def _uri_code(self, uri_m, epoch):
+        match = CompactMementos.URI_TIMESTAMP_RE.search(uri_m)
+        if match is not None and match.group(1) \
+               == self._timestamp(from_epoch(epoch)):
+            template = (uri_m[:match.start(1)], uri_m[match.end(1):])
+            return self._code(self._templates, 'uri', template)
+        self._literals.append(uri_m)
+        return -len(self._literals)
+
+    def _code(self, table, kind, value):
+        """
+        Return the index of 'value' in 'table', adding it if necessary.
+        """
+        if value is None:
+            return 0
+        key = (kind, value)
+        code = self._interned.get(key)
+        if code is None:
+            code = len(table)
+            table.append(value)
+            self._interned[key] = code
+        return code
+
+    def _finish(self):
+        """
+        Sort the rows by datetime and index the distinct datetimes.
+        """
+        if self._keys is not None:
+            return
+        epochs = self._epochs
+        if not self._sorted:
+            order = sorted(xrange(len(epochs)), key=epochs.__getitem__)
+            for name in ('_epochs', '_uri_codes', '_rel_codes',
+                         '_license_codes'):
+                column = getattr(self, name)
+                setattr(self, name, array.array(column.typecode,
+                                                (column[j] for j in order)))
+            epochs = self._epochs
+            self._sorted = True
+        keys   = array.array(str('l'))
+        starts = array.array(str('l'))
+        previous = None
+        for j, epoch in enumerate(epochs):
+            if epoch != previous:
+                keys.append(epoch)
+                starts.append(j)
+                previous = epoch
+        self._keys   = keys
+        self._starts = starts
+
+    def _mark_ends(self):
+        """
+        Give the 'first' relation to the first row and 'last' to the last
+        row, and take them from every other row.
+        """
+        self._finish()
+        codes = self._rel_codes
+        if not codes:
+            return
+        stripped = [self._code(self._rels, 'rels', tuple(
+                        rel for rel in rels if rel not in ('first', 'last')))
+                    for rels in list(self._rels)]
+        self._rel_codes = codes = array.array(
+            codes.typecode, (stripped[code] for code in codes))
+        for j, rel in ((len(codes) - 1, 'last'), (0, 'first')):
+            rels = (rel,) + self._rels[codes[j]]
+            codes[j] = self._code(self._rels, 'rels', rels)
+
+    @staticmethod
+    def _timestamp(dt):
+        return '%04d%02d%02d%02d%02d%02d' % (dt.year, dt.month, dt.day,
+                                             dt.hour, dt.minute, dt.second)
+
+
+class _EpochSequence(object):
+    """
+    Read-only sequence view converting an array of epochs to datetimes on
+    access, so that it can be searched with 'bisect'.
+    """
+    __slots__ = ('_epochs', '_convert')
+
+    def __init__(self, epochs, convert):
+        self._epochs  = epochs
+        self._convert = convert
+
+    def __len__(self):
+        return len(self._epochs)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._convert(epoch) for epoch in self._epochs[i]]
+        return self._convert(self._epochs[i])
+
+
+class MementoDict(dict):
+    """
+    The dict of mementos of a 'LinkTimemap' (memento datetimes to sets of
+    'MementoLink's), counting the changes to its keys in 'version' so that
+    the timemap's datetime index is rebuilt after any of them.  Adding to
+    the set of an existing datetime does not change the index.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(MementoDict, self).__init__(*args, **kwargs)
+        self.version = 0
+
+    def __reduce__(self):
+        return (MementoDict, (dict(self),))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.version += 1
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.version += 1
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.version += 1
+
 
 class LinkTimemap(object):
     """
@@ -92,7 +691,7 @@ class LinkTimemap(object):
         original_uri: a unicode string containing the original URI-R.
         timegate_uris: a list of unicode strings containing URI-Gs.
         timemaps: a list of TimemapLinks containing timemap link data.
-                  (Note: timemaps[0] is the 'self' timemap link.)
+                  (The 'self' link, if any, comes first.)
         mementos: a list of MementoLinks containing memento link data.
     """
 
@@ -109,256 +708,1163 @@ class LinkTimemap(object):
             original_uri: a unicode string containing the original URI-R.
             timegate_uris: a list of unicode strings containing URI-Gs.
             timemaps: a list of TimemapLinks containing timemap link data.
-                      (Note: timemaps[0] is the 'self' timemap link.)
-            mementos: a list of MementoLinks containing memento link data.
+                      (The 'self' link, if any, comes first.)
+            mementos: a dict mapping memento datetimes to sets of MementoLinks,
+                      or a 'CompactMementos'.
         """
         self.original_uri  = original_uri
         self.timegate_uris = timegate_uris
         self.timemaps      = timemaps
         self.mementos      = mementos
         #self.assert_validity(include_mementos=(mementos is not None))
+        self.provenance    = None    # Set by 'merge'
+
+
+    @property
+    def mementos(self):
+        """
+        The mementos: a 'MementoDict', a 'CompactMementos' or None.  A plain
+        dict assigned to it is copied into a 'MementoDict'.
+        """
+        return self._mementos
+
+
+    @mementos.setter
+    def mementos(self, mementos):
+        if type(mementos) is dict:
+            mementos = MementoDict(mementos)
+        self._mementos = mementos
+        self._index    = None
+        self._version  = None
+
+
+    @property
+    def self_link(self):
+        """
+        The 'TimemapLink' of this timemap itself, or None if it has none.
+        """
+        for link in self.timemaps:
+            if link.rel == 'self':
+                return link
+        return None
 
 
     @staticmethod
-    def from_file(filename, base_uri, encoding='utf-8'):
+    def from_file(filename, base_uri, encoding='utf-8', compact=False,
+                  since=None, until=None, predicate=None):
         """
         Create a new LinkTimemap instance from the contents of a file.
 
         Parse the contents of 'filename' creating a 'LinkTimemap' representing
         the contents.  Resolve relative URIs using 'base_uri'.
 
+        Mementos outside 'since'..'until' or rejected by 'predicate' are
+        dropped while parsing (see 'MementoFilter'), so that selective
+        queries need not build the whole timemap.
+
         Args:
             filename: The name of the file containing the link timemap.
             base_uri: The URI from which the file was downloaded.
+            compact: store the mementos in a 'CompactMementos'.
+            since: keep only the mementos from this datetime on.
+            until: keep only the mementos up to this datetime.
+            predicate: keep only the mementos for which
+                predicate(uri_m, memento_datetime) is true.
 
         Returns:
             A LinkTimemap.
         """
+        select = MementoFilter.create(since, until, predicate)
         with codecs.open(filename, 'r', encoding) as tmfile:
-            parser = LinkTimemap._link_stream(tmfile)
-            timemap = LinkTimemap._from_link_stream(parser, base_uri)
+            parser = LinkTimemap._link_stream(tmfile, select=select)
+            timemap = LinkTimemap._from_link_stream(parser, base_uri,
+                                                      compact, select)
         return timemap
 
 
     @staticmethod
-    def from_string(timemap_text, base_uri):
+    def from_string(timemap_text, base_uri, compact=False, since=None,
+                    until=None, predicate=None):
         """
         Create a new LinkTimemap instance from the contents of a string.
 
         Parse the contents of 'filename' creating a 'LinkTimemap' representing
-        the contents.  Resolve relative URIs using 'base_uri'.
+        the contents.  Resolve relative URIs using 'base_uri'.  Mementos are
+        selected as by 'from_file'.
 
         Args:
             timemap_text: A string containing a complete link timemap.
             base_uri: The URI from which the file was downloaded.
+            compact: store the mementos in a 'CompactMementos'.
+            since: keep only the mementos from this datetime on.
+            until: keep only the mementos up to this datetime.
+            predicate: keep only the mementos for which
+                predicate(uri_m, memento_datetime) is true.
 
         Returns:
             A LinkTimemap.
         """
+        select = MementoFilter.create(since, until, predicate)
         with io.BytesIO(timemap_text) as tmfile:
-            parser = LinkTimemap._link_stream(tmfile)
-            timemap = LinkTimemap._from_link_stream(parser, base_uri)
+            parser = LinkTimemap._link_stream(tmfile, select=select)
+            timemap = LinkTimemap._from_link_stream(parser, base_uri,
+                                                      compact, select)
         return timemap
 
 
     @staticmethod
-    def from_uri(uri_t):
+    def from_links(links, base_uri, compact=False):
         """
-        Create a new LinkTimemap instance by dereferencing a URI-T.
-
-        Parse the representation of 'uri_t' creating a 'LinkTimemap' from the
-        the representation.  Resolve relative URIs using 'uri_t' as the base.
+        Create a new LinkTimemap instance from links already parsed by a
+        'LinkParser', e.g. those of a 'Link' header embedding a timemap.
 
         Args:
-            uri_t: The URI-T to be dereferenced.
+            links: an iterable of link tuples.
+            base_uri: The base URI used to resolve relative URIs.
+            compact: store the mementos in a 'CompactMementos'.
 
         Returns:
             A LinkTimemap.
         """
-        # TODO: add "Accept: application/link-format;q=1.0" HTTP header
-        with urllib2.urlopen(uri_t) as tmfile:
-            parser = LinkTimemap._link_stream(tmfile)
-            timemap = LinkTimemap._from_link_stream(parser, uri_t)
-        return timemap
+        return LinkTimemap._from_link_stream(LinkTimemap._currated(links),
+                                             base_uri, compact)
 
 
-    def __getitem__(self, memento_datetime):
+    @staticmethod
+    def from_json(timemap_json, base_uri, compact=False):
         """
-        Return the set of URI-Ms for the specified MementoLink-Datetime.
+        Create a new LinkTimemap instance from a JSON timemap.
+
+        A string is decoded as a whole.  A file-like object or a 'requests'
+        response is decoded incrementally, one memento at a time, so that
+        large timemaps are never held in memory as JSON; mementos then get
+        the 'first'/'last' relations only if the document lists those before
+        the mementos.  Either way the mementos and timemap links are the same
+        objects that the equivalent link-format timemap yields.
 
         Args:
-            memento_datetime: the MementoLink-Datetime of the memento(s) to be retrieved.
+            timemap_json: A string or file-like object containing a JSON
+                timemap (see 'pymemento.JsonTimemap').
+            base_uri: The URI from which the timemap was downloaded.
+            compact: store the mementos in a 'CompactMementos'.
 
         Returns:
-            A set of URI-Ms.
-
-        Raises:
-            KeyError: if no URI-Ms are available for the specified MementoLink-Datetime.
+            A LinkTimemap.
         """
-        return self.mementos[memento_datetime]
-
+        if hasattr(timemap_json, 'read') or \
+               hasattr(timemap_json, 'iter_content'):
+            parser = LinkTimemap._link_stream(timemap_json, JsonParser())
+        else:
+            parser = LinkTimemap._currated(JsonParser().parse(timemap_json))
+        return LinkTimemap._from_link_stream(parser, base_uri, compact)
 
-    #==========================================================================
-    # String representation
-    #==========================================================================
 
-    def __repr__(self):
-        """
-        Dump a 'LinkTimemap' in human-readable form.
+    @staticmethod
+    def from_uri(uri_t, compact=False, session=None, follow_pages=False,
+                 since=None, until=None, workers=4, prefer='link',
+                 predicate=None):
         """
-        return ''.join(['LinkTimemap<',
-               'original_uri: ', repr(self.original_uri),
-               ', timegate_uris: ', repr(self.timegate_uris),
-               ', timemaps: ', repr(self.timemaps),
-               ', mementos: ', repr(self.mementos),
-               '>'])
-
-
-    #==========================================================================
-    # Parser
-    #==========================================================================
-
-    # TODO: Move parser to separate class
+        Create a new LinkTimemap instance by dereferencing a URI-T.
 
-    TOKENIZER_RE = re.compile('(<[^>]+>|[a-zA-Z]+="[^"]*"|[;,])\\s*')
-    URI_DATETIME_RE = re.compile('/([12][90][0-9][0-9][01][0-9][0123][0-9]'
-                                 '[012][0-9][0-5][0-9][0-5][0-9])/',
-                                 re.IGNORECASE)
-    URI_DATETIME_FORMAT = '%Y%m%d%H%M%S'
+        Parse the representation of 'uri_t' creating a 'LinkTimemap' from the
+        the representation.  Resolve relative URIs using 'uri_t' as the base.
 
+        With 'follow_pages', the pages of a paginated timemap (its 'timemap'
+        links) are fetched as well, 'workers' at a time, and their mementos
+        merged into a single timemap.  Pages whose 'from'/'until' bounds lie
+        entirely outside 'since'..'until' are not fetched.  Mementos are
+        selected as by 'from_file'.
 
-    @staticmethod
-    def _from_link_stream(link_stream, base_uri):
-        """
-        Create a 'LinkTimemap' from a timemap's list links.
+        With prefer='json' the JSON representation is requested, falling back
+        to link-format; either is parsed according to its Content-Type.
 
         Args:
-            link_stream: an iterable that provides a list of all the links
-                in the timemap's representation.
-            base_uri: The base URI used to resolve relative URIs.
+            uri_t: The URI-T to be dereferenced.
+            compact: store the mementos in a 'CompactMementos'.
+            session: the HTTP session to use, or None for the process-wide
+                session (see 'pymemento.Session').
+            follow_pages: also fetch and merge the linked timemap pages.
+            since: keep only the mementos from this datetime on, and skip
+                pages ending before it.
+            until: keep only the mementos up to this datetime, and skip
+                pages starting after it.
+            workers: the number of pages fetched concurrently.
+            prefer: the representation to ask for, 'link' or 'json'.
+            predicate: keep only the mementos for which
+                predicate(uri_m, memento_datetime) is true.
 
         Returns:
-            A 'LinkTimemap'.
-        """
-        original_uri = None   # The original IRI-R
-        timegates    = []     # List of timegate linkss in this timemap
-        timemaps     = []     # List of timemap links in this timemap
-        mementos     = dict() # List of memento links in this timemap
-        for link in link_stream:
-            (rels, uri, memento_datetime, mime_type, license) = link[:5]
-            if 'memento' in rels:
-
-                if memento_datetime not in mementos:
-                    mementos[memento_datetime] = set()
-                uri_m = urlparse.urljoin(base_uri, uri)
-
-
-                mementos[memento_datetime].add(
-                        MementoLink(memento_datetime, uri_m, rels, license)
-                        )
-                
-            elif 'original' in rels:
-                original_uri = urlparse.urljoin(base_uri, uri)
-            elif 'timegate' in rels:
-                uri_g = urlparse.urljoin(base_uri, uri)
-                timegates.append(uri_g)
-            elif 'timemap' in rels or 'self' in rels:
-                uri_t = urlparse.urljoin(base_uri, uri)
-                from_dt, until_dt = link[5:]
-                timemap_link = TimemapLink(uri_t, from_dt, until_dt, mime_type)
-                if 'self' in rels:
-                    timemaps.insert(0, timemap_link)
-                else:
-                    timemaps.append(timemap_link)
+            A LinkTimemap.
 
-        timemap = LinkTimemap(original_uri, timegates, timemaps, mementos)
+        Raises:
+            requests.HTTPError: if the URI-T could not be dereferenced.
+        """
+        session = session or get_session()
+        select = MementoFilter.create(since, until, predicate)
+        timemap = LinkTimemap._fetch(uri_t, session, compact, prefer, select)
+        if follow_pages:
+            LinkTimemap._follow_pages(timemap, uri_t, session, since, until,
+                                      workers, prefer, select)
         return timemap
 
 
     @staticmethod
-    def _link_stream(tmfile):
+    def _fetch(uri_t, session, compact=False, prefer='link', select=None):
         """
-        Parse a 'LinkTimemap'.
+        Dereference and parse a single timemap page.
         """
-        uri       = None
-        rels      = []
-        datetime  = None
-        from_dt   = None
-        until_dt  = None
-        mime_type = None
-        license   = None
-        tokens    = LinkTimemap._tokenizer(tmfile)
-        for token in tokens:
-            if token[0] == '<':
-                uri = token[1:-1]
-            elif token[:9] == 'datetime=':
-                raw_dt = token[10:-1]
-                datetime = dateutil.parser.parse(raw_dt)
-            elif token[:5] == 'from=':
-                raw_dt = token[6:-1]
-                from_dt = dateutil.parser.parse(raw_dt)
-            elif token[:6] == 'until=':
-                raw_dt = token[7:-1]
-                until_dt = dateutil.parser.parse(raw_dt)
-            elif token[:4] == 'rel=':
-                rels = token[5:-1].split()
-            elif token[:5] == 'type=':
-                mime_type = token[6:-1]
-            elif token[:8] == 'license=':
-                license = token[9:-1]
-            elif token == ';':
-                pass
-            elif token == ',':
-                yield (rels, uri, LinkTimemap._currate_datetime(datetime, uri),
-                       mime_type, license,
-                       LinkTimemap._currate_datetime(from_dt),
-                       LinkTimemap._currate_datetime(until_dt))
-            else:
-                raise Exception('Unexpected timemap token', token)
-        if uri is not None:
-            yield (rels, uri, LinkTimemap._currate_datetime(datetime, uri),
-                   mime_type, license)
-        tokens.close()
+        accept = LinkTimemap.ACCEPT_JSON if prefer == 'json' \
+            else LinkTimemap.ACCEPT
+        response = session.get(uri_t, stream=True, headers={'Accept': accept})
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.count('http_requests')
+            metrics.observe('http_seconds', response.elapsed.total_seconds())
+        try:
+            response.raise_for_status()
+            parser = None
+            if 'json' in response.headers.get('content-type', ''):
+                parser = JsonParser()
+            parser = LinkTimemap._link_stream(response, parser, select)
+            timemap = LinkTimemap._from_link_stream(parser, uri_t, compact,
+                                                      select)
+        finally:
+            response.close()
+        return timemap
 
 
     @staticmethod
-    def _tokenizer(timemap_file):
+    def _follow_pages(timemap, uri_t, session, since, until, workers,
+                      prefer='link', select=None):
         """
-        Generate a stream of tokens from a link timemap representation.  These
-        tokens are consumed by '_link_stream'.
+        Fetch the pages linked from 'timemap', and the pages linked from
+        those, merging their mementos into 'timemap'.  Mementos are
+        de-duplicated on (datetime, URI-M), and the 'first' and 'last'
+        relations each page gives are recomputed for the merged set.
         """
-        tmfile = timemap_file
-        for line in tmfile:
-            tokens = LinkTimemap.TOKENIZER_RE.findall(line)
-            for token in tokens:
-                yield token
+        since = None if since is None else LinkTimemap._as_utc(since)
+        until = None if until is None else LinkTimemap._as_utc(until)
+
+        def wanted(link):
+            if since is not None and link.until_dt is not None \
+                   and link.until_dt < since:
+                return False
+            if until is not None and link.from_dt is not None \
+                   and link.from_dt > until:
+                return False
+            return True
+
+        seen = set(link.uri_t for link in timemap.timemaps)
+        seen.add(uri_t)
+        merged = set()
+        for mementos in timemap.mementos.itervalues():
+            merged.update((m.memento_datetime, m.uri_m) for m in mementos)
+        pending = [link.uri_t for link in timemap.timemaps
+                   if link.uri_t != uri_t and wanted(link)]
+        pool = ThreadPool(workers)
+        try:
+            while pending:
+                pages = pool.imap_unordered(
+                    lambda page_uri: LinkTimemap._fetch(page_uri, session,
+                                                        prefer=prefer,
+                                                        select=select),
+                    pending)
+                pending = []
+                for page in pages:
+                    for mementos in page.mementos.itervalues():
+                        for memento in mementos:
+                            key = (memento.memento_datetime, memento.uri_m)
+                            if key not in merged:
+                                merged.add(key)
+                                timemap.add_memento(memento)
+                    for link in page.timemaps:
+                        if link.uri_t in seen:
+                            continue
+                        seen.add(link.uri_t)
+                        timemap.timemaps.append(link.with_rel('timemap'))
+                        if wanted(link):
+                            pending.append(link.uri_t)
+        finally:
+            pool.close()
+            pool.join()
+        LinkTimemap._mark_ends(timemap)
 
 
     @staticmethod
-    def _currate_datetime(dt, uri=None):
-        if dt is None:
+    def _mark_ends(timemap):
+        """
+        Give the 'first' relation to one memento at the earliest datetime of
+        'timemap' and 'last' to one at the latest, and take them from every
+        other memento, e.g. after merging pages which each marked their own.
+        """
+        mementos = timemap.mementos
+        if isinstance(mementos, CompactMementos):
+            mementos._mark_ends()
+            return
+        first, last = timemap.first, timemap.last
+        if first is None:
+            return
+        uri_m = lambda memento: memento.uri_m
+        ends = {first: min(mementos[first], key=uri_m),
+                last: max(mementos[last], key=uri_m)}
+        for memento_datetime, links in mementos.iteritems():
+            end = ends.get(memento_datetime)
+            for memento in list(links):
+                marked = memento is end
+                if not marked and not (memento.rels and (
+                        'first' in memento.rels or 'last' in memento.rels)):
+                    continue
+                links.remove(memento)
+                links.add(LinkTimemap._merged(
+                    memento, marked and memento_datetime == first,
+                    marked and memento_datetime == last))
+
+
+    @staticmethod
+    def from_uri_async(uri_t, resolver=None, **kwargs):
+        """
+        Dereference a URI-T in the background.
+
+        The request runs on the worker pool of 'resolver' (by default the
+        process-wide 'Resolver').  Keyword arguments are passed on to
+        'from_uri'.
+
+        Args:
+            uri_t: The URI-T to be dereferenced.
+            resolver: the 'Resolver' to use, or None.
+
+        Returns:
+            An 'AsyncResult' whose 'get()' returns a LinkTimemap.
+        """
+        from .Resolver import get_resolver
+        return (resolver or get_resolver()).timemap(uri_t, **kwargs)
+
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        Load a timemap written by 'save'.
+
+        Mementos are read directly from the file's contents when looked up,
+        so loading takes constant time whatever the size of the timemap.
+
+        Args:
+            path: the name of the file.
+            mmap: memory-map the file instead of reading it into memory.
+
+        Returns:
+            A LinkTimemap whose mementos are read-only.
+        """
+        from . import BinaryTimemap
+        return BinaryTimemap.load(path, mmap)
+
+
+    def save(self, path):
+        """
+        Write this timemap to 'path' in a compact binary format (see
+        'pymemento.BinaryTimemap') that 'load' can map into memory.
+
+        Args:
+            path: the name of the file.
+        """
+        from . import BinaryTimemap
+        BinaryTimemap.save(self, path)
+
+
+    def stats(self, gap_days=30):
+        """
+        Compute the temporal coverage of this timemap: its memento count,
+        first and last datetimes, gaps longer than 'gap_days' and mementos
+        per month and year (see 'pymemento.Coverage').
+
+        Args:
+            gap_days: the length, in days, beyond which an interval without
+                mementos is reported as a gap.
+
+        Returns:
+            A 'TimemapStats'.
+        """
+        from . import Coverage
+        return Coverage.stats(self, gap_days)
+
+
+    @staticmethod
+    def iter_mementos(tmfile, base_uri, header=None):
+        """
+        Generate the mementos of a timemap without building a 'LinkTimemap'.
+
+        The representation is parsed incrementally and every 'MementoLink' is
+        yielded as soon as it has been read, so memory use does not grow with
+        the size of the timemap.  The original, timegate and timemap links are
+        reported through 'header', if given:
+
+            header = LinkTimemap(None, [], [])
+            for memento in LinkTimemap.iter_mementos(tmfile, uri_t, header):
+                ...
+
+        Args:
+            tmfile: a file-like object or a 'requests' response containing
+                the link timemap.
+            base_uri: The URI from which the timemap was downloaded.
+            header: an optional 'LinkTimemap' whose 'original_uri',
+                'timegate_uris' and 'timemaps' are filled in while parsing.
+
+        Returns:
+            A generator of 'MementoLink's.
+        """
+        parser = LinkTimemap._link_stream(tmfile)
+        return LinkTimemap._iter_link_stream(parser, base_uri, header)
+
+
+    def __getitem__(self, memento_datetime):
+        """
+        Return the set of URI-Ms for the specified MementoLink-Datetime.
+
+        Args:
+            memento_datetime: the MementoLink-Datetime of the memento(s) to be retrieved.
+
+        Returns:
+            A set of URI-Ms.
+
+        Raises:
+            KeyError: if no URI-Ms are available for the specified MementoLink-Datetime.
+        """
+        return self.mementos[memento_datetime]
+
+
+    def add_memento(self, memento):
+        """
+        Add a 'MementoLink' to this timemap, keeping the datetime index valid.
+
+        Args:
+            memento: the 'MementoLink' to be added.
+        """
+        mementos = self._mementos
+        if mementos is None:
+            self.mementos = mementos = MementoDict()
+        if isinstance(mementos, CompactMementos):
+            mementos.add(memento)
+            return
+        memento_datetime = memento.memento_datetime
+        if memento_datetime not in mementos:
+            current = self._version == mementos.version
+            mementos[memento_datetime] = set()
+            if self._index is not None and current:
+                bisect.insort(self._index, memento_datetime)
+                self._version = mementos.version
+        mementos[memento_datetime].add(memento)
+
+
+    #==========================================================================
+    # Datetime index
+    #==========================================================================
+
+    @property
+    def first(self):
+        """
+        The earliest memento datetime, or None if there are no mementos.
+        """
+        index = self._datetimes()
+        return index[0] if index else None
+
+
+    @property
+    def last(self):
+        """
+        The latest memento datetime, or None if there are no mementos.
+        """
+        index = self._datetimes()
+        return index[-1] if index else None
+
+
+    def nearest(self, dt):
+        """
+        Return the memento datetime closest to 'dt'.
+
+        Ties are resolved in favour of the earlier memento.  A naive 'dt' is
+        taken to be in UTC.
+
+        Args:
+            dt: the datetime to look for.
+
+        Returns:
+            A memento datetime, or None if there are no mementos.
+        """
+        index = self._datetimes()
+        if not index:
             return None
-        if (dt.tzname() != 'UTC'):
-            dt = dt.astimezone(dateutil.tz.tzutc())
-        if uri is None:
-            return dt
-        # See if the time looks fishy (time == 00:00:00)
-        if dt.hour != 0 or dt.minute != 0 or dt.second != 0:
-            return dt
-        # See if the uri has a YYYYMMDDHHMMSS dt in it, if so fix the time
-        match = LinkTimemap.URI_DATETIME_RE.search(uri)
-        if match is None:
-            return dt
-        # If the date is the same, replace the time with the URI time
-        uri_datetime = dt.strptime(match.group(1), LinkTimemap.URI_DATETIME_FORMAT)
-        if uri_datetime.year == dt.year \
-               and uri_datetime.month == dt.month \
-               and uri_datetime.day == dt.day:
-            return dt.replace(hour = uri_datetime.hour,
-                              minute = uri_datetime.minute,
-                              second = uri_datetime.second)
+        dt = LinkTimemap._as_utc(dt)
+        i = bisect.bisect_left(index, dt)
+        if i == 0:
+            return index[0]
+        if i == len(index):
+            return index[-1]
+        before, after = index[i - 1], index[i]
+        return after if after - dt < dt - before else before
+
+
+    def before(self, dt):
+        """
+        Return the latest memento datetime strictly earlier than 'dt'.
+
+        Args:
+            dt: the datetime to look for.
+
+        Returns:
+            A memento datetime, or None if there is none.
+        """
+        index = self._datetimes()
+        i = bisect.bisect_left(index, LinkTimemap._as_utc(dt))
+        return index[i - 1] if i > 0 else None
+
+
+    def after(self, dt):
+        """
+        Return the earliest memento datetime strictly later than 'dt'.
+
+        Args:
+            dt: the datetime to look for.
+
+        Returns:
+            A memento datetime, or None if there is none.
+        """
+        index = self._datetimes()
+        i = bisect.bisect_right(index, LinkTimemap._as_utc(dt))
+        return index[i] if i < len(index) else None
+
+
+    def range(self, start=None, end=None):
+        """
+        Return the memento datetimes between 'start' and 'end', inclusive.
+
+        Args:
+            start: the earliest datetime of interest, or None for no bound.
+            end: the latest datetime of interest, or None for no bound.
+
+        Returns:
+            A sorted list of memento datetimes.
+        """
+        index = self._datetimes()
+        lo = 0 if start is None \
+            else bisect.bisect_left(index, LinkTimemap._as_utc(start))
+        hi = len(index) if end is None \
+            else bisect.bisect_right(index, LinkTimemap._as_utc(end))
+        return index[lo:hi]
+
+
+    def _reindex(self):
+        """
+        Rebuild the sorted index of memento datetimes.
+        """
+        mementos = self._mementos
+        self._index   = sorted(mementos) if mementos else []
+        self._version = getattr(mementos, 'version', None)
+
+
+    def _datetimes(self):
+        """
+        Return the sorted list of memento datetimes, rebuilding it if the
+        datetimes of 'mementos' have changed other than through
+        'add_memento'.
+        """
+        mementos = self._mementos
+        if isinstance(mementos, CompactMementos):
+            return mementos.datetimes()
+        if self._index is None or \
+               self._version != getattr(mementos, 'version', None):
+            self._reindex()
+        return self._index
+
+
+    @staticmethod
+    def _as_utc(dt):
+        """
+        Make a naive datetime comparable with memento datetimes.
+        """
+        if dt.tzinfo is None:
+            return dt.replace(tzinfo=LinkParser.UTC)
+        return dt
+
+
+    #==========================================================================
+    # Merging
+    #==========================================================================
+
+    @staticmethod
+    def merge(*timemaps, **kwargs):
+        """
+        Aggregate the timemaps of one URI-R from several archives.
+
+        The mementos are merged as by 'iter_merge'.  The original URI is the
+        first one given; timegate and timemap links are combined without
+        duplicates.  The result's 'provenance' maps each (memento datetime,
+        URI-M) to the indices, in 'timemaps', of the timemaps listing it.
+
+        Args:
+            timemaps: the 'LinkTimemap's to merge.
+            compact: (keyword) store the mementos in a 'CompactMementos'.
+
+        Returns:
+            A LinkTimemap.
+        """
+        compact = kwargs.pop('compact', False)
+        if kwargs:
+            raise TypeError('Unexpected arguments: ' + ', '.join(kwargs))
+        merged = LinkTimemap(None, [], [])
+        seen = set()
+        for timemap in timemaps:
+            if merged.original_uri is None:
+                merged.original_uri = timemap.original_uri
+            for uri_g in timemap.timegate_uris:
+                if uri_g not in merged.timegate_uris:
+                    merged.timegate_uris.append(uri_g)
+            for link in timemap.timemaps:
+                if link.uri_t not in seen:
+                    seen.add(link.uri_t)
+                    merged.timemaps.append(link.with_rel('timemap'))
+        provenance = dict()
+        merged.provenance = provenance
+
+        def mementos():
+            for memento, sources in LinkTimemap.iter_merge(*timemaps):
+                provenance[(memento.memento_datetime, memento.uri_m)] = sources
+                yield memento
+
+        if compact:
+            merged.mementos = CompactMementos(mementos())
         else:
-            return dt
+            merged.mementos = MementoDict()
+            for memento in mementos():
+                merged.add_memento(memento)
+            merged._reindex()
+        return merged
+
+
+    @staticmethod
+    def iter_merge(*sources):
+        """
+        Merge the mementos of several timemaps in order of datetime.
+
+        A k-way merge: only the mementos of the current datetime are held in
+        memory, so 'sources' may be streams, e.g. from 'iter_mementos'.
+        Mementos with the same datetime whose URI-Ms are equal once
+        normalized (see 'normalize_uri') are reported once, as given by the
+        first source listing them.  The 'first' and 'last' relations are
+        recomputed for the merged sequence.
+
+        Args:
+            sources: 'LinkTimemap's, or iterables of 'MementoLink's in
+                ascending order of datetime.
+
+        Returns:
+            A generator of ('MementoLink', sources) pairs, 'sources' being
+            the sorted tuple of the indices of the sources listing it.
+
+        Raises:
+            ValueError: if a stream is not in ascending order.
+        """
+        streams = [LinkTimemap._merge_stream(source, i)
+                   for i, source in enumerate(sources)]
+        pending = None
+        first = True
+        for _, group in itertools.groupby(heapq.merge(*streams),
+                                          key=lambda entry: entry[0]):
+            found = collections.OrderedDict()
+            for _, key, index, _, memento in group:
+                if key in found:
+                    found[key][1].add(index)
+                else:
+                    found[key] = (memento, set([index]))
+            for memento, indices in found.itervalues():
+                if pending is not None:
+                    yield LinkTimemap._merged(pending[0], first, False), \
+                        tuple(sorted(pending[1]))
+                    first = False
+                pending = (memento, indices)
+        if pending is not None:
+            yield LinkTimemap._merged(pending[0], first, True), \
+                tuple(sorted(pending[1]))
+
+
+    @staticmethod
+    def normalize_uri(uri):
+        """
+        Normalize a URI for comparison: the scheme and host are lowercased,
+        a default port and the fragment are dropped and an empty path
+        becomes '/'.
+        """
+        scheme, netloc, path, query, _ = urlparse.urlsplit(uri)
+        scheme = scheme.lower()
+        netloc = netloc.lower()
+        if (scheme, netloc[-3:]) == ('http', ':80') or \
+               (scheme, netloc[-4:]) == ('https', ':443'):
+            netloc = netloc.rsplit(':', 1)[0]
+        return urlparse.urlunsplit((scheme, netloc, path or '/', query, ''))
+
+
+    @staticmethod
+    def _merge_stream(source, index):
+        """
+        Generate the heap entries of one source of 'iter_merge'.
+        """
+        if isinstance(source, LinkTimemap):
+            source = LinkWriter.sorted_mementos(source)
+        previous = None
+        for serial, memento in enumerate(source):
+            memento_datetime = LinkTimemap._as_utc(memento.memento_datetime)
+            if previous is not None and memento_datetime < previous:
+                raise ValueError('Mementos of source {0} are not in ascending '
+                                 'order of datetime'.format(index))
+            previous = memento_datetime
+            yield (memento_datetime, LinkTimemap.normalize_uri(memento.uri_m),
+                   index, serial, memento)
+
+
+    @staticmethod
+    def _merged(memento, first, last):
+        """
+        Copy 'memento' with 'first'/'last' relations for its merged position.
+        """
+        rels = [rel for rel in memento.rels or ['memento']
+                if rel not in ('first', 'last')]
+        if last:
+            rels.insert(0, 'last')
+        if first:
+            rels.insert(0, 'first')
+        return MementoLink(memento.memento_datetime, memento.uri_m, rels,
+                           memento.license_uri)
+
+
+    #==========================================================================
+    # Differences
+    #==========================================================================
+
+    @staticmethod
+    def diff(old, new):
+        """
+        Compare two versions of a timemap, e.g. a cached copy and a fresh
+        download.
+
+        Mementos are matched on datetime and URI-M, so changes to their
+        relations (such as 'last' moving to a newer memento) or license are
+        not reported.
+
+        Args:
+            old: the previous 'LinkTimemap'.
+            new: the current 'LinkTimemap'.
+
+        Returns:
+            A 'TimemapDiff'.
+        """
+        changes = TimemapDiff()
+        for change, memento in LinkTimemap.iter_diff(old, new):
+            if change == '+':
+                changes.added.append(memento)
+            else:
+                changes.removed.append(memento)
+        if old.original_uri != new.original_uri:
+            changes.original = (old.original_uri, new.original_uri)
+        changes.added_timegates = [uri_g for uri_g in new.timegate_uris
+                                   if uri_g not in old.timegate_uris]
+        changes.removed_timegates = [uri_g for uri_g in old.timegate_uris
+                                     if uri_g not in new.timegate_uris]
+        old_timemaps = dict((link.uri_t, link) for link in old.timemaps)
+        new_timemaps = dict((link.uri_t, link) for link in new.timemaps)
+        for link in new.timemaps:
+            previous = old_timemaps.get(link.uri_t)
+            if previous is None:
+                changes.added_timemaps.append(link)
+            elif (previous.from_dt, previous.until_dt, previous.mime_type,
+                  previous.rel) \
+                     != (link.from_dt, link.until_dt, link.mime_type, link.rel):
+                changes.changed_timemaps.append((previous, link))
+        changes.removed_timemaps = [link for link in old.timemaps
+                                    if link.uri_t not in new_timemaps]
+        return changes
+
+
+    @staticmethod
+    def iter_diff(old, new):
+        """
+        Generate the mementos added and removed between two versions of a
+        timemap, by a single merge over their datetimes.
+
+        Either version may be a stream of mementos in ascending order of
+        datetime rather than a 'LinkTimemap', so that a cached timemap can
+        be compared with a download as it is parsed:
+
+            header = LinkTimemap(None, [], [])
+            fresh = LinkTimemap.iter_mementos(response, uri_t, header)
+            for change, memento in LinkTimemap.iter_diff(cached, fresh):
+                ...
+
+        Only the mementos of one datetime of each version are held at a
+        time.
+
+        Args:
+            old: the previous 'LinkTimemap' or stream of 'MementoLink's.
+            new: the current 'LinkTimemap' or stream of 'MementoLink's.
+
+        Returns:
+            A generator of (change, 'MementoLink') pairs in order of
+            datetime, 'change' being '+' for added and '-' for removed.
+
+        Raises:
+            ValueError: if a stream is not in ascending order.
+        """
+        old_groups = LinkTimemap._datetime_groups(old, 'old')
+        new_groups = LinkTimemap._datetime_groups(new, 'new')
+        old_dt, old_group = next(old_groups, (None, None))
+        new_dt, new_group = next(new_groups, (None, None))
+        while old_group is not None or new_group is not None:
+            if new_group is None or (old_group is not None
+                                     and old_dt < new_dt):
+                for uri_m in sorted(old_group):
+                    yield '-', old_group[uri_m]
+                old_dt, old_group = next(old_groups, (None, None))
+            elif old_group is None or new_dt < old_dt:
+                for uri_m in sorted(new_group):
+                    yield '+', new_group[uri_m]
+                new_dt, new_group = next(new_groups, (None, None))
+            else:
+                for uri_m in sorted(old_group):
+                    if uri_m not in new_group:
+                        yield '-', old_group[uri_m]
+                for uri_m in sorted(new_group):
+                    if uri_m not in old_group:
+                        yield '+', new_group[uri_m]
+                old_dt, old_group = next(old_groups, (None, None))
+                new_dt, new_group = next(new_groups, (None, None))
+
+
+    @staticmethod
+    def _datetime_groups(source, name):
+        """
+        Generate (datetime, {URI-M: MementoLink}) pairs in ascending order
+        of datetime.
+        """
+        if isinstance(source, LinkTimemap):
+            for memento_datetime in source._datetimes():
+                yield memento_datetime, dict(
+                    (memento.uri_m, memento)
+                    for memento in source[memento_datetime])
+            return
+        previous = None
+        for memento_datetime, mementos in itertools.groupby(
+                source, key=lambda m: LinkTimemap._as_utc(m.memento_datetime)):
+            if previous is not None and memento_datetime <= previous:
+                raise ValueError('Mementos of the {0} timemap are not in '
+                                 'ascending order of datetime'.format(name))
+            previous = memento_datetime
+            yield memento_datetime, dict((memento.uri_m, memento)
+                                         for memento in mementos)
+
+
+    #==========================================================================
+    # Serialization
+    #==========================================================================
+
+    def to_string(self):
+        """
+        Serialize this timemap in link-format.
+
+        Returns:
+            A UTF-8 encoded byte string that 'from_string' parses back into an
+            equivalent timemap.
+        """
+        with io.BytesIO() as tmfile:
+            LinkWriter(tmfile).write_timemap(self)
+            return tmfile.getvalue()
+
+
+    def to_file(self, tmfile, chunk_size=64 * 1024):
+        """
+        Serialize this timemap in link-format, writing it in chunks.
+
+        Args:
+            tmfile: a file name, a file-like object opened for writing
+                bytes, or a socket.
+            chunk_size: the number of bytes buffered between writes.
+        """
+        if isinstance(tmfile, basestring):
+            with open(tmfile, 'wb') as output:
+                LinkWriter(output, chunk_size).write_timemap(self)
+        else:
+            LinkWriter(tmfile, chunk_size).write_timemap(self)
+
+
+    def to_json(self, tmfile=None, chunk_size=64 * 1024):
+        """
+        Serialize this timemap as a JSON timemap.
+
+        Args:
+            tmfile: a file name, a file-like object opened for writing bytes,
+                or a socket; None to return the serialization.
+            chunk_size: the number of bytes buffered between writes.
+
+        Returns:
+            A UTF-8 encoded byte string if 'tmfile' is None, which
+            'from_json' parses back into an equivalent timemap.
+        """
+        if tmfile is None:
+            with io.BytesIO() as output:
+                JsonWriter(output, chunk_size).write_timemap(self)
+                return output.getvalue()
+        if isinstance(tmfile, basestring):
+            with open(tmfile, 'wb') as output:
+                JsonWriter(output, chunk_size).write_timemap(self)
+        else:
+            JsonWriter(tmfile, chunk_size).write_timemap(self)
+
+
+    #==========================================================================
+    # String representation
+    #==========================================================================
+
+    def __repr__(self):
+        """
+        Dump a 'LinkTimemap' in human-readable form.
+        """
+        return ''.join(['LinkTimemap<',
+               'original_uri: ', repr(self.original_uri),
+               ', timegate_uris: ', repr(self.timegate_uris),
+               ', timemaps: ', repr(self.timemaps),
+               ', mementos: ', repr(self.mementos),
+               '>'])
+
+
+    #==========================================================================
+    # Parser
+    #==========================================================================
+
+    URI_DATETIME_RE = re.compile('/([12][90][0-9][0-9][01][0-9][0123][0-9]'
+                                 '[012][0-9][0-5][0-9][0-5][0-9])/',
+                                 re.IGNORECASE)
+    URI_DATETIME_FORMAT = '%Y%m%d%H%M%S'
+    BLOCK_SIZE = 64 * 1024
+    ACCEPT = 'application/link-format;q=1.0'
+    ACCEPT_JSON = 'application/json;q=1.0, application/link-format;q=0.9'
+
+
+    @staticmethod
+    def _from_link_stream(link_stream, base_uri, compact=False, select=None):
+        """
+        Create a 'LinkTimemap' from a timemap's list links.
+
+        Args:
+            link_stream: an iterable that provides a list of all the links
+                in the timemap's representation.
+            base_uri: The base URI used to resolve relative URIs.
+            compact: store the mementos in a 'CompactMementos' rather than
+                a dict of sets.
+            select: an optional 'MementoFilter' of the mementos kept.
+
+        Returns:
+            A 'LinkTimemap'.
+        """
+        metrics = get_metrics()
+        if metrics is not None:
+            start = metrics.clock()
+        timemap  = LinkTimemap(None, [], [])
+        mementos = LinkTimemap._iter_link_stream(link_stream, base_uri, timemap,
+                                                 select)
+        if compact:
+            timemap.mementos = CompactMementos(mementos)
+        else:
+            by_datetime = dict() # Memento links in this timemap
+            for memento in mementos:
+                links = by_datetime.get(memento.memento_datetime)
+                if links is None:
+                    links = by_datetime[memento.memento_datetime] = set()
+                links.add(memento)
+            timemap.mementos = by_datetime
+            timemap._reindex()
+        if metrics is not None:
+            metrics.observe('build_seconds', metrics.clock() - start)
+            metrics.count('timemaps')
+        return timemap
+
+
+    @staticmethod
+    def _iter_link_stream(link_stream, base_uri, header=None, select=None):
+        """
+        Generate the 'MementoLink's of a timemap's list of links.
+
+        Args:
+            link_stream: an iterable that provides a list of all the links
+                in the timemap's representation.
+            base_uri: The base URI used to resolve relative URIs.
+            header: an optional 'LinkTimemap' that receives the original,
+                timegate and timemap links as they are encountered.
+            select: an optional 'MementoFilter' of the mementos generated.
+
+        Returns:
+            A generator of 'MementoLink's.
+        """
+        in_range = predicate = None
+        if select is not None:
+            in_range, predicate = select.in_range, select.predicate
+        metrics = get_metrics()
+        join = BaseURI(base_uri).resolve
+        if metrics is not None:
+            join, elapsed = LinkTimemap._timed(join, metrics.clock)
+        count = 0
+        try:
+            for link in link_stream:
+                (rels, uri, memento_datetime, mime_type, license) = link[:5]
+                if 'memento' in rels:
+                    if in_range is not None and not in_range(memento_datetime):
+                        continue
+                    uri_m = join(uri)
+                    if predicate is not None \
+                           and not predicate(uri_m, memento_datetime):
+                        continue
+                    count += 1
+                    yield MementoLink(memento_datetime, uri_m, rels, license)
+                elif header is None:
+                    continue
+                elif 'original' in rels:
+                    header.original_uri = join(uri)
+                elif 'timegate' in rels:
+                    uri_g = join(uri)
+                    header.timegate_uris.append(uri_g)
+                elif 'timemap' in rels or 'self' in rels:
+                    uri_t = join(uri)
+                    from_dt, until_dt = link[5:]
+                    timemap_link = TimemapLink(
+                        uri_t, from_dt, until_dt, mime_type,
+                        'self' if 'self' in rels else 'timemap')
+                    if 'self' in rels:
+                        header.timemaps.insert(0, timemap_link)
+                    else:
+                        header.timemaps.append(timemap_link)
+        finally:
+            if metrics is not None:
+                metrics.observe('resolve_seconds', elapsed[0])
+                metrics.count('mementos', count)
+
+
+    @staticmethod
+    def _link_stream(tmfile, parser=None, select=None):
+        """
+        Parse a 'LinkTimemap'.
+
+        The representation is read in blocks of 'BLOCK_SIZE' and scanned by
+        'parser' (by default a 'LinkParser'); memento links certainly
+        rejected by the 'MementoFilter' 'select' are dropped, and the
+        datetimes of the others currated.  'tmfile' may be a file-like object
+        or a 'requests' response.
+        """
+        if hasattr(tmfile, 'iter_content'):
+            blocks = tmfile.iter_content(LinkTimemap.BLOCK_SIZE)
+        else:
+            blocks = iter(functools.partial(tmfile.read,
+                                            LinkTimemap.BLOCK_SIZE), b'')
+        parser = parser or LinkParser()
+        metrics = get_metrics()
+        if metrics is not None:
+            return LinkTimemap._instrumented(blocks, parser, metrics, select)
+        links = parser.parse_blocks(blocks)
+        if select is not None:
+            links = select.prefilter(links)
+        return LinkTimemap._currated(links)
+
+
+    @staticmethod
+    def _instrumented(blocks, parser, metrics, select=None):
+        """
+        '_link_stream' recording the time spent reading, parsing and
+        currating in 'metrics'.
+        """
+        clock = metrics.clock
+        read = [0.0, 0]
+
+        def timed_blocks():
+            iterator = iter(blocks)
+            while True:
+                start = clock()
+                block = next(iterator, None)
+                elapsed = clock() - start
+                read[0] += elapsed
+                if block is None:
+                    return
+                metrics.observe('read_seconds', elapsed)
+                read[1] += len(block)
+                yield block
+
+        links = parser.parse_blocks(timed_blocks())
+        if select is not None:
+            links = select.prefilter(links)
+        currate = _curate
+        parsing = currating = 0.0
+        count = fixups = 0
+        try:
+            while True:
+                start, reading = clock(), read[0]
+                link = next(links, None)
+                parsing += clock() - start - (read[0] - reading)
+                if link is None:
+                    break
+                start = clock()
+                (rels, uri, memento_dt, mime_type, license, from_dt,
+                 until_dt) = link
+                currated = currate(memento_dt, uri)
+                if currated != memento_dt:
+                    fixups += 1
+                link = (rels, uri, currated, mime_type, license,
+                        currate(from_dt), currate(until_dt))
+                currating += clock() - start
+                count += 1
+                yield link
+        finally:
+            metrics.observe('parse_seconds', parsing)
+            metrics.observe('currate_seconds', currating)
+            metrics.count('links', count)
+            metrics.count('currate_fixups', fixups)
+            metrics.count('bytes_read', read[1])
+            metrics.count('tokens', getattr(parser, 'tokens', 0))
+
+
+    @staticmethod
+    def _timed(function, clock):
+        """
+        Wrap 'function' so that the time spent in it is added up.
+
+        Returns:
+            The wrapper and a list whose only item is the total.
+        """
+        elapsed = [0.0]
+
+        def timed(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                elapsed[0] += clock() - start
+        return timed, elapsed
+
+
+    @staticmethod
+    def _currated(links):
+        """
+        Currate the datetimes of a stream of parsed links.
+        """
+        currate = _curate
+        for link in links:
+            (rels, uri, memento_dt, mime_type, license, from_dt, until_dt) = link
+            if from_dt is not None or until_dt is not None:
+                from_dt, until_dt = currate(from_dt), currate(until_dt)
+            yield (rels, uri, currate(memento_dt, uri), mime_type, license,
+                   from_dt, until_dt)
+
+
+    @staticmethod
+    def _currate_datetime(dt, uri=None):
+        """
+        Convert 'dt' to UTC and, if its time is midnight while 'uri' holds a
+        14-digit timestamp of the same day, take the time from the URI.
+        """
+        return _curate(dt, uri)
 
 
     #==========================================================================
@@ -388,4 +1894,76 @@ class LinkTimemap(object):
         assert not self.until_datetime or isinstance(self.until_datetime, datetime), repr(self.until_datetime)
 
 
+#==========================================================================
+# Push parser
+#==========================================================================
+
+class LinkTimemapParser(object):
+    """
+    Incremental builder of a 'LinkTimemap' from chunks pushed as they
+    arrive, e.g. from an HTTP client callback:
+
+        parser = LinkTimemapParser(uri_t)
+        for chunk in chunks:
+            parser.feed(chunk)
+        timemap = parser.close()
+
+    Chunks may be cut anywhere, including in the middle of a token or of a
+    multi-byte character; only the unfinished tail of a chunk is held.
+    """
+
+    def __init__(self, base_uri, compact=False, encoding=None):
+        """
+        Initialize a new 'LinkTimemapParser'.
+
+        Args:
+            base_uri: The base URI used to resolve relative URIs.
+            compact: store the mementos in a 'CompactMementos'.
+            encoding: the character encoding to decode the chunks with, or
+                None to keep URIs as byte strings (as 'from_string' does).
+        """
+        self._parser  = LinkParser(encoding)
+        self._base    = base_uri
+        self._timemap = LinkTimemap(None, [], [],
+                                    CompactMementos() if compact else dict())
+
+
+    def feed(self, data):
+        """
+        Parse the next chunk.
+
+        Returns:
+            A list of the 'MementoLink's completed by 'data'.
+        """
+        return self._add(self._parser.feed(data))
+
+
+    def close(self):
+        """
+        Finish parsing.
+
+        Returns:
+            The LinkTimemap.
+        """
+        self._add(self._parser.close())
+        timemap = self._timemap
+        if not isinstance(timemap.mementos, CompactMementos):
+            timemap._reindex()
+        return timemap
+
+
+    def _add(self, links):
+        mementos = list(LinkTimemap._iter_link_stream(
+            LinkTimemap._currated(links), self._base, self._timemap))
+        for memento in mementos:
+            self._timemap.add_memento(memento)
+        return mementos
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
 #end
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+
+import dateutil.tz
+
+
+#==========================================================================
+# Link-format serializer
+#==========================================================================
+
+class LinkWriter(object):
+    """
+    Streaming serializer producing RFC 7089 link-format timemaps.
+
+    Output is UTF-8 encoded and written to 'fileobj' (anything with 'write',
+    or a socket with 'sendall') in chunks of about 'chunk_size' bytes.  The
+    original link comes first, then the timemap links (each with its own
+    relation, so only a timemap's own link is 'self'), the timegate links
+    and the mementos in the order given; a 'LinkTimemap' writes its
+    mementos sorted by datetime and URI-M, so the same timemap always
+    serializes to the same bytes.
+
+    Dates are formatted in RFC 1123 form from lookup tables rather than with
+    'strftime', which depends on the locale; the date part is cached, since
+    the mementos of a timemap typically share days.
+    """
+
+    DAYS   = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    MONTHS = [None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+              'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+    UTC = dateutil.tz.tzutc()
+
+    SEPARATOR = b',\n'
+
+
+    def __init__(self, fileobj=None, chunk_size=64 * 1024):
+        """
+        Initialize a new 'LinkWriter'.
+
+        Args:
+            fileobj: the file-like object or socket to write to, or None to
+                only format links.
+            chunk_size: the number of bytes buffered before writing.
+        """
+        self._write      = None
+        if fileobj is not None:
+            self._write  = getattr(fileobj, 'sendall', None) or fileobj.write
+        self._chunk      = []
+        self._size       = 0
+        self._chunk_size = chunk_size
+        self._days       = dict()
+        self._first      = True
+
+
+    def write_timemap(self, timemap, mementos=None):
+        """
+        Write a complete timemap.
+
+        Args:
+            timemap: the 'LinkTimemap' providing the original, timemap and
+                timegate links.
+            mementos: an iterable of 'MementoLink's to write instead of
+                those of 'timemap', e.g. from 'LinkTimemap.iter_mementos'.
+        """
+        if timemap.original_uri is not None:
+            self._emit(self.original_link(timemap.original_uri))
+        for link in timemap.timemaps:
+            self._emit(self.timemap_link(link))
+        for uri_g in timemap.timegate_uris:
+            self._emit(self.timegate_link(uri_g))
+        if mementos is None:
+            mementos = LinkWriter.sorted_mementos(timemap)
+        for memento in mementos:
+            self._emit(self.memento_link(memento))
+        if not self._first:
+            self._chunk.append(b'\n')
+        self.flush()
+
+
+    def flush(self):
+        """
+        Write out any buffered output.
+        """
+        if self._chunk and self._write is not None:
+            self._write(b''.join(self._chunk))
+        self._chunk = []
+        self._size  = 0
+
+
+    #==========================================================================
+    # Link formatting
+    #==========================================================================
+
+    def original_link(self, uri_r):
+        return b''.join([b'<', _utf8(uri_r), b'>; rel="original"'])
+
+
+    def timegate_link(self, uri_g):
+        return b''.join([b'<', _utf8(uri_g), b'>; rel="timegate"'])
+
+
+    def timemap_link(self, link, rel=None):
+        """
+        Format a 'TimemapLink' with the given relation, by default its own.
+        """
+        parts = [b'<', _utf8(link.uri_t), b'>; rel="', _utf8(rel or link.rel),
+                 b'"']
+        if link.mime_type is not None:
+            parts.extend([b'; type="', _utf8(link.mime_type), b'"'])
+        if link.from_dt is not None:
+            parts.extend([b'; from="', self.format_date(link.from_dt), b'"'])
+        if link.until_dt is not None:
+            parts.extend([b'; until="', self.format_date(link.until_dt),
+                          b'"'])
+        return b''.join(parts)
+
+
+    def memento_link(self, memento):
+        """
+        Format a 'MementoLink'.
+        """
+        rels = memento.rels or ['memento']
+        if 'memento' not in rels:
+            rels = list(rels) + ['memento']
+        parts = [b'<', _utf8(memento.uri_m), b'>; rel="',
+                 _utf8(' '.join(rels)), b'"; datetime="',
+                 self.format_date(memento.memento_datetime), b'"']
+        if memento.license_uri is not None:
+            parts.extend([b'; license="', _utf8(memento.license_uri), b'"'])
+        return b''.join(parts)
+
+
+    def format_date(self, dt):
+        """
+        Format 'dt' as an RFC 1123 date in GMT, e.g.
+        'Tue, 20 Jun 2000 18:02:59 GMT'.  A naive 'dt' is taken to be UTC.
+        """
+        if dt.tzinfo is not None and dt.utcoffset():
+            dt = dt.astimezone(LinkWriter.UTC)
+        day = (dt.year, dt.month, dt.day)
+        prefix = self._days.get(day)
+        if prefix is None:
+            prefix = ('%s, %02d %s %04d ' % (LinkWriter.DAYS[dt.weekday()],
+                      dt.day, LinkWriter.MONTHS[dt.month], dt.year)) \
+                      .encode('ascii')
+            self._days[day] = prefix
+        return prefix + (b'%02d:%02d:%02d GMT'
+                         % (dt.hour, dt.minute, dt.second))
+
+
+    @staticmethod
+    def sorted_mementos(timemap):
+        """
+        Generate the mementos of 'timemap' ordered by datetime and URI-M.
+        """
+        for memento_datetime in timemap._datetimes():
+            for memento in sorted(timemap.mementos[memento_datetime],
+                                  key=lambda m: _utf8(m.uri_m)):
+                yield memento
+
+
+    def _emit(self, link):
+        if not self._first:
+            self._chunk.append(LinkWriter.SEPARATOR)
+            self._size += 2
+        self._first = False
+        self._chunk.append(link)
+        self._size += len(link)
+        if self._size >= self._chunk_size and self._write is not None:
+            self._write(b''.join(self._chunk))
+            self._chunk = []
+            self._size  = 0
+
+
+def _utf8(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+import bisect
+import logging
+import threading
+import time
+
+
+class Metrics(object):
+    """
+        Opt-in instrumentation of the parser and HTTP paths.
+
+        Once installed with 'set_metrics' (or 'enable'), the library
+        records:
+
+            histograms  read_seconds (per block read), parse_seconds,
+                        currate_seconds, resolve_seconds and build_seconds
+                        (per timemap), http_seconds (per request, to the
+                        response headers)
+            counters    bytes_read, tokens, links, mementos, currate_fixups,
+                        timemaps, http_requests
+
+        Without metrics installed (the default) the instrumented paths
+        check for them once per timemap or request and run unchanged.
+
+        'emit' hands the metrics to the 'sink', a callable such as
+        'log_sink' or 'prometheus_file_sink'.
+    """
+
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+               5.0, 10.0, 60.0)
+
+    def __init__(self, sink=None, buckets=BUCKETS, clock=time.time):
+        """
+            Initialize empty metrics.
+
+            Args:
+                sink: an optional callable, called as sink(metrics) by
+                    'emit'.
+                buckets: the upper bounds of the histogram buckets, in
+                    seconds.
+                clock: a callable returning the current time in seconds.
+        """
+        self.sink = sink
+        self.buckets = tuple(buckets)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.counters = dict()
+        self.histograms = dict()
+
+    def count(self, name, value=1):
+        """
+            Add 'value' to the counter 'name'.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """
+            Record a duration in the histogram 'name'.
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self.histograms[name] = histogram
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """
+            Time the body of a 'with' statement into the histogram 'name'.
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - start)
+
+    def snapshot(self):
+        """
+            Return the current values as plain data:
+            {'counters': {name: value},
+             'histograms': {name: {'count', 'sum', 'buckets'}}}
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict((name, histogram.snapshot())
+                                   for name, histogram
+                                   in self.histograms.iteritems()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def emit(self):
+        """
+            Hand the metrics to the sink, if any.
+        """
+        if self.sink is not None:
+            self.sink(self)
+
+    def to_prometheus(self, prefix='pymemento_'):
+        """
+            Dump the metrics in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name in sorted(snapshot['counters']):
+            lines.append('# TYPE {0}{1}_total counter'.format(prefix, name))
+            lines.append('{0}{1}_total {2}'.format(
+                prefix, name, snapshot['counters'][name]))
+        for name in sorted(snapshot['histograms']):
+            histogram = snapshot['histograms'][name]
+            lines.append('# TYPE {0}{1} histogram'.format(prefix, name))
+            for bound, count in histogram['buckets']:
+                lines.append('{0}{1}_bucket{{le="{2}"}} {3}'.format(
+                    prefix, name, '+Inf' if bound is None else repr(bound),
+                    count))
+            lines.append('{0}{1}_sum {2!r}'.format(prefix, name,
+                                                   histogram['sum']))
+            lines.append('{0}{1}_count {2}'.format(prefix, name,
+                                                   histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def __repr__(self):
+        return 'Metrics<counters: {0!r}, histograms: {1!r}>'.format(
+            self.counters, sorted(self.histograms))
+
+
+class Histogram(object):
+    """
+        Cumulative histogram of durations with fixed bucket bounds.
+    """
+
+    def __init__(self, buckets):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """
+            Return the count, sum and cumulative (bound, count) buckets, the
+            last bound being None for infinity.
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+#==========================================================================
+# Sinks
+#==========================================================================
+
+def log_sink(logger=None, level=logging.INFO):
+    """
+        Return a sink logging a summary of the metrics.
+    """
+    logger = logger or logging.getLogger('pymemento.metrics')
+
+    def sink(metrics):
+        snapshot = metrics.snapshot()
+        histograms = ', '.join(
+            '{0}={1:.6f}s/{2}'.format(name, histogram['sum'],
+                                      histogram['count'])
+            for name, histogram in sorted(snapshot['histograms'].items()))
+        counters = ', '.join('{0}={1}'.format(name, value) for name, value
+                             in sorted(snapshot['counters'].items()))
+        logger.log(level, 'pymemento metrics: %s; %s', counters, histograms)
+    return sink
+
+
+def prometheus_file_sink(path):
+    """
+        Return a sink writing the metrics in Prometheus text format to
+        'path' (e.g. for the node exporter's textfile collector).
+    """
+    def sink(metrics):
+        with open(path, 'w') as output:
+            output.write(metrics.to_prometheus())
+    return sink
+
+
+#==========================================================================
+# Process-wide metrics
+#==========================================================================
+
+_metrics = None
+
+
+def get_metrics():
+    """
+        Return the process-wide metrics, or None if instrumentation is
+        disabled (the default).
+    """
+    return _metrics
+
+
+def set_metrics(metrics):
+    """
+        Install 'metrics' as the process-wide metrics; None disables
+        instrumentation.
+    """
+    global _metrics
+    _metrics = metrics
+
+
+def enable(sink=None):
+    """
+        Install and return new process-wide metrics.
+    """
+    set_metrics(Metrics(sink))
+    return _metrics
+
+
+def disable():
+    set_metrics(None)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict, deque
+import multiprocessing
+import Queue
+import threading
+
+from .LinkTimemap import LinkTimemap
+from .Resource import OriginalResource
+from .Session import Session, host_key
+
+
+class Resolver(object):
+    """
+        Concurrent resolution of TimeGates and TimeMaps.
+
+        Requests run on a bounded pool of worker threads sharing one
+        pooled 'Session'; at most 'per_host' of them talk to the same
+        host at any time.  Calls are queued per host and a free worker
+        takes the next call of a host below its limit, taking hosts in
+        turn, so a saturated host never holds up the others.  Each call
+        returns immediately with an 'AsyncResult' whose 'get()' blocks
+        until the answer is known.  Responses are interpreted by
+        'Resource' and 'LinkTimemap' exactly as in the synchronous API.
+    """
+
+    def __init__(self, max_workers=16, per_host=4, session=None):
+        """
+            Initialize the worker pool.
+
+            Args:
+                max_workers: the maximum number of requests in flight.
+                per_host: the maximum number of requests in flight to
+                    any one host.
+                session: the HTTP session to use; by default a 'Session'
+                    with a connection pool of 'per_host' per host.
+        """
+        self._per_host = per_host
+        self._session = session or Session(pool_connections=max_workers,
+                                           pool_maxsize=per_host)
+        self._queues = OrderedDict()
+        self._active = dict()
+        self._ready = threading.Condition(threading.Lock())
+        self._closed = False
+        self._workers = []
+        for _ in range(max_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def resource(self, uri, cls=OriginalResource):
+        """
+            Fetch the headers of 'uri' in the background.
+
+            Returns:
+                An 'AsyncResult' for a 'cls' instance with its headers
+                loaded.
+        """
+        return self._submit(uri, self._resource, (uri, cls))
+
+    def timegate(self, uri_r):
+        """
+            Look up the URI-G of 'uri_r' in the background.
+
+            Returns:
+                An 'AsyncResult' for the URI-G, or None.
+        """
+        return self._submit(uri_r, self._relation, (uri_r, 'timegate'))
+
+    def timemap(self, uri_t, **kwargs):
+        """
+            Dereference and parse the URI-T 'uri_t' in the background.
+            Keyword arguments are passed on to 'LinkTimemap.from_uri'.
+
+            Returns:
+                An 'AsyncResult' for a 'LinkTimemap'.
+        """
+        return self._submit(uri_t, self._timemap, (uri_t, kwargs))
+
+    def as_completed(self, function, uris):
+        """
+            Apply 'function' to every URI in 'uris' concurrently, within
+            the per-host limits, generating results in completion order.
+
+            Args:
+                function: a callable taking a URI, e.g. 'timegate_uri'.
+                uris: an iterable of URIs.
+
+            Returns:
+                A generator of (uri, result, exception) tuples; exactly
+                one of 'result' and 'exception' is meaningful.
+        """
+        done = Queue.Queue()
+        count = 0
+        for uri in uris:
+            self._submit(uri, function, (uri,), done.put)
+            count += 1
+        for _ in range(count):
+            result = done.get()
+            yield (result.uri, result._value, result._error)
+
+    def probe(self, uri, relations):
+        """
+            Return the URIs of several relations of 'uri' (blocking),
+            using a single request.
+
+            Returns:
+                A dict mapping each relation to a URI, or None.
+        """
+        resource = OriginalResource(uri, self._session)
+        return dict((relation, resource.getURIFromRelation(relation))
+                    for relation in relations)
+
+    def timegate_uri(self, uri_r):
+        """
+            Return the URI-G of 'uri_r' (blocking); for 'as_completed'.
+        """
+        return OriginalResource(uri_r, self._session) \
+            .getURIFromRelation('timegate')
+
+    def timemap_uri(self, uri_r):
+        """
+            Return the URI-T of 'uri_r' (blocking); for 'as_completed'.
+        """
+        return OriginalResource(uri_r, self._session) \
+            .getURIFromRelation('timemap')
+
+    def close(self):
+        """
+            Stop the worker threads once pending requests are done.
+        """
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _resource(self, uri, cls):
+        resource = cls(uri, self._session)
+        resource.performRequestIfNecessary()
+        return resource
+
+    def _relation(self, uri, relation):
+        resource = self._resource(uri, OriginalResource)
+        return resource.getURIFromRelation(relation)
+
+    def _timemap(self, uri_t, kwargs):
+        kwargs.setdefault('session', self._session)
+        return LinkTimemap.from_uri(uri_t, **kwargs)
+
+    def _submit(self, uri, function, args, callback=None):
+        """
+            Queue the call function(*args) on the host of 'uri'.
+        """
+        result = _Result(uri, function, args, callback)
+        with self._ready:
+            if self._closed:
+                raise ValueError('Resolver is closed')
+            self._queues.setdefault(host_key(uri), deque()).append(result)
+            self._ready.notify()
+        return result
+
+    def _next(self):
+        """
+            Take the next call of the first host below its limit, and
+            move that host to the back of the line.  The lock must be
+            held.
+        """
+        for host, queue in self._queues.iteritems():
+            if self._active.get(host, 0) < self._per_host:
+                break
+        else:
+            return None
+        result = queue.popleft()
+        del self._queues[host]
+        if queue:
+            self._queues[host] = queue
+        self._active[host] = self._active.get(host, 0) + 1
+        return result
+
+    def _work(self):
+        while True:
+            with self._ready:
+                result = self._next()
+                while result is None:
+                    if self._closed and not self._queues:
+                        return
+                    self._ready.wait()
+                    result = self._next()
+            try:
+                result._run()
+            finally:
+                with self._ready:
+                    host = host_key(result.uri)
+                    self._active[host] -= 1
+                    if not self._active[host]:
+                        del self._active[host]
+                    self._ready.notify_all()
+
+
+class _Result(object):
+    """
+        The pending result of a call queued on a 'Resolver', with the
+        interface of 'multiprocessing.pool.AsyncResult'.
+    """
+
+    def __init__(self, uri, function, args, callback):
+        self.uri = uri
+        self._function = function
+        self._args = args
+        self._callback = callback
+        self._value = None
+        self._error = None
+        self._done = threading.Event()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def successful(self):
+        if not self.ready():
+            raise ValueError('{0!r} not ready'.format(self))
+        return self._error is None
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+
+    def get(self, timeout=None):
+        """
+            Return the result of the call, waiting at most 'timeout'
+            seconds, or raise the exception it raised.
+        """
+        self.wait(timeout)
+        if not self.ready():
+            raise multiprocessing.TimeoutError
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _run(self):
+        try:
+            self._value = self._function(*self._args)
+        except Exception as exc:
+            self._error = exc
+        self._done.set()
+        if self._callback is not None:
+            self._callback(self)
+
+
+_resolver = None
+
+
+def get_resolver():
+    """
+        Return the process-wide resolver, creating it on first use.
+    """
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+    return _resolver
+
+
+def set_resolver(resolver):
+    """
+        Replace the process-wide resolver, closing the previous one once
+        its pending requests are done.  With None, the next use creates
+        a new default resolver.
+    """
+    global _resolver
+    previous, _resolver = _resolver, resolver
+    if previous is not None and previous is not resolver:
+        previous.close()
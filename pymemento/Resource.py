@@ -2,7 +2,16 @@
 from __future__ import absolute_import, division, print_function
 from __future__ import unicode_literals
 
-import requests
+from collections import OrderedDict
+import threading
+import urlparse
+
+from .HeaderCache import get_cache
+from .LinkParser import LinkParser
+from .LinkTimemap import BaseURI, LinkTimemap, MementoLink, TimemapLink
+from .LinkWriter import LinkWriter
+from .Metrics import get_metrics
+from .Session import get_session, host_key
 
 
 class Resource(object):
@@ -11,15 +20,152 @@ class Resource(object):
         the response headers returned from a request sent to the URI.
     """
 
-    def __init__(self, URI):
+    MAX_REDIRECTS = 5
+
+    def __init__(self, URI, session=None, cache=None):
         """
             Initialize the private member variables.
 
-            Data other than the URI is lazy-loaded.
+            Data other than the URI is lazy-loaded.  Requests are sent
+            through 'session', or the process-wide session if None.
+            Response headers are shared through 'cache', or the
+            process-wide 'HeaderCache' if None.
         """
         self._uri = URI
+        self._session = session
+        self._cache = cache
         self._headers = None
         self._request = None
+        self._links = None
+
+    @staticmethod
+    def probe_many(uris, relations=('timegate', 'timemap'), workers=8,
+                   per_host=4, session=None, progress=None, cancel=None,
+                   errors=None):
+        """
+            Look up the given relations for many URIs concurrently.
+
+            Each distinct URI is requested once, however many relations
+            are asked for.  Requests run on a pool of 'workers' threads
+            sharing one connection pool, with at most 'per_host' in
+            flight to any one host.
+
+            Args:
+                uris: an iterable of URIs.
+                relations: the link relations to look up.
+                workers: the number of worker threads.
+                per_host: the maximum number of requests per host.
+                session: the HTTP session to use; by default a pooled
+                    'Session' sized for 'workers'.
+                progress: an optional callable, called as
+                    progress(done, total, uri) after every URI.
+                cancel: an optional 'threading.Event'; once set, no
+                    further requests are started and the URIs probed
+                    so far are returned.
+                errors: an optional dict receiving the exception raised
+                    for each URI that could not be probed.
+
+            Returns:
+                A dict mapping each probed URI to a dict of relation to
+                URI (None where the relation is absent).
+        """
+        from .Resolver import Resolver
+
+        uris = list(OrderedDict.fromkeys(uris))
+        results = dict()
+
+        with Resolver(workers, per_host, session) as resolver:
+            def probe(uri):
+                if cancel is not None and cancel.is_set():
+                    return None
+                return resolver.probe(uri, relations)
+
+            done = 0
+            for uri, found, exc in resolver.as_completed(probe, uris):
+                if exc is not None:
+                    if errors is not None:
+                        errors[uri] = exc
+                elif found is not None:
+                    results[uri] = found
+                done += 1
+                if progress is not None:
+                    progress(done, len(uris), uri)
+                if cancel is not None and cancel.is_set():
+                    break
+
+        return results
+
+    def resolve(self, datetime):
+        """
+            Find the memento of this URI, taken as a URI-R, selected by
+            its TimeGate for 'datetime' (RFC 7089 datetime negotiation).
+
+            The request to the URI-R carries 'Accept-Datetime', so that
+            when the URI-R is its own TimeGate (patterns 1.1 and 1.2) a
+            single request suffices; otherwise its 'timegate' link is
+            followed with a second one (patterns 2.1 and 2.2).  The
+            pattern is remembered per host, and when the URI-G is the
+            URI-R behind a fixed prefix (as with most web archives),
+            further URI-Rs of that host go to their TimeGate directly.
+
+            Args:
+                datetime: the datetime wanted; a naive one is taken to
+                    be UTC.
+
+            Returns:
+                A 'MementoResource' for the URI-M selected, or None if
+                no TimeGate negotiated.  With 200-style negotiation its
+                headers are those already received.
+        """
+        accept = {'Accept-Datetime': LinkWriter().format_date(datetime)}
+        uri_r = self._uri
+
+        prefix = Resource.getDetectedPattern(uri_r)[1]
+        if prefix is not None:
+            memento = self._negotiated(prefix + uri_r,
+                                       self._head(prefix + uri_r, accept),
+                                       True)
+            if memento is not None:
+                return memento
+            _forgetPattern(uri_r)
+
+        for _ in range(Resource.MAX_REDIRECTS + 1):
+            response = self._head(uri_r, accept)
+            memento = self._negotiated(uri_r, response, False)
+            if memento is not None:
+                _storePattern(uri_r, '1.2' if memento._headers is not None
+                              else '1.1', None)
+                return memento
+            uri_g = self._getLinks(response.headers, uri_r).uri('timegate')
+            if uri_g is not None and uri_g != uri_r:
+                memento = self._negotiated(uri_g, self._head(uri_g, accept),
+                                           True)
+                if memento is not None:
+                    prefix = uri_g[:-len(uri_r)] \
+                        if uri_g.endswith(uri_r) else None
+                    _storePattern(uri_r, '2.2' if memento._headers is not None
+                                  else '2.1', prefix)
+                return memento
+            if not response.is_redirect:
+                return None
+            uri_r = urlparse.urljoin(uri_r, response.headers['location'])
+        return None
+
+    @staticmethod
+    def getDetectedPattern(uri):
+        """
+            Return the RFC 7089 pattern ('1.1', '1.2', '2.1' or '2.2')
+            detected by 'resolve' for the host of 'uri', and the prefix
+            turning its URI-Rs into URI-Gs (or None), as a tuple; both
+            are None if nothing was detected yet.
+        """
+        with _patternsLock:
+            return _patterns.get(host_key(uri), (None, None))
+
+    @staticmethod
+    def clearDetectedPatterns():
+        with _patternsLock:
+            _patterns.clear()
 
     def getURIFromRelation(self, relation):
         """
@@ -29,34 +175,216 @@ class Resource(object):
         self.performRequestIfNecessary()
         return self._getURIFromRelation(self._headers, relation)
 
+    def getAllURIsFromRelation(self, relation):
+        """
+            Get every URI from the Link header associated with the given
+            relation, in order.
+        """
+        self.performRequestIfNecessary()
+        return self._getLinks(self._headers).uris(relation)
+
+    def relations(self):
+        """
+            Get the relation types present in the Link header, in order
+            of appearance.
+        """
+        self.performRequestIfNecessary()
+        return self._getLinks(self._headers).relations()
+
+    def getFirstMemento(self):
+        """
+            Get the 'MementoLink' of the first memento from the Link
+            header, or None.
+        """
+        return self._getMemento('first')
+
+    def getLastMemento(self):
+        """
+            Get the 'MementoLink' of the last memento from the Link
+            header, or None.
+        """
+        return self._getMemento('last')
+
+    def getPrevMemento(self):
+        """
+            Get the 'MementoLink' of the previous memento from the Link
+            header, or None.
+        """
+        return self._getMemento('prev')
+
+    def getNextMemento(self):
+        """
+            Get the 'MementoLink' of the next memento from the Link
+            header, or None.
+        """
+        return self._getMemento('next')
+
+    def getTimemapLinks(self):
+        """
+            Get the 'TimemapLink's from the Link header.
+        """
+        self.performRequestIfNecessary()
+        return self._getLinks(self._headers).timemaps()
+
+    def getTimemap(self):
+        """
+            Build a 'LinkTimemap' from the links of the Link header,
+            without further requests; archives embed whole timemaps
+            there.  Relative URIs are resolved against this URI.
+        """
+        self.performRequestIfNecessary()
+        return LinkTimemap.from_links(self._getLinks(self._headers).links,
+                                      self._uri)
+
     def performRequestIfNecessary(self):
         """
             This is the lazy loading for this class.  If we haven't 
             performed the request yet, do so to fill the private
-            member variables.
+            member variables.  Fresh headers from the cache, if any,
+            are used instead of a request.
         """
         if self._headers == None:
-            self.repeatRequest()
+            cache = self._getCache()
+            if cache is not None:
+                self._headers = cache.get(self._uri)
+            if self._headers == None:
+                self.repeatRequest()
 
     def repeatRequest(self):
         """
             Using the same URI, re-execute the request to fill the
-            response headers list.
+            response headers list.  If the cache holds an entry for the
+            URI, the request is made conditional on it.
         """
-        self._request = requests.head(url=self._uri)
+        cache = self._getCache()
+        conditions = cache.validators(self._uri) if cache is not None else {}
+        self._request = self._head(self._uri, conditions)
         self._headers = self._request.headers
+        if cache is None:
+            return
+        if self._request.status_code == 304 and conditions:
+            headers = cache.revalidate(self._uri)
+            if headers is not None:
+                self._headers = headers
+                return
+            # The entry was evicted meanwhile, and a 304 has no links
+            self._request = self._head(self._uri, {})
+            self._headers = self._request.headers
+        if self._request.status_code < 500:
+            cache.store(self._uri, self._headers)
+
+    def _head(self, uri, headers):
+        session = self._session or get_session()
+        response = session.head(url=uri, headers=headers,
+                                allow_redirects=False)
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.count('http_requests')
+            metrics.observe('http_seconds', response.elapsed.total_seconds())
+        return response
+
+    def _negotiated(self, uri, response, timegate):
+        """
+            Return a 'MementoResource' for the memento 'response' points
+            to, if it is the result of datetime negotiation.  Responses
+            from a URI-R only count if they vary on 'Accept-Datetime'.
+        """
+        headers = response.headers
+        if not timegate and \
+               'accept-datetime' not in headers.get('vary', '').lower():
+            return None
+        if response.is_redirect:
+            return MementoResource(
+                urlparse.urljoin(uri, headers['location']),
+                self._session, self._cache)
+        if response.status_code == 200 and 'memento-datetime' in headers:
+            memento = MementoResource(
+                urlparse.urljoin(uri, headers.get('content-location', uri)),
+                self._session, self._cache)
+            memento._headers = headers
+            memento._request = response
+            return memento
+        return None
+
+    def _getCache(self):
+        if self._cache is not None:
+            return self._cache
+        return get_cache()
 
     def _getURIFromRelation(self, headers, relation):
-        uri = None
+        return self._getLinks(headers).uri(relation)
+
+    def _getLinks(self, headers, uri=None):
+        """
+            Return the parsed Link header of 'headers', received from
+            'uri' (by default this URI), parsing it only once for this
+            resource's own headers.
+        """
+        if self._links is not None and self._links.headers is headers:
+            return self._links
+        links = LinkHeader(headers, uri or self._uri)
+        if headers is self._headers:
+            self._links = links
+        return links
+
+    def _getMemento(self, relation):
+        self.performRequestIfNecessary()
+        return self._getLinks(self._headers).memento(relation)
 
+
+class LinkHeader(object):
+    """
+        The links of a response's Link header, indexed by relation type.
+    """
+
+    def __init__(self, headers, base_uri=None):
+        """
+            Parse the Link header, if any, of 'headers', resolving the
+            link URIs against 'base_uri', the URI of the response.
+        """
+        self.headers = headers
+        self.links = []
         if 'link' in headers:
-            for entry in requests.utils.parse_header_links(headers['link']):
-                if 'rel' in entry:
-                    if relation in entry['rel']:
-                        uri = entry['url'] 
-                        break
+            self.links = list(
+                LinkParser(strict=False).parse(headers['link']))
+        if base_uri is not None:
+            resolve = BaseURI(base_uri).resolve
+            self.links = [(link[0], resolve(link[1])) + tuple(link[2:])
+                          for link in self.links]
+        self._relations = OrderedDict()
+        for link in self.links:
+            for rel in link[0]:
+                self._relations.setdefault(rel, []).append(link)
+
+    def relations(self):
+        return list(self._relations)
+
+    def uris(self, relation):
+        return [link[1] for link in self._relations.get(relation, ())]
+
+    def uri(self, relation):
+        links = self._relations.get(relation)
+        return links[0][1] if links else None
+
+    def memento(self, relation):
+        """
+            Return the 'MementoLink' of the first memento link with the
+            given relation, or None.
+        """
+        for link in self._relations.get(relation, ()):
+            (rels, uri, memento_dt, mime_type, license) = link[:5]
+            if 'memento' in rels:
+                return MementoLink(
+                    LinkTimemap._currate_datetime(memento_dt, uri), uri,
+                    rels, license)
+        return None
 
-        return uri
+    def timemaps(self):
+        return [TimemapLink(uri, LinkTimemap._currate_datetime(from_dt),
+                            LinkTimemap._currate_datetime(until_dt),
+                            mime_type)
+                for (rels, uri, memento_dt, mime_type, license, from_dt,
+                     until_dt) in self._relations.get('timemap', ())]
 
 
 class OriginalResource(Resource):
@@ -81,4 +409,23 @@ class MementoResource(Resource):
         """
             Extract the Memento-Datetime from the response headers.
         """
+        self.performRequestIfNecessary()
         return self._headers['Memento-Datetime']
+
+
+#==========================================================================
+# Negotiation patterns detected per host
+#==========================================================================
+
+_patterns = dict()
+_patternsLock = threading.Lock()
+
+
+def _storePattern(uri, pattern, prefix):
+    with _patternsLock:
+        _patterns[host_key(uri)] = (pattern, prefix)
+
+
+def _forgetPattern(uri):
+    with _patternsLock:
+        _patterns.pop(host_key(uri), None)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+class Session(requests.Session):
+    """
+        HTTP session with connection pooling, retries and default
+        timeouts, shared by 'Resource' and 'LinkTimemap.from_uri'.
+
+        Connections are kept alive and reused per host; at most
+        'pool_maxsize' connections are kept open to any one host.
+        Requests failing with a connection error or a 502, 503 or 504
+        status are retried up to 'max_retries' times, sleeping
+        'backoff_factor' * 2 ** (retry - 1) seconds in between.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=3,
+                 backoff_factor=0.3, timeout=(5, 30)):
+        """
+            Initialize the session.
+
+            Args:
+                pool_connections: the number of hosts to keep pools for.
+                pool_maxsize: the maximum number of connections per host.
+                max_retries: the number of times a request is retried.
+                backoff_factor: the base of the exponential retry delay.
+                timeout: the default timeout, in seconds, of requests
+                    that do not specify one; a (connect, read) tuple or
+                    a single number.
+        """
+        super(Session, self).__init__()
+        self.timeout = timeout
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                      status_forcelist=Session.RETRY_STATUSES,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+            Send a request, applying the default timeout if none is given.
+        """
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(Session, self).request(method, url, **kwargs)
+
+
+def host_key(uri):
+    """
+        Return the lowercased (scheme, netloc) pair of 'uri', which
+        identifies the host that limits and patterns are kept for;
+        connections are pooled per scheme and host alike.
+    """
+    scheme, netloc = urlparse.urlsplit(uri)[:2]
+    return (scheme.lower(), netloc.lower())
+
+
+_session = None
+
+
+def get_session():
+    """
+        Return the process-wide session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        _session = Session()
+    return _session
+
+
+def set_session(session):
+    """
+        Replace the process-wide session.
+
+        Any object providing the 'requests.Session' interface may be
+        used, e.g. a 'Session' with different pool or retry settings.
+    """
+    global _session
+    _session = session
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import threading
+from wsgiref.simple_server import make_server
+
+from .LinkParser import LinkParser
+from .LinkTimemap import LinkTimemap, MementoLink
+from .LinkWriter import LinkWriter
+
+
+class TimeGate(object):
+    """
+    RFC 7089 TimeGate answering datetime negotiation from local timemaps,
+    as a WSGI application.
+
+    A request for '<prefix><URI-R>' with an 'Accept-Datetime' header is
+    redirected (302, pattern 2.1 of RFC 7089) to the memento of URI-R
+    closest to that datetime, or to the latest memento without the header.
+    The response carries 'Vary: accept-datetime' and a 'Link' header with
+    the original, the timemap, and the first, last, previous and next
+    mementos relative to the one selected.
+
+    Timemaps are either given up front ('timemaps') or obtained from
+    'loader' on first use and kept in an LRU of 'maxsize' entries; a
+    timemap is loaded once however many requests ask for it meanwhile,
+    the others waiting for that load.  The counters 'hits' and 'misses'
+    record how lookups were answered.
+    Selection uses the timemaps' sorted datetime index, so it takes
+    logarithmic time.
+    """
+
+    def __init__(self, timemaps=None, loader=None, maxsize=1000,
+                 prefix='/timegate/'):
+        """
+        Initialize a new 'TimeGate'.
+
+        Args:
+            timemaps: an optional dict mapping URI-Rs to 'LinkTimemap's,
+                which are always kept.
+            loader: an optional callable, called as loader(uri_r), returning
+                the 'LinkTimemap' of a URI-R or None; e.g. the 'get' of a
+                'TimemapCache' keyed on URI-R.
+            maxsize: the number of loaded timemaps kept.
+            prefix: the path under which URI-Rs are appended.
+        """
+        self._pinned = dict((LinkTimemap.normalize_uri(uri_r), timemap)
+                            for uri_r, timemap in (timemaps or {}).items())
+        self._loader = loader
+        self._loaded = OrderedDict()
+        self._loading = dict()
+        self._lock = threading.Lock()
+        self.maxsize = maxsize
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix) \
+               or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self._respond(start_response, 404, [])
+        uri_r = path[len(self.prefix):]
+        # Proxies and servers tend to merge the slashes of 'http://'
+        for scheme in ('http:/', 'https:/'):
+            if uri_r.startswith(scheme) and not uri_r.startswith(scheme + '/'):
+                uri_r = scheme + uri_r[len(scheme) - 1:]
+        if environ.get('QUERY_STRING'):
+            uri_r += '?' + environ['QUERY_STRING']
+        status, headers = self.negotiate(
+            uri_r, environ.get('HTTP_ACCEPT_DATETIME'))
+        return self._respond(start_response, status, headers)
+
+    def negotiate(self, uri_r, accept_datetime=None):
+        """
+        Select the memento of 'uri_r' for an 'Accept-Datetime' value.
+
+        Args:
+            uri_r: the URI-R.
+            accept_datetime: the value of the 'Accept-Datetime' request
+                header, or None for the latest memento.
+
+        Returns:
+            A (status, headers) pair: 302 with the headers of the redirect,
+            400 if 'accept_datetime' is not a date, or 404 if no mementos
+            of 'uri_r' are known.
+        """
+        timemap = self.timemap(uri_r)
+        if timemap is None or timemap.first is None:
+            return 404, []
+        if accept_datetime is None:
+            selected = timemap.last
+        else:
+            try:
+                wanted = LinkParser.parse_http_date(accept_datetime)
+            except (ValueError, OverflowError, TypeError):
+                return 400, [('Vary', 'accept-datetime')]
+            selected = timemap.nearest(wanted)
+        uri_m = _memento(timemap, selected).uri_m
+        return 302, [('Location', _native(uri_m)),
+                     ('Vary', 'accept-datetime'),
+                     ('Link', self.link_header(timemap, uri_r, selected))]
+
+    def link_header(self, timemap, uri_r, selected):
+        """
+        Build the 'Link' header of a redirect to the memento at 'selected'.
+        """
+        writer = LinkWriter()
+        links = [writer.original_link(timemap.original_uri or uri_r)]
+        link = timemap.self_link or (timemap.timemaps or [None])[0]
+        if link is not None:
+            links.append(writer.timemap_link(link, 'timemap'))
+        relations = OrderedDict()
+        for rel, memento_datetime in (('first', timemap.first),
+                                      ('prev', timemap.before(selected)),
+                                      (None, selected),
+                                      ('next', timemap.after(selected)),
+                                      ('last', timemap.last)):
+            if memento_datetime is not None:
+                rels = relations.setdefault(memento_datetime, [])
+                if rel is not None:
+                    rels.append(rel)
+        for memento_datetime, rels in relations.items():
+            memento = _memento(timemap, memento_datetime)
+            links.append(writer.memento_link(MementoLink(
+                memento_datetime, memento.uri_m, rels or None,
+                memento.license_uri)))
+        return _native(b', '.join(links))
+
+    def timemap(self, uri_r):
+        """
+        Return the timemap of 'uri_r', loading it if necessary, or None.
+        """
+        key = LinkTimemap.normalize_uri(uri_r)
+        timemap = self._pinned.get(key)
+        if timemap is not None:
+            return timemap
+        with self._lock:
+            timemap = self._loaded.pop(key, None)
+            if timemap is not None:
+                self._loaded[key] = timemap
+                self.hits += 1
+                return timemap
+            loading = self._loading.get(key)
+            waiting = loading is not None
+            if waiting:
+                self.hits += 1
+            else:
+                self.misses += 1
+                if self._loader is None:
+                    return None
+                loading = self._loading[key] = _Loading()
+        if waiting:
+            # Another request is loading the timemap
+            loading.done.wait()
+            return loading.timemap
+        try:
+            timemap = loading.timemap = self._loader(uri_r)
+            if timemap is not None:
+                with self._lock:
+                    self._loaded[key] = timemap
+                    while len(self._loaded) > self.maxsize:
+                        self._loaded.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.done.set()
+        return timemap
+
+    def _respond(self, start_response, status, headers):
+        reasons = {302: 'Found', 400: 'Bad Request', 404: 'Not Found'}
+        start_response(str('{0} {1}'.format(status, reasons[status])),
+                       [(str(name), str(value)) for name, value
+                        in headers + [('Content-Length', '0')]])
+        return []
+
+
+class _Loading(object):
+    """
+    A timemap being loaded, for the requests waiting for it.
+    """
+
+    def __init__(self):
+        self.timemap = None
+        self.done = threading.Event()
+
+
+def serve(timegate, host='127.0.0.1', port=8080):
+    """
+    Serve 'timegate' with the standard library's WSGI server until
+    interrupted, e.g. for local load tests.
+    """
+    server = make_server(host, port, timegate)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def _memento(timemap, memento_datetime):
+    """
+    Pick one memento at 'memento_datetime', the same on every request.
+    """
+    return min(timemap[memento_datetime], key=lambda m: _utf8(m.uri_m))
+
+
+def _utf8(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+def _native(value):
+    """
+    Header values must be native strings under WSGI.
+    """
+    return str(_utf8(value))
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+from __future__ import unicode_literals
+
+import json
+import sqlite3
+import time
+
+from .LinkTimemap import LinkTimemap, MementoLink, TimemapLink
+from .LinkTimemap import CompactMementos, MementoDict, to_epoch, from_epoch
+from .Session import get_session
+
+
+class TimemapCache(object):
+    """
+    Disk-backed cache of parsed timemaps, stored in an SQLite database.
+
+    'get' answers from the database without any network access or parsing
+    once a URI-T has been fetched.  With 'refresh=True' the timemap is
+    brought up to date incrementally:
+
+        - every page is requested conditionally on the ETag/Last-Modified
+          of its previous response, so unchanged pages cost a 304;
+        - of a paginated timemap, only the pages whose 'until' bound is not
+          before the latest cached memento are requested again;
+        - the mementos found are merged into those already cached.
+
+    Mementos that an archive removes are therefore not removed from the
+    cache; use 'discard' to drop a timemap and fetch it afresh.  The time
+    of the last refresh is kept, so that 'get' can refresh only timemaps
+    older than 'max_age'.
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS timemaps ('
+        '  uri_t TEXT PRIMARY KEY, original_uri TEXT, timegate_uris TEXT,'
+        '  timemaps TEXT, fetched REAL)',
+        'CREATE TABLE IF NOT EXISTS pages ('
+        '  uri_t TEXT, page_uri TEXT, etag TEXT, last_modified TEXT,'
+        '  PRIMARY KEY (uri_t, page_uri))',
+        'CREATE TABLE IF NOT EXISTS mementos ('
+        '  uri_t TEXT, epoch INTEGER, uri_m TEXT, rels TEXT, license TEXT,'
+        '  PRIMARY KEY (uri_t, epoch, uri_m))',
+    ]
+
+    def __init__(self, path, session=None, clock=time.time):
+        """
+        Open (or create) the cache database at 'path'.
+
+        Args:
+            path: the file name of the SQLite database.
+            session: the HTTP session to use, or None for the process-wide
+                session.
+            clock: a callable returning the current time in seconds.
+        """
+        self._db = sqlite3.connect(path)
+        self._session = session
+        self._clock = clock
+        with self._db:
+            for statement in TimemapCache.SCHEMA:
+                self._db.execute(statement)
+
+    def get(self, uri_t, refresh=False, compact=False, max_age=None):
+        """
+        Return the timemap of 'uri_t', fetching it only if it is not cached,
+        if 'refresh' is set or if it was last refreshed over 'max_age'
+        seconds ago.
+
+        Args:
+            uri_t: the URI-T of the timemap.
+            refresh: bring the cached timemap up to date first.
+            compact: store the mementos in a 'CompactMementos'.
+            max_age: the number of seconds after which the cached timemap
+                is brought up to date, or None to keep it until 'refresh'.
+
+        Returns:
+            A LinkTimemap.
+        """
+        row = self._db.execute('SELECT fetched FROM timemaps WHERE uri_t = ?',
+                               (uri_t,)).fetchone()
+        cached = row is not None
+        if max_age is not None and cached \
+               and row[0] + max_age < self._clock():
+            refresh = True
+        if not cached or refresh:
+            self._update(uri_t, cached)
+        return self._load(uri_t, compact)
+
+    def discard(self, uri_t):
+        """
+        Remove the timemap of 'uri_t' from the cache.
+        """
+        with self._db:
+            for table in ('timemaps', 'pages', 'mementos'):
+                self._db.execute('DELETE FROM %s WHERE uri_t = ?' % table,
+                                 (uri_t,))
+
+    def close(self):
+        self._db.close()
+
+    #==========================================================================
+    # Fetching
+    #==========================================================================
+
+    def _update(self, uri_t, incremental):
+        """
+        Fetch the pages of 'uri_t' and merge them into the database.
+        """
+        latest = None
+        if incremental:
+            latest = self._db.execute(
+                'SELECT MAX(epoch) FROM mementos WHERE uri_t = ?',
+                (uri_t,)).fetchone()[0]
+        pending = [uri_t]
+        seen = set(pending)
+        while pending:
+            page_uri = pending.pop(0)
+            page = self._fetch(uri_t, page_uri, incremental)
+            if page is None:
+                if page_uri != uri_t:
+                    continue
+                page = self._load(uri_t, False, mementos=False)
+            elif page_uri == uri_t:
+                self._store_header(uri_t, page)
+            for link in page.timemaps:
+                if link.uri_t in seen:
+                    continue
+                seen.add(link.uri_t)
+                if latest is not None and link.until_dt is not None \
+                       and to_epoch(link.until_dt) < latest:
+                    continue
+                pending.append(link.uri_t)
+        with self._db:
+            self._db.execute('UPDATE timemaps SET fetched = ? WHERE uri_t = ?',
+                             (self._clock(), uri_t))
+
+    def _fetch(self, uri_t, page_uri, conditional):
+        """
+        Fetch and store one page.
+
+        Returns:
+            The parsed page, or None if it has not been modified.
+        """
+        headers = {'Accept': LinkTimemap.ACCEPT}
+        if conditional:
+            row = self._db.execute(
+                'SELECT etag, last_modified FROM pages '
+                'WHERE uri_t = ? AND page_uri = ?',
+                (uri_t, page_uri)).fetchone()
+            if row is not None and row[0] is not None:
+                headers['If-None-Match'] = row[0]
+            if row is not None and row[1] is not None:
+                headers['If-Modified-Since'] = row[1]
+        session = self._session or get_session()
+        response = session.get(page_uri, stream=True, headers=headers)
+        try:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            parser = LinkTimemap._link_stream(response)
+            page = LinkTimemap._from_link_stream(parser, page_uri)
+        finally:
+            response.close()
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                (uri_t, page_uri, response.headers.get('etag'),
+                 response.headers.get('last-modified')))
+            self._db.executemany(
+                'INSERT OR REPLACE INTO mementos VALUES (?, ?, ?, ?, ?)',
+                ((uri_t, to_epoch(memento.memento_datetime),
+                  _text(memento.uri_m), ' '.join(memento.rels or ()),
+                  _text(memento.license_uri))
+                 for mementos in page.mementos.itervalues()
+                 for memento in mementos))
+        return page
+
+    #==========================================================================
+    # Storage
+    #==========================================================================
+
+    def _store_header(self, uri_t, timemap):
+        timemaps = [link.to_row() for link in timemap.timemaps]
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO timemaps VALUES (?, ?, ?, ?, ?)',
+                (uri_t, _text(timemap.original_uri),
+                 json.dumps([_text(uri) for uri in timemap.timegate_uris]),
+                 json.dumps(timemaps), self._clock()))
+
+    def _load(self, uri_t, compact, mementos=True):
+        """
+        Build a 'LinkTimemap' from the database.
+        """
+        original_uri, timegate_uris, timemaps = self._db.execute(
+            'SELECT original_uri, timegate_uris, timemaps FROM timemaps '
+            'WHERE uri_t = ?', (uri_t,)).fetchone()
+        timemap = LinkTimemap(original_uri, json.loads(timegate_uris),
+                              [TimemapLink.from_row(row)
+                               for row in json.loads(timemaps)])
+        if not mementos:
+            return timemap
+        rows = self._db.execute(
+            'SELECT epoch, uri_m, rels, license FROM mementos '
+            'WHERE uri_t = ? ORDER BY epoch', (uri_t,))
+        links = (MementoLink(from_epoch(epoch), uri_m, rels.split(), license)
+                 for epoch, uri_m, rels, license in rows)
+        if compact:
+            timemap.mementos = CompactMementos(links)
+        else:
+            timemap.mementos = MementoDict()
+            for link in links:
+                timemap.add_memento(link)
+            timemap._reindex()
+        # Each page marked its own first and last mementos
+        LinkTimemap._mark_ends(timemap)
+        return timemap
+
+
+def _text(value):
+    """
+    Decode byte strings (as parsed from a raw HTTP body) for SQLite.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
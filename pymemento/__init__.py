@@ -6,5 +6,10 @@ from .LinkTimemap import LinkTimemap
 from .Resource import Resource
 from .Resource import OriginalResource
 from .Resource import MementoResource
+from .Session import Session
+from .HeaderCache import HeaderCache
+from .Resolver import Resolver
+from .Metrics import Metrics
+from .TimeGate import TimeGate
 
 #end
@@ -0,0 +1,88 @@
+import BaseHTTPServer
+import SocketServer
+import socket
+import threading
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local HTTP stand-in for archives in tests.
+
+    'routes' maps a path to a (status, headers, body) tuple, or to a list
+    of such tuples served one after the other (the last one repeats).
+    Every request is recorded in 'log' as (method, path, headers, client
+    port), the port telling whether a connection was reused.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, routes=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           StubHandler)
+        self.routes = routes or {}
+        self.log = []
+        self.connections = []
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+
+    def url(self, path='/'):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], path)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.thread.join()
+
+    def handle_error(self, request, client_address):
+        pass
+
+    def respond(self, method, path, headers, port):
+        self.log.append((method, path, headers, port))
+        route = self.routes.get(path, (404, {}, ''))
+        if isinstance(route, list):
+            if len(route) > 1:
+                return route.pop(0)
+            return route[0]
+        if callable(route):
+            return route(method, path, headers)
+        return route
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections.append(self.connection)
+
+    def do_HEAD(self):
+        self.reply(False)
+
+    def do_GET(self):
+        self.reply(True)
+
+    def reply(self, with_body):
+        status, headers, body = self.server.respond(
+            self.command, self.path, dict(self.headers.items()),
+            self.client_address[1])
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
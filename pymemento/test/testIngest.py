@@ -0,0 +1,75 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+
+import pymemento
+from pymemento import Ingest
+
+
+TIMEMAP = """<http://a.example.org>;rel="original",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = os.path.join(self.directory, 'timemaps')
+        os.makedirs(os.path.join(self.root, 'sub'))
+        for i in range(5):
+            name = os.path.join(self.root, 'sub' if i % 2 else '', '%d.lf' % i)
+            with open(name, 'wb') as tmfile:
+                tmfile.write(TIMEMAP)
+        with open(os.path.join(self.root, 'broken.lf'), 'wb') as tmfile:
+            tmfile.write('<http://a.example.org>;rel="original";bogus="1"')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testIngest(self):
+        errors = {}
+        reports = []
+        results = list(Ingest.ingest(Ingest.find_timemaps(self.root, '*.lf'),
+            base_uri='http://arxiv.example.net/', processes=2, chunksize=2,
+            max_pending=1, errors=errors, progress=reports.append))
+
+        self.assertEquals(5, len(results))
+        self.assertEquals([os.path.join(self.root, 'broken.lf')], list(errors))
+        for path, tm in results:
+            self.assertEquals(2, len(tm.mementos))
+            self.assertEquals('http://arxiv.example.net/web/20000620180259/'
+                              'http://a.example.org',
+                              list(tm[tm.first])[0].uri_m)
+        self.assertEquals(10, reports[-1].mementos)
+        self.assertEquals(6, reports[-1].files)
+
+    def testStore(self):
+        store = os.path.join(self.directory, 'store')
+        output = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = StringIO()
+        try:
+            status = Ingest.main([self.root, '--store', store,
+                '--pattern', '*.lf', '--processes', '2', '--quiet'])
+            report = sys.stdout.getvalue()
+        finally:
+            sys.stdout, sys.stderr = output
+        self.assertEquals(1, status)
+        self.assertIn('6 files (1 failed), 10 mementos', report)
+
+        stored = os.path.join(store, 'sub', '1.lf.tm')
+        self.assertTrue(os.path.isfile(stored))
+        tm = pymemento.LinkTimemap.load(stored)
+        self.assertEquals(2, len(tm.mementos))
+        tm.mementos.close()
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestIngest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,113 @@
+import unittest
+import dateutil.parser
+
+from pymemento.LinkParser import LinkParser
+
+
+class TestLinkParser(unittest.TestCase):
+
+    def test_parse_http_date(self):
+
+        for raw in ["Tue, 20 Jun 2000 18:02:59 GMT",
+                    "Wed, 09 Apr 2008 20:30:51 GMT",
+                    "Sun, 29 Feb 2004 00:00:00 GMT",
+                    "Tue, 20 Jun 2000 18:02:59 +0200",
+                    "2000-06-20T18:02:59Z"]:
+            self.assertEquals(dateutil.parser.parse(raw),
+                LinkParser.parse_http_date(raw), raw)
+
+    def test_parse_links(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+    <http://arxiv.example.net/timemap/http://a.example.org>
+      ; rel="self";type="application/link-format"
+      ; from="Tue, 20 Jun 2000 18:02:59 GMT",
+    <http://arxiv.example.net/web/20000620180259/http://a.example.org>
+      ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT"
+      ; license="http://creativecommons.org/publicdomain/zero/1.0/",
+    <http://arxiv.example.net/web/20000621011731/http://a.example.org>
+      ; rel="memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT",
+"""
+
+        links = list(LinkParser().parse(timemap))
+
+        self.assertEquals(4, len(links))
+        self.assertEquals(['original'], links[0][0])
+        self.assertEquals("application/link-format", links[1][3])
+        self.assertIsNone(links[1][6])
+        self.assertEquals(['first', 'memento'], links[2][0])
+        self.assertEquals(
+            dateutil.parser.parse("Tue, 20 Jun 2000 18:02:59 GMT"), links[2][2])
+        # parameters do not carry over from one link to the next
+        self.assertIsNone(links[3][4])
+
+    def test_parse_blocks(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT"
+  ; license="http://creativecommons.org/publicdomain/zero/1.0/",
+<http://arxiv.example.net/web/20000621011731/http://a.example.org>
+  ; rel="last memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT"
+"""
+
+        expected = list(LinkParser().parse(timemap))
+
+        for size in range(1, len(timemap)):
+            blocks = [timemap[i:i + size]
+                      for i in range(0, len(timemap), size)]
+            self.assertEquals(expected,
+                list(LinkParser().parse_blocks(blocks)),
+                "block size " + str(size))
+
+    def test_feed(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/web/20000620180259/caf\xc3\xa9>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/web/20000621011731/http://a.example.org>
+  ; rel="last memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT"
+"""
+
+        expected = list(LinkParser().parse(timemap.decode('utf-8')))
+        self.assertEquals(u"http://arxiv.example.net/web/20000620180259/caf\xe9",
+                          expected[1][1])
+
+        for split in range(len(timemap)):
+            parser = LinkParser('utf-8')
+            first = parser.feed(timemap[:split])
+            second = parser.feed(timemap[split:])
+            self.assertEquals(expected, first + second + parser.close(),
+                              "split at " + str(split))
+            # a link is reported as soon as its separator has been fed
+            self.assertEquals(2, len(first + second))
+
+        self.assertRaises(ValueError, parser.feed, "")
+
+    def test_parse_header(self):
+
+        header = ('<http://a.example.org>; rel=original; title="A, B", '
+                  '<http://arxiv.example.net/timemap/http://a.example.org>'
+                  '; rel="timemap"; type="application/link-format"'
+                  '; anchor="#x", '
+                  '<http://arxiv.example.net/web/2000/http://a.example.org>'
+                  '; rel="first memento"; datetime="not a date"')
+
+        links = list(LinkParser(strict=False).parse(header))
+
+        self.assertEquals(3, len(links))
+        self.assertEquals((['original'], 'http://a.example.org'),
+                          (links[0][0], links[0][1]))
+        self.assertEquals("application/link-format", links[1][3])
+        self.assertEquals(['first', 'memento'], links[2][0])
+        self.assertIsNone(links[2][2])
+
+    def test_unexpected_token(self):
+
+        self.assertRaises(Exception, list,
+            LinkParser().parse('<http://a.example.org>;title="x"'))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLinkParser)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -1,7 +1,21 @@
 import unittest
 import pprint
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import urlparse
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
 
 import pymemento
+from pymemento import BinaryTimemap, Coverage
+from pymemento.LinkTimemap import MementoLink, LinkTimemapParser
+from pymemento.LinkTimemap import CompactMementos
+from pymemento.LinkTimemap import BaseURI, DatetimeCurator
+from stubserver import StubServer
 
 pp = pprint.PrettyPrinter(indent=4)
 
@@ -91,6 +105,738 @@ class TestLinkTimemap(unittest.TestCase):
         self.assertTrue(foundFirst, "did not find first memento from relations")
         self.assertTrue(foundLast, "did not find last memento from relations")
 
+    def test_filters(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/web/20000621011731/http://a.example.org>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 00:00:00 GMT",
+<http://mirror.example.net/web/20000621044156/http://a.example.org>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 04:41:56 GMT",
+<http://arxiv.example.net/web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+        def uris(tm):
+            return sorted(m.uri_m.split('/')[4] for dt in tm.range()
+                          for m in tm[dt])
+
+        # the second memento is only in range once its time is currated
+        tm = pymemento.LinkTimemap.from_string(timemap, "http://a.example.org",
+            since=datetime(2000, 6, 21, 1), until=datetime(2000, 6, 22))
+        self.assertEquals(['20000621011731', '20000621044156'], uris(tm))
+        self.assertEquals("http://a.example.org", tm.original_uri)
+
+        checked = []
+
+        def arxiv(uri_m, memento_datetime):
+            checked.append(uri_m)
+            return uri_m.startswith("http://arxiv.example.net/")
+
+        tm = pymemento.LinkTimemap.from_string(timemap, "http://a.example.org",
+            until=datetime(2000, 6, 22, tzinfo=tzutc()), predicate=arxiv)
+        self.assertEquals(['20000620180259', '20000621011731'], uris(tm))
+        # out of range mementos never reach the predicate
+        self.assertEquals(3, len(checked))
+
+    def test_iter_mementos(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timegate/http://a.example.org>;rel="timegate",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20000621011731/http://a.example.org>
+  ; rel="last memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT"
+"""
+
+        header = pymemento.LinkTimemap(None, [], [])
+        mementos = pymemento.LinkTimemap.iter_mementos(
+            io.BytesIO(timemap), "http://arxiv.example.net/timemap/", header)
+
+        self.assertEquals([
+            "http://arxiv.example.net/web/20000620180259/http://a.example.org",
+            "http://arxiv.example.net/web/20000621011731/http://a.example.org",
+            ], [m.uri_m for m in mementos])
+        self.assertEquals("http://a.example.org", header.original_uri)
+        self.assertEquals(
+            ["http://arxiv.example.net/timegate/http://a.example.org"],
+            header.timegate_uris)
+        self.assertIsNone(header.mementos)
+
+    def test_datetime_index(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20000621011731/http://a.example.org>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+        tm = pymemento.LinkTimemap.from_string(
+            timemap, "http://arxiv.example.net/timemap/")
+        first = datetime(2000, 6, 20, 18, 2, 59, tzinfo=tzutc())
+        second = datetime(2000, 6, 21, 1, 17, 31, tzinfo=tzutc())
+        last = datetime(2009, 10, 27, 20, 49, 54, tzinfo=tzutc())
+
+        self.assertEquals(first, tm.first)
+        self.assertEquals(last, tm.last)
+        self.assertEquals(second, tm.nearest(datetime(2001, 1, 1)))
+        self.assertEquals(last, tm.nearest(datetime(2020, 1, 1)))
+        self.assertEquals(first, tm.before(second))
+        self.assertIsNone(tm.before(first))
+        self.assertEquals(last, tm.after(second))
+        self.assertIsNone(tm.after(last))
+        self.assertEquals([first, second], tm.range(None, second))
+
+        middle = datetime(2005, 1, 1, tzinfo=tzutc())
+        tm.add_memento(MementoLink(middle,
+            "http://arxiv.example.net/web/20050101000000/http://a.example.org",
+            ['memento']))
+        self.assertEquals(middle, tm.nearest(datetime(2006, 1, 1)))
+        self.assertEquals([second, middle], tm.range(second, middle))
+
+        # replacing a datetime keeps the count but changes the index
+        later = datetime(2008, 1, 1, tzinfo=tzutc())
+        tm.mementos[later] = tm.mementos.pop(middle)
+        self.assertEquals([first, second, later, last], tm.range())
+        del tm.mementos[later]
+        tm.add_memento(MementoLink(middle,
+            "http://arxiv.example.net/web/20050101000000/http://a.example.org",
+            ['memento']))
+        self.assertEquals([first, second, middle, last], tm.range())
+
+        tm.mementos = {first: tm[first]}
+        self.assertEquals(first, tm.last)
+
+    def test_compact(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT"
+  ; license="http://creativecommons.org/publicdomain/zero/1.0/",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT",
+</web/20000621011731/http://a.example.org>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT",
+</other/a.example.org>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT"
+"""
+
+        base = "http://arxiv.example.net/timemap/"
+        tm = pymemento.LinkTimemap.from_string(timemap, base)
+        compact = pymemento.LinkTimemap.from_string(timemap, base,
+                                                    compact=True)
+
+        self.assertEquals(sorted(tm.mementos.keys()), compact.mementos.keys())
+        for key in tm.mementos.keys():
+            self.assertEquals(tm[key], compact[key])
+        self.assertEquals(tm.first, compact.first)
+        self.assertEquals(tm.last, compact.last)
+        self.assertEquals(tm.nearest(datetime(2001, 1, 1)),
+                          compact.nearest(datetime(2001, 1, 1)))
+        self.assertRaises(KeyError, compact.__getitem__, datetime(2001, 1, 1))
+
+    def test_from_uri(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+</web/20000620180259/http://a.example.org>
+  ; rel="first last memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT"
+"""
+
+        routes = {'/timemap/http://a.example.org':
+                  (200, {'Content-Type': 'application/link-format'}, timemap)}
+
+        with StubServer(routes) as server:
+            tm = pymemento.LinkTimemap.from_uri(
+                server.url('/timemap/http://a.example.org'),
+                session=pymemento.Session(max_retries=0))
+
+        self.assertEquals("http://a.example.org", tm.original_uri)
+        self.assertEquals(server.url('/web/20000620180259/http://a.example.org'),
+                          list(tm[tm.first])[0].uri_m)
+        self.assertEquals('application/link-format;q=1.0',
+                          server.log[0][2]['accept'])
+
+    def test_follow_pages(self):
+
+        def page(mementos):
+            return ('<http://a.example.org>;rel="original",\n'
+                    '</tm/1>;rel="timemap";until="Wed, 21 Jun 2000 00:00:00 GMT",\n'
+                    '</tm/2>;rel="timemap";from="Thu, 22 Jun 2000 00:00:00 GMT"'
+                    ';until="Fri, 23 Jun 2000 00:00:00 GMT",\n'
+                    '</tm/3>;rel="timemap";from="Sat, 24 Jun 2000 00:00:00 GMT",\n'
+                    + ''.join('</web/%s/http://a.example.org>; rel="memento"'
+                              '; datetime="%s",\n' % m for m in mementos))
+
+        first = ('20000620180259', 'Tue, 20 Jun 2000 18:02:59 GMT')
+        second = ('20000622120000', 'Thu, 22 Jun 2000 12:00:00 GMT')
+        third = ('20000624120000', 'Sat, 24 Jun 2000 12:00:00 GMT')
+        routes = {'/tm': (200, {}, page([])),
+                  '/tm/1': (200, {}, page([first])),
+                  '/tm/2': (200, {}, page([second, first])),
+                  '/tm/3': (200, {}, page([third]))}
+
+        with StubServer(routes) as server:
+            session = pymemento.Session(max_retries=0)
+            tm = pymemento.LinkTimemap.from_uri(server.url('/tm'),
+                session=session, follow_pages=True)
+            self.assertEquals(3, len(tm.mementos))
+            self.assertEquals(1, len(tm[tm.first]))
+            self.assertEquals(4, len(server.log))
+
+            tm = pymemento.LinkTimemap.from_uri(server.url('/tm'),
+                session=session, follow_pages=True,
+                since=datetime(2000, 6, 22), until=datetime(2000, 6, 23))
+            self.assertEquals(['/tm', '/tm/2'],
+                              sorted(entry[1] for entry in server.log[4:]))
+            # mementos of the pages fetched are filtered as well
+            self.assertEquals([second[0]], [m.uri_m.split('/')[-4]
+                                            for m in tm[tm.first]])
+            self.assertEquals(1, len(tm.mementos))
+
+    def test_follow_overlapping_pages(self):
+
+        def page(*mementos):
+            return ('<http://a.example.org>;rel="original",\n'
+                    '</tm/1>;rel="timemap";until="Thu, 22 Jun 2000 12:00:00 GMT",\n'
+                    '</tm/2>;rel="timemap";from="Thu, 22 Jun 2000 12:00:00 GMT",\n'
+                    + ',\n'.join('</web/%s/http://a.example.org>; rel="%s"'
+                                  '; datetime="%s"' % m for m in mementos))
+
+        a = ('20000620180259', 'first memento', 'Tue, 20 Jun 2000 18:02:59 GMT')
+        b = ('20000622120000', 'last memento', 'Thu, 22 Jun 2000 12:00:00 GMT')
+        c = ('20000624120000', 'last memento', 'Sat, 24 Jun 2000 12:00:00 GMT')
+        routes = {'/tm': (200, {}, page(('20000621000000', 'first last memento',
+                                         'Wed, 21 Jun 2000 00:00:00 GMT'))),
+                  '/tm/1': (200, {}, page(a, b)),
+                  '/tm/2': (200, {}, page(('20000622120000', 'first memento',
+                                           b[2]), c))}
+
+        with StubServer(routes) as server:
+            for compact in (False, True):
+                tm = pymemento.LinkTimemap.from_uri(server.url('/tm'),
+                    session=pymemento.Session(max_retries=0),
+                    follow_pages=True, compact=compact)
+                self.assertEquals(
+                    [(a[0], ['first', 'memento']),
+                     ('20000621000000', ['memento']),
+                     (b[0], ['memento']),
+                     (c[0], ['last', 'memento'])],
+                    [(m.uri_m.split('/')[-4], list(m.rels))
+                     for key in sorted(tm.mementos.keys())
+                     for m in tm[key]])
+
+    def test_save_load(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timemap/http://a.example.org>
+  ; rel="self";type="application/link-format"
+  ; from="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/timegate/http://a.example.org>;rel="timegate",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+  ; license="http://creativecommons.org/publicdomain/zero/1.0/",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</other/caf\xc3\xa9>
+  ; rel="memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT"
+"""
+
+        tm = pymemento.LinkTimemap.from_string(
+            timemap, "http://arxiv.example.net/timemap/")
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'timemap.bin')
+            tm.save(path)
+            for use_mmap in (True, False):
+                loaded = pymemento.LinkTimemap.load(path, mmap=use_mmap)
+                self.assertEquals(tm.original_uri, loaded.original_uri)
+                self.assertEquals(tm.timegate_uris, loaded.timegate_uris)
+                self.assertEquals(tm.timemaps[0].from_dt,
+                                  loaded.timemaps[0].from_dt)
+                self.assertEquals(sorted(tm.mementos.keys()),
+                                  loaded.mementos.keys())
+                for key in tm.mementos.keys():
+                    self.assertEquals(
+                        set((m.uri_m.decode('utf-8'), tuple(m.rels),
+                             m.license_uri) for m in tm[key]),
+                        set((m.uri_m, tuple(m.rels), m.license_uri)
+                            for m in loaded[key]))
+                self.assertEquals(tm.last,
+                                  loaded.nearest(datetime(2020, 1, 1)))
+                loaded.mementos.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_many_codes(self):
+
+        start = datetime(2000, 6, 20, tzinfo=tzutc())
+        links = [MementoLink(start + timedelta(seconds=i),
+                             'http://arxiv.example.net/web/%d' % i,
+                             ['memento', 'r%d' % i],
+                             'http://example.org/license/%d' % i)
+                 for i in range(70000)]
+        compact = pymemento.LinkTimemap(None, [], [],
+                                        CompactMementos(links))
+        self.assertEquals(70000, len(compact.mementos))
+        self.assertEquals([links[-1]], list(compact[compact.last]))
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'timemap.bin')
+            compact.save(path)
+            loaded = pymemento.LinkTimemap.load(path)
+            self.assertEquals([links[-1]], list(loaded[loaded.last]))
+            loaded.mementos.close()
+
+            # version 1 files have 16-bit rel and license codes
+            magic = BinaryTimemap.MAGIC
+            BinaryTimemap.MAGIC = b'PYMTM\x01\x00\x00'
+            try:
+                pymemento.LinkTimemap(None, [], [],
+                                      CompactMementos(links[:3])).save(path)
+            finally:
+                BinaryTimemap.MAGIC = magic
+            loaded = pymemento.LinkTimemap.load(path)
+            self.assertEquals(links[:3], [m for key in loaded.mementos.keys()
+                                          for m in loaded[key]])
+            loaded.mementos.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stats(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</other/20000620180259/http://a.example.org>
+  ; rel="memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20000702120000/http://a.example.org>
+  ; rel="memento";datetime="Sun, 02 Jul 2000 12:00:00 GMT",
+</web/20001231235959/http://a.example.org>
+  ; rel="memento";datetime="Sun, 31 Dec 2000 23:59:59 GMT",
+</web/20010101000000/http://a.example.org>
+  ; rel="last memento";datetime="Mon, 01 Jan 2001 00:00:00 GMT"
+"""
+
+        tm = pymemento.LinkTimemap.from_string(timemap, "http://arxiv.example.net")
+        compact = pymemento.LinkTimemap.from_string(
+            timemap, "http://arxiv.example.net", compact=True)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'timemap.bin')
+            tm.save(path)
+            loaded = pymemento.LinkTimemap.load(path)
+            results = Coverage.coverage([tm, compact, loaded], gap_days=60)
+            loaded.mementos.close()
+        finally:
+            shutil.rmtree(directory)
+
+        for stats in results:
+            self.assertEquals("http://a.example.org", stats.original_uri)
+            self.assertEquals((5, 4), (stats.count, stats.datetimes))
+            self.assertEquals((tm.first, tm.last), (stats.first, stats.last))
+            self.assertEquals([(datetime(2000, 7, 2, 12, tzinfo=tzutc()),
+                                datetime(2000, 12, 31, 23, 59, 59,
+                                         tzinfo=tzutc()))], stats.gaps)
+            self.assertEquals([((2000, 6), 2), ((2000, 7), 1), ((2000, 8), 0),
+                               ((2000, 9), 0), ((2000, 10), 0),
+                               ((2000, 11), 0), ((2000, 12), 1),
+                               ((2001, 1), 1)], stats.per_month.items())
+            self.assertEquals([(2000, 4), (2001, 1)], stats.per_year.items())
+
+        empty = pymemento.LinkTimemap(None, [], []).stats()
+        self.assertEquals((0, None, [], {}),
+                          (empty.count, empty.first, empty.gaps,
+                           empty.per_year))
+
+    def _coverage_timemaps(self):
+        dates = [datetime(1969, 12, 31, 23, 59, 59), datetime(1970, 1, 1),
+                 datetime(1999, 12, 31, 12), datetime(2000, 1, 1, 6),
+                 datetime(2000, 1, 1, 6), datetime(2000, 3, 15),
+                 datetime(2003, 7, 4, 1, 2, 3)]
+        timemaps = []
+        for n in range(len(dates) + 1):
+            links = ['<http://a.example.org/%d>;rel="original"' % n]
+            for i, dt in enumerate(dates[len(dates) - n:]):
+                links.append('</web/%d/%s>;rel="memento";datetime="%s"' % (
+                    i, n, dt.strftime('%a, %d %b %Y %H:%M:%S GMT')))
+            text = ',\n'.join(links)
+            for compact in (False, True):
+                timemaps.append(pymemento.LinkTimemap.from_string(
+                    text, "http://arxiv.example.net", compact=compact))
+        return timemaps
+
+    def test_coverage_without_numpy(self):
+
+        timemaps = self._coverage_timemaps()
+        numpy, Coverage.numpy = Coverage.numpy, None
+        try:
+            expected = [vars(Coverage.stats(tm, 30)) for tm in timemaps]
+            results = [vars(stats) for stats in Coverage.coverage(timemaps, 30)]
+        finally:
+            Coverage.numpy = numpy
+        self.assertEquals(expected, results)
+        self.assertEquals([0, 0, 1, 1, 2, 2], [r['count'] for r in results[:6]])
+        self.assertEquals(6, results[-1]['datetimes'])
+
+    @unittest.skipIf(Coverage.numpy is None, 'NumPy is not installed')
+    def test_coverage_numpy(self):
+
+        timemaps = self._coverage_timemaps()
+        numpy, Coverage.numpy = Coverage.numpy, None
+        try:
+            expected = [vars(stats) for stats in Coverage.coverage(timemaps, 30)]
+        finally:
+            Coverage.numpy = numpy
+        self.assertEquals(expected, [vars(stats) for stats
+                                     in Coverage.coverage(timemaps, 30)])
+        self.assertEquals(expected,
+                          [vars(Coverage.stats(tm, 30)) for tm in timemaps])
+
+    def test_pickle(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timemap/http://a.example.org>
+  ; rel="self";type="application/link-format"
+  ; from="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/web/20000620180259/http://a.example.org>
+  ; rel="first last memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT"
+  ; license="http://creativecommons.org/publicdomain/zero/1.0/"
+"""
+
+        tm = pymemento.LinkTimemap.from_string(timemap, "http://arxiv.example.net")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(tm, protocol))
+            self.assertEquals(tm.mementos, loaded.mementos)
+            self.assertEquals(repr(tm.timemaps), repr(loaded.timemaps))
+            self.assertEquals(tm.first, loaded.first)
+
+    def test_to_string(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timemap/http://a.example.org>
+  ; rel="self";type="application/link-format"
+  ; from="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/timegate/http://a.example.org>;rel="timegate",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+  ; license="http://creativecommons.org/publicdomain/zero/1.0/",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 20:02:59 +0200"
+"""
+
+        expected = b"""<http://a.example.org>; rel="original",
+<http://arxiv.example.net/timemap/http://a.example.org>; rel="self"; type="application/link-format"; from="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/timegate/http://a.example.org>; rel="timegate",
+<http://arxiv.example.net/web/20000620180259/http://a.example.org>; rel="first memento"; datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/web/20091027204954/http://a.example.org>; rel="last memento"; datetime="Tue, 27 Oct 2009 20:49:54 GMT"; license="http://creativecommons.org/publicdomain/zero/1.0/"
+"""
+
+        tm = pymemento.LinkTimemap.from_string(
+            timemap, "http://arxiv.example.net/timemap/")
+        self.assertEquals(expected, tm.to_string())
+
+        again = pymemento.LinkTimemap.from_string(tm.to_string(), "http://x/")
+        self.assertEquals(expected, again.to_string())
+        for key in tm.mementos.keys():
+            self.assertEquals(tm[key], again[key])
+
+        output = io.BytesIO()
+        tm.to_file(output, chunk_size=16)
+        self.assertEquals(expected, output.getvalue())
+
+    def test_paged_without_self(self):
+
+        timemap = b"""<http://a.example.org>; rel="original",
+<http://arxiv.example.net/timemap/2/http://a.example.org>; rel="timemap"; type="application/link-format"; from="Tue, 27 Oct 2009 20:49:54 GMT",
+<http://arxiv.example.net/timemap/1/http://a.example.org>; rel="timemap"; type="application/link-format"; until="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/web/20000620180259/http://a.example.org>; rel="memento"; datetime="Tue, 20 Jun 2000 18:02:59 GMT"
+"""
+
+        tm = pymemento.LinkTimemap.from_string(timemap, "http://x/")
+        self.assertEquals(None, tm.self_link)
+        self.assertEquals(timemap, tm.to_string())
+        again = pymemento.LinkTimemap.from_string(tm.to_string(), "http://x/")
+        self.assertEquals(None, again.self_link)
+        self.assertEquals(timemap, again.to_string())
+        self.assertEquals(['timemap', 'timemap'],
+                          [link.rel for link in again.timemaps])
+
+        paged = timemap.replace(b'<http://arxiv.example.net/timemap/2/',
+            b'<http://arxiv.example.net/timemap/0/http://a.example.org>; '
+            b'rel="self",\n<http://arxiv.example.net/timemap/2/', 1)
+        tm = pymemento.LinkTimemap.from_string(paged, "http://x/")
+        self.assertEquals(
+            'http://arxiv.example.net/timemap/0/http://a.example.org',
+            tm.self_link.uri_t)
+        self.assertEquals(paged, tm.to_string())
+
+    def test_from_json(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timemap/json/http://a.example.org>
+  ; rel="self";type="application/json",
+<http://arxiv.example.net/timemap/link/http://a.example.org>
+  ; rel="timemap";type="application/link-format",
+<http://arxiv.example.net/timegate/http://a.example.org>;rel="timegate",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20000621011731/caf\xc3\xa9>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+  ; license="http://creativecommons.org/publicdomain/zero/1.0/"
+"""
+
+        document = """{"original_uri": "http://a.example.org",
+ "mementos": {
+  "first": {"datetime": "2000-06-20T18:02:59Z",
+            "uri": "/web/20000620180259/http://a.example.org"},
+  "last": {"datetime": "2009-10-27T20:49:54Z",
+           "uri": "/web/20091027204954/http://a.example.org"},
+  "list": [
+   {"datetime": "2000-06-20T18:02:59Z",
+    "uri": "/web/20000620180259/http://a.example.org"},
+   {"datetime": "Wed, 21 Jun 2000 01:17:31 GMT",
+    "uri": "/web/20000621011731/caf\xc3\xa9"},
+   {"datetime": "2009-10-27T20:49:54Z",
+    "uri": "/web/20091027204954/http://a.example.org",
+    "license": "http://creativecommons.org/publicdomain/zero/1.0/"}]},
+ "timemap_uri": {
+  "link_format": "http://arxiv.example.net/timemap/link/http://a.example.org",
+  "json_format": "http://arxiv.example.net/timemap/json/http://a.example.org"},
+ "timegate_uri": "http://arxiv.example.net/timegate/http://a.example.org"}"""
+
+        base_uri = "http://arxiv.example.net/timemap/"
+        expected = pymemento.LinkTimemap.from_string(timemap, base_uri)
+        for tm in (pymemento.LinkTimemap.from_json(document, base_uri),
+                   pymemento.LinkTimemap.from_json(io.BytesIO(document),
+                                                   base_uri, compact=True)):
+            self.assertEquals(expected.original_uri, tm.original_uri)
+            self.assertEquals(expected.timegate_uris, tm.timegate_uris)
+            self.assertEquals([(l.uri_t, l.mime_type) for l in expected.timemaps],
+                              [(l.uri_t, l.mime_type) for l in tm.timemaps])
+            self.assertEquals(sorted(expected.mementos.keys()),
+                              sorted(tm.mementos.keys()))
+            for key in expected.mementos.keys():
+                self.assertEquals(expected[key], tm[key])
+
+        # Blocks may split the document anywhere
+        parser = pymemento.JsonTimemap.JsonParser()
+        links = sorted(parser.parse(document))
+        for size in (1, 2, 7, 64):
+            blocks = [document[i:i + size]
+                      for i in range(0, len(document), size)]
+            self.assertEquals(links, sorted(parser.parse_blocks(blocks)))
+
+        again = pymemento.LinkTimemap.from_json(expected.to_json(), "http://x/")
+        self.assertEquals(expected.to_string(), again.to_string())
+
+        routes = {'/tm': (200, {'Content-Type': 'application/json'}, document)}
+        with StubServer(routes) as server:
+            tm = pymemento.LinkTimemap.from_uri(server.url('/tm'),
+                session=pymemento.Session(max_retries=0), prefer='json')
+        self.assertEquals(3, len(tm.mementos))
+        self.assertEquals(pymemento.LinkTimemap.ACCEPT_JSON,
+                          server.log[0][2]['accept'])
+
+    def test_json_round_trip(self):
+
+        document = """{"original_uri": "http://a.example.org",
+ "timegate_uri": ["http://arxiv.example.net/timegate/http://a.example.org",
+                  "http://mirror.example.com/timegate/http://a.example.org"],
+ "timemap_uri": {
+  "link_format": "http://arxiv.example.net/timemap/link/http://a.example.org",
+  "json_format": "http://arxiv.example.net/timemap/json/http://a.example.org"},
+ "pages": {
+  "next": {"uri": "http://arxiv.example.net/timemap/json/2/http://a.example.org",
+           "from": "2009-10-27T20:49:54Z"},
+  "prev": {"uri": "http://arxiv.example.net/timemap/json/0/http://a.example.org",
+           "from": "1999-01-01T00:00:00Z", "until": "2000-06-20T18:02:59Z"}},
+ "mementos": {"list": [
+   {"datetime": "2000-06-20T18:02:59Z",
+    "uri": "http://arxiv.example.net/web/20000620180259/http://a.example.org"}]}}"""
+
+        tm = pymemento.LinkTimemap.from_json(document, "http://x/")
+        self.assertEquals(
+            "http://arxiv.example.net/timemap/json/http://a.example.org",
+            tm.self_link.uri_t)
+        written = json.loads(tm.to_json())
+        self.assertEquals(json.loads(document)['timegate_uri'],
+                          written['timegate_uri'])
+        self.assertEquals(json.loads(document)['timemap_uri'],
+                          written['timemap_uri'])
+        self.assertEquals(sorted(json.loads(document)['pages'].values()),
+                          sorted(written['pages'].values()))
+
+        again = pymemento.LinkTimemap.from_json(tm.to_json(), "http://x/")
+        self.assertEquals(tm.to_json(), again.to_json())
+        self.assertEquals(tm.timegate_uris, again.timegate_uris)
+        self.assertEquals([repr(link) for link in tm.timemaps],
+                          [repr(link) for link in again.timemaps])
+
+        # Without a 'self' link every timemap link is a page
+        paged = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timemap/1/http://a.example.org>;rel="timemap"
+  ; until="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/timemap/2/http://a.example.org>;rel="timemap"
+  ; from="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+        written = json.loads(
+            pymemento.LinkTimemap.from_string(paged, "http://x/").to_json())
+        self.assertFalse('timemap_uri' in written)
+        self.assertEquals(
+            [{"uri": "http://arxiv.example.net/timemap/1/http://a.example.org",
+              "until": "2000-06-20T18:02:59Z"},
+             {"uri": "http://arxiv.example.net/timemap/2/http://a.example.org",
+              "from": "2009-10-27T20:49:54Z"}],
+            [written['pages'][name] for name in sorted(written['pages'])])
+
+    def test_merge(self):
+
+        archive = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timegate/http://a.example.org>;rel="timegate",
+<http://arxiv.example.net/web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+        mirror = """<http://a.example.org>;rel="original",
+<http://mirror.example.com/timegate/http://a.example.org>;rel="timegate",
+<HTTP://ARXIV.example.net:80/web/20000620180259/http://a.example.org#top>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://mirror.example.com/20050101000000/http://a.example.org>
+  ; rel="last memento";datetime="Sat, 01 Jan 2005 00:00:00 GMT"
+"""
+
+        first = pymemento.LinkTimemap.from_string(archive, "http://x/")
+        second = pymemento.LinkTimemap.from_string(mirror, "http://x/")
+        for compact in (False, True):
+            tm = pymemento.LinkTimemap.merge(first, second, compact=compact)
+            self.assertEquals(3, len(tm.mementos))
+            self.assertEquals(2, len(tm.timegate_uris))
+            self.assertEquals(
+                [(["first", "memento"], (0, 1)), (["memento"], (1,)),
+                 (["last", "memento"], (0,))],
+                [(m.rels, tm.provenance[(m.memento_datetime, m.uri_m)])
+                 for key in tm.range() for m in tm[key]])
+
+        # Streams must be in ascending order
+        descending = [m for _, m in sorted(
+            ((key, m) for key, links in second.mementos.items()
+             for m in links), reverse=True)]
+        merged = pymemento.LinkTimemap.iter_merge(first, descending)
+        self.assertRaises(ValueError, list, merged)
+
+    def test_push_parser(self):
+
+        timemap = """<http://a.example.org>;rel="original",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+        base_uri = "http://arxiv.example.net/timemap/"
+        expected = pymemento.LinkTimemap.from_string(timemap, base_uri)
+        for compact in (False, True):
+            parser = LinkTimemapParser(base_uri, compact)
+            mementos = []
+            for i in range(0, len(timemap), 5):
+                mementos.extend(parser.feed(timemap[i:i + 5]))
+            self.assertEquals(1, len(mementos))
+            tm = parser.close()
+            self.assertEquals(expected.original_uri, tm.original_uri)
+            self.assertEquals(expected.range(), tm.range())
+            for key in expected.mementos.keys():
+                self.assertEquals(expected[key], tm[key])
+
+    def test_base_uri(self):
+
+        for base in ["http://arxiv.example.net/timemap/", "https://a:8080/p?q",
+                     "HTTP://Example.org", "", "mailto:a@example.org"]:
+            resolver = BaseURI(base)
+            for uri in ["/web/20000620180259/http://a.example.org",
+                        "http://a.example.org", "HTTP://A.example.org/",
+                        "//other.example.org/x", "web/x", "../x", "?q", "/x?",
+                        "http:x", "urn:x:y", "/web/caf\xc3\xa9", "/web/x?#y",
+                        "http://a/b?#f", "web/x?#y", "/x#?y"]:
+                self.assertEquals(urlparse.urljoin(base, uri),
+                                  resolver.resolve(uri), (base, uri))
+
+        curator = DatetimeCurator(maxsize=2)
+        midnight = datetime(2000, 6, 20, tzinfo=tzutc())
+        for i in range(3):
+            self.assertEquals(datetime(2000, 6, 20, 18, 2, 59, tzinfo=tzutc()),
+                curator(midnight, "/web/20000620180259/http://a.example.org"))
+        self.assertEquals(midnight,
+            curator(midnight, "/web/20000621180259/http://a.example.org"))
+
+    def test_diff(self):
+
+        old = """<http://a.example.org>;rel="original",
+<http://arxiv.example.net/timegate/http://a.example.org>;rel="timegate",
+<http://arxiv.example.net/timemap/http://a.example.org>;rel="self"
+  ;until="Tue, 27 Oct 2009 20:49:54 GMT",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</other/20000620180259/http://a.example.org>
+  ; rel="memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+        new = """<http://a.example.org>;rel="original",
+<http://mirror.example.com/timegate/http://a.example.org>;rel="timegate",
+<http://arxiv.example.net/timemap/http://a.example.org>;rel="self"
+  ;until="Sat, 01 Jan 2011 00:00:00 GMT",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+</web/20091027204954/http://a.example.org>
+  ; rel="memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT",
+</web/20110101000000/http://a.example.org>
+  ; rel="last memento";datetime="Sat, 01 Jan 2011 00:00:00 GMT"
+"""
+
+        base_uri = "http://arxiv.example.net/timemap/"
+        old_tm = pymemento.LinkTimemap.from_string(old, base_uri)
+        new_tm = pymemento.LinkTimemap.from_string(new, base_uri,
+                                                   compact=True)
+
+        changes = pymemento.LinkTimemap.diff(old_tm, new_tm)
+        self.assertEquals(
+            ["http://arxiv.example.net/web/20110101000000/http://a.example.org"],
+            [m.uri_m for m in changes.added])
+        self.assertEquals(
+            ["http://arxiv.example.net/other/20000620180259/http://a.example.org"],
+            [m.uri_m for m in changes.removed])
+        self.assertIsNone(changes.original)
+        self.assertEquals(
+            ["http://mirror.example.com/timegate/http://a.example.org"],
+            changes.added_timegates)
+        self.assertEquals(1, len(changes.removed_timegates))
+        self.assertEquals(1, len(changes.changed_timemaps))
+        self.assertFalse(pymemento.LinkTimemap.diff(old_tm, old_tm))
+
+        # Streaming a fresh download against the cached timemap
+        header = pymemento.LinkTimemap(None, [], [])
+        fresh = pymemento.LinkTimemap.iter_mementos(io.BytesIO(new), base_uri,
+                                                    header)
+        self.assertEquals([('-', changes.removed[0].uri_m),
+                           ('+', changes.added[0].uri_m)],
+                          [(change, m.uri_m) for change, m
+                           in pymemento.LinkTimemap.iter_diff(old_tm, fresh)])
+
+        fresh = pymemento.LinkTimemap.iter_mementos(
+            io.BytesIO(new.replace("2011", "1999")), base_uri)
+        self.assertRaises(ValueError, list,
+                          pymemento.LinkTimemap.iter_diff(old_tm, fresh))
+
 
 if __name__ == '__main__':
     suite = unittest.TestLoader().loadTestsFromTestCase(TestLinkTimemap)
@@ -0,0 +1,95 @@
+import unittest
+import logging
+
+import pymemento
+from pymemento.Metrics import Metrics, enable, disable, get_metrics, log_sink
+from stubserver import StubServer
+
+
+TIMEMAP = """<http://a.example.org>;rel="original",
+</web/20000620180259/http://a.example.org>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 00:00:00 GMT",
+</web/20091027204954/http://a.example.org>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestMetrics(unittest.TestCase):
+
+    def tearDown(self):
+        disable()
+
+    def testDisabled(self):
+        self.assertIsNone(get_metrics())
+        pymemento.LinkTimemap.from_string(TIMEMAP, "http://x/")
+        self.assertIsNone(get_metrics())
+
+    def testParser(self):
+        emitted = []
+        metrics = enable(emitted.append)
+        pymemento.LinkTimemap.from_string(TIMEMAP, "http://x/")
+
+        counters = metrics.snapshot()['counters']
+        self.assertEquals(3, counters['links'])
+        self.assertEquals(2, counters['mementos'])
+        self.assertEquals(1, counters['timemaps'])
+        self.assertEquals(len(TIMEMAP), counters['bytes_read'])
+        self.assertEquals(15, counters['tokens'])
+        # the first memento's midnight datetime is fixed from its URI
+        self.assertEquals(1, counters['currate_fixups'])
+        for name in ('read_seconds', 'parse_seconds', 'currate_seconds',
+                     'resolve_seconds', 'build_seconds'):
+            self.assertIn(name, metrics.histograms)
+
+        metrics.emit()
+        self.assertEquals([metrics], emitted)
+
+    def testSinks(self):
+        metrics = Metrics(buckets=(0.5, 1.0))
+        metrics.observe('parse_seconds', 0.25)
+        metrics.observe('parse_seconds', 2.0)
+        metrics.count('links', 3)
+
+        self.assertEquals("""# TYPE pymemento_links_total counter
+pymemento_links_total 3
+# TYPE pymemento_parse_seconds histogram
+pymemento_parse_seconds_bucket{le="0.5"} 1
+pymemento_parse_seconds_bucket{le="1.0"} 1
+pymemento_parse_seconds_bucket{le="+Inf"} 2
+pymemento_parse_seconds_sum 2.25
+pymemento_parse_seconds_count 2
+""", metrics.to_prometheus())
+
+        handler = ListHandler()
+        logger = logging.getLogger('testMetrics')
+        logger.addHandler(handler)
+        metrics.sink = log_sink(logger, logging.WARNING)
+        metrics.emit()
+        self.assertEquals(
+            ['pymemento metrics: links=3; parse_seconds=2.250000s/2'],
+            handler.messages)
+
+    def testHTTP(self):
+        metrics = enable()
+        routes = {'/': (200, {'Link': '<http://a.example.org/tg>; rel="timegate"'}, '')}
+        with StubServer(routes) as server:
+            resource = pymemento.Resource(server.url('/'),
+                session=pymemento.Session(max_retries=0))
+            resource.getURIFromRelation('timegate')
+        self.assertEquals(1, metrics.counters['http_requests'])
+        self.assertEquals(1, metrics.histograms['http_seconds'].count)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMetrics)
+    unittest.TextTestRunner(verbosity=2).run(suite)
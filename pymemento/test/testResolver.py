@@ -0,0 +1,117 @@
+import unittest
+import threading
+import time
+
+import pymemento
+from stubserver import StubServer
+
+
+class TestResolver(unittest.TestCase):
+
+    def test_as_completed(self):
+
+        routes = dict(('/r%d' % i,
+            (200, {'Link': '<http://g.example.org/%d>; rel="timegate"' % i}, ''))
+            for i in range(8))
+
+        with StubServer(routes) as server:
+            with pymemento.Resolver(max_workers=4, per_host=2) as resolver:
+                uris = [server.url('/r%d' % i) for i in range(8)]
+                results = list(resolver.as_completed(resolver.timegate_uri,
+                                                     uris))
+
+        self.assertEquals(8, len(results))
+        for uri, uri_g, error in results:
+            self.assertIsNone(error)
+            self.assertEquals('http://g.example.org/' + uri.split('/r')[-1],
+                              uri_g)
+
+    def test_per_host_limit(self):
+
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def slow(method, path, headers):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.05)
+            with lock:
+                state['active'] -= 1
+            return (200, {}, '')
+
+        with StubServer(dict(('/r%d' % i, slow) for i in range(6))) as server:
+            with pymemento.Resolver(max_workers=6, per_host=2) as resolver:
+                results = [resolver.timegate(server.url('/r%d' % i))
+                           for i in range(6)]
+                self.assertEquals([None] * 6, [r.get() for r in results])
+
+        self.assertEquals(2, state['peak'])
+
+    def test_saturated_host(self):
+
+        release = threading.Event()
+
+        def stuck(method, path, headers):
+            release.wait(5)
+            return (200, {}, '')
+
+        fast = {'/b': (200, {'Link': '<http://g.example.org/b>; rel="timegate"'},
+                       '')}
+
+        with StubServer(dict(('/a%d' % i, stuck) for i in range(4))) as a, \
+                StubServer(fast) as b:
+            with pymemento.Resolver(max_workers=4, per_host=1) as resolver:
+                try:
+                    stuck_results = [resolver.timegate(a.url('/a%d' % i))
+                                     for i in range(4)]
+                    # only one request to the saturated host is in flight,
+                    # and the other host is served by an idle worker
+                    self.assertEquals('http://g.example.org/b',
+                                      resolver.timegate(b.url('/b')).get(2))
+                    self.assertEquals(1, len(a.log))
+                    self.assertFalse(any(r.ready() for r in stuck_results))
+                finally:
+                    release.set()
+                self.assertEquals([None] * 4,
+                                  [r.get(5) for r in stuck_results])
+
+    def test_from_uri_async(self):
+
+        timemap = '<http://a.example.org>;rel="original"'
+
+        with StubServer({'/tm': (200, {}, timemap)}) as server:
+            with pymemento.Resolver() as resolver:
+                result = pymemento.LinkTimemap.from_uri_async(
+                    server.url('/tm'), resolver)
+                self.assertEquals('http://a.example.org',
+                                  result.get(5).original_uri)
+
+    def test_set_resolver(self):
+
+        from pymemento.Resolver import get_resolver, set_resolver
+        from pymemento.Session import host_key
+
+        self.assertEquals(('http', 'a.example.org'),
+                          host_key('HTTP://A.example.org/x'))
+        self.assertNotEquals(host_key('http://a.example.org/'),
+                             host_key('https://a.example.org/'))
+
+        default = get_resolver()
+        replacement = pymemento.Resolver(max_workers=1)
+        set_resolver(replacement)
+        try:
+            self.assertIs(replacement, get_resolver())
+            self.assertFalse(any(worker.is_alive()
+                                 for worker in default._workers))
+        finally:
+            set_resolver(None)
+        self.assertFalse(any(worker.is_alive()
+                             for worker in replacement._workers))
+        self.assertIsNot(replacement, get_resolver())
+        set_resolver(None)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestResolver)
+    unittest.TextTestRunner(verbosity=2).run(suite)
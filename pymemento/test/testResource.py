@@ -1,8 +1,12 @@
 import unittest
 import pprint
 import requests
+import threading
+from datetime import datetime
+from dateutil.tz import tzutc
 
 import pymemento
+from stubserver import StubServer
 
 pp = pprint.PrettyPrinter(indent=4)
 
@@ -45,3 +49,259 @@ class TestResource(unittest.TestCase):
 
         self.assertIsNone(resource._getURIFromRelation(inputHeaders, 'timegate'))
         self.assertIsNone(resource._getURIFromRelation(inputHeaders, 'timemap'))
+
+    def test_sessionReusesConnections(self):
+
+        link = '<http://a.example.org>; rel="original timegate"'
+        routes = {'/a': (200, {'Link': link}, ''),
+                  '/b': (200, {'Link': link}, '')}
+
+        with StubServer(routes) as server:
+            session = pymemento.Session(max_retries=0)
+            first = pymemento.OriginalResource(server.url('/a'), session)
+            second = pymemento.OriginalResource(server.url('/b'), session)
+
+            self.assertEquals('http://a.example.org',
+                              first.getURIFromRelation('timegate'))
+            self.assertEquals('http://a.example.org',
+                              second.getURIFromRelation('timegate'))
+
+        self.assertEquals(['/a', '/b'], [entry[1] for entry in server.log])
+        self.assertEquals(server.log[0][3], server.log[1][3],
+                          'connection was not reused')
+
+    def test_sessionRetries(self):
+
+        routes = {'/a': [(503, {}, ''), (200, {'Link': '<http://g>; rel="timegate"'}, '')]}
+
+        with StubServer(routes) as server:
+            session = pymemento.Session(max_retries=2, backoff_factor=0)
+            resource = pymemento.Resource(server.url('/a'), session)
+
+            self.assertEquals('http://g', resource.getURIFromRelation('timegate'))
+
+        self.assertEquals(2, len(server.log))
+
+    def test_probeMany(self):
+
+        link = '<http://g.example.org>; rel="timegate",<http://t.example.org>; rel="timemap"'
+        routes = dict(('/r%d' % i, (200, {'Link': link}, '')) for i in range(5))
+        progress = []
+        errors = {}
+
+        with StubServer(routes) as server:
+            uris = [server.url('/r%d' % i) for i in range(5)]
+            results = pymemento.Resource.probe_many(
+                uris + uris, relations=['timegate', 'timemap', 'memento'],
+                workers=3, progress=lambda *args: progress.append(args),
+                errors=errors)
+
+        self.assertEquals(5, len(server.log))
+        self.assertEquals(set(uris), set(results.keys()))
+        for found in results.values():
+            self.assertEquals({'timegate': 'http://g.example.org',
+                               'timemap': 'http://t.example.org',
+                               'memento': None}, found)
+        self.assertEquals(range(1, 6), [entry[0] for entry in progress])
+        self.assertEquals({}, errors)
+
+    def test_probeManyCancel(self):
+
+        cancel = threading.Event()
+        cancel.set()
+
+        with StubServer() as server:
+            results = pymemento.Resource.probe_many(
+                [server.url('/r%d' % i) for i in range(5)], cancel=cancel)
+
+        self.assertEquals({}, results)
+        self.assertEquals([], server.log)
+
+    def test_headerCache(self):
+
+        now = [0]
+        cache = pymemento.HeaderCache(maxsize=1, ttl=60, clock=lambda: now[0])
+        headers = {'Link': '<http://g.example.org>; rel="timegate"',
+                   'ETag': '"v1"'}
+        routes = {'/a': [(200, headers, ''), (304, {}, '')],
+                  '/b': (200, {}, '')}
+
+        with StubServer(routes) as server:
+            session = pymemento.Session(max_retries=0)
+            for i in range(2):
+                resource = pymemento.Resource(server.url('/a'), session, cache)
+                self.assertEquals('http://g.example.org',
+                                  resource.getURIFromRelation('timegate'))
+            self.assertEquals(1, len(server.log))
+            self.assertEquals((1, 1), (cache.hits, cache.misses))
+
+            now[0] = 61
+            resource = pymemento.Resource(server.url('/a'), session, cache)
+            self.assertEquals('http://g.example.org',
+                              resource.getURIFromRelation('timegate'))
+            self.assertEquals('"v1"', server.log[1][2]['if-none-match'])
+            self.assertEquals(1, cache.revalidations)
+
+            pymemento.Resource(server.url('/b'), session, cache) \
+                .performRequestIfNecessary()
+            self.assertIsNone(cache.get(server.url('/a')))
+            self.assertEquals({}, cache.validators(server.url('/a')))
+
+            # the entry is evicted while the conditional request is in flight
+            headers_c = {'Link': '<http://g.example.org/c>; rel="timegate"',
+                         'ETag': '"v1"'}
+
+            def evicting(method, path, headers):
+                if 'if-none-match' in headers:
+                    cache.store(server.url('/b'), {})
+                    return (304, {}, '')
+                return (200, headers_c, '')
+
+            server.routes['/c'] = evicting
+            pymemento.Resource(server.url('/c'), session, cache) \
+                .performRequestIfNecessary()
+            now[0] = 122
+            resource = pymemento.Resource(server.url('/c'), session, cache)
+            self.assertEquals('http://g.example.org/c',
+                              resource.getURIFromRelation('timegate'))
+            self.assertEquals(['/c'] * 3,
+                              [entry[1] for entry in server.log[-3:]])
+            self.assertEquals('"v1"', server.log[-2][2]['if-none-match'])
+            self.assertFalse('if-none-match' in server.log[-1][2])
+            self.assertEquals(headers_c['Link'],
+                              cache.get(server.url('/c'))['link'])
+
+    def test_resolve(self):
+
+        when = datetime(2000, 6, 21, 2, 0, 0)
+        archive = '/timegate/'
+
+        def timegate(method, path, headers):
+            uri_r = path[len(archive):]
+            self.assertEquals('Wed, 21 Jun 2000 02:00:00 GMT',
+                              headers['accept-datetime'])
+            return (302, {'Location': '/web/20000621011731/' + uri_r,
+                          'Vary': 'accept-datetime'}, '')
+
+        class Routes(dict):
+            def get(self, path, default=None):
+                if path.startswith(archive):
+                    return timegate
+                return dict.get(self, path, default)
+
+        with StubServer(Routes({'/moved': (301, {'Location': '/a'}, '')})) \
+                as server:
+            routes = server.routes
+            for name in ('a', 'b'):
+                routes['/' + name] = (200, {'Link': '<%s>; rel="timegate"'
+                    % server.url(archive + server.url('/' + name))}, '')
+            # URI-R = URI-G, 200-style
+            routes['/self'] = (200, {'Vary': 'accept-datetime',
+                'Memento-Datetime': 'Wed, 21 Jun 2000 01:17:31 GMT',
+                'Content-Location': '/self/20000621011731'}, '')
+            session = pymemento.Session(max_retries=0)
+
+            memento = pymemento.Resource(server.url('/a'), session).resolve(when)
+            self.assertEquals(
+                server.url('/web/20000621011731/' + server.url('/a')),
+                memento._uri)
+            self.assertEquals(2, len(server.log))
+            self.assertEquals(('2.1', server.url(archive)),
+                pymemento.Resource.getDetectedPattern(server.url('/')))
+
+            # the host's TimeGate is now known: one round trip
+            memento = pymemento.Resource(server.url('/b'), session).resolve(when)
+            self.assertEquals(
+                server.url('/web/20000621011731/' + server.url('/b')),
+                memento._uri)
+            self.assertEquals(3, len(server.log))
+
+            pymemento.Resource.clearDetectedPatterns()
+            memento = pymemento.Resource(server.url('/self'), session) \
+                .resolve(when)
+            self.assertEquals(server.url('/self/20000621011731'), memento._uri)
+            self.assertEquals('Wed, 21 Jun 2000 01:17:31 GMT',
+                              memento.getMementoDatetime())
+            self.assertEquals(4, len(server.log))
+            self.assertEquals(('1.2', None),
+                pymemento.Resource.getDetectedPattern(server.url('/')))
+
+            pymemento.Resource.clearDetectedPatterns()
+            memento = pymemento.Resource(server.url('/moved'), session) \
+                .resolve(when)
+            self.assertEquals(
+                server.url('/web/20000621011731/' + server.url('/a')),
+                memento._uri)
+            pymemento.Resource.clearDetectedPatterns()
+            self.assertIsNone(
+                pymemento.Resource(server.url('/none'), session).resolve(when))
+
+            # a relative timegate link is resolved against the URI-R
+            routes['/rel'] = (200, {'Link': '</timegate/rel>; rel="timegate"'},
+                              '')
+            memento = pymemento.Resource(server.url('/rel'), session) \
+                .resolve(when)
+            self.assertEquals(server.url('/web/20000621011731/rel'),
+                              memento._uri)
+            self.assertEquals('/timegate/rel', server.log[-1][1])
+
+    def test_linkIndex(self):
+
+        link = ', '.join([
+            '<http://a.example.org/>; rel="original"',
+            '<http://arxiv.example.net/timegate/http://a.example.org/>'
+                '; rel="timegate"',
+            '<http://arxiv.example.net/timemap/http://a.example.org/>'
+                '; rel="timemap"; type="application/link-format"'
+                '; from="Tue, 20 Jun 2000 18:02:59 GMT"',
+            '<http://mirror.example.net/timemap/http://a.example.org/>'
+                '; rel="timemap"; type="application/json"',
+            '</web/20000620180259/http://a.example.org/>'
+                '; rel="first memento"'
+                '; datetime="Tue, 20 Jun 2000 18:02:59 GMT"',
+            '</web/20000621011731/http://a.example.org/>'
+                '; rel="prev memento"'
+                '; datetime="Wed, 21 Jun 2000 01:17:31 GMT"',
+            '</web/20091027204954/http://a.example.org/>'
+                '; rel="last memento"'
+                '; datetime="Tue, 27 Oct 2009 20:49:54 GMT"'])
+
+        with StubServer({'/m': (200, {'Link': link}, '')}) as server:
+            resource = pymemento.Resource(server.url('/m'),
+                                          pymemento.Session(max_retries=0))
+            self.assertEquals(['original', 'timegate', 'timemap', 'first',
+                               'memento', 'prev', 'last'],
+                              resource.relations())
+            links = resource._links
+            self.assertEquals(
+                ['http://arxiv.example.net/timemap/http://a.example.org/',
+                 'http://mirror.example.net/timemap/http://a.example.org/'],
+                resource.getAllURIsFromRelation('timemap'))
+            self.assertEquals(
+                'http://arxiv.example.net/timegate/http://a.example.org/',
+                resource.getURIFromRelation('timegate'))
+            # parsed once
+            self.assertIs(links, resource._links)
+
+            first = resource.getFirstMemento()
+            self.assertEquals(
+                server.url('/web/20000620180259/http://a.example.org/'),
+                first.uri_m)
+            self.assertEquals(
+                server.url('/web/20000621011731/http://a.example.org/'),
+                resource.getURIFromRelation('prev'))
+            self.assertEquals(datetime(2000, 6, 20, 18, 2, 59, tzinfo=tzutc()),
+                              first.memento_datetime)
+            self.assertIsNone(resource.getNextMemento())
+            self.assertEquals(['application/link-format', 'application/json'],
+                              [timemap.mime_type for timemap
+                               in resource.getTimemapLinks()])
+
+            timemap = resource.getTimemap()
+            self.assertEquals(1, len(server.log))
+
+        self.assertEquals('http://a.example.org/', timemap.original_uri)
+        self.assertEquals(3, len(timemap.mementos))
+        self.assertEquals(
+            set([server.url('/web/20091027204954/http://a.example.org/')]),
+            set(memento.uri_m for memento in timemap[timemap.last]))
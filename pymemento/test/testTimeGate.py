@@ -0,0 +1,141 @@
+import threading
+import time
+import unittest
+from wsgiref.util import setup_testing_defaults
+
+from pymemento import LinkTimemap
+from pymemento.TimeGate import TimeGate
+
+
+TIMEMAP = """<http://a.example.org/>;rel="original",
+<http://arxiv.example.net/timemap/http://a.example.org/>
+  ; rel="self";type="application/link-format",
+<http://arxiv.example.net/web/20000620180259/http://a.example.org/>
+  ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+<http://arxiv.example.net/web/20000621011731/http://a.example.org/>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 01:17:31 GMT",
+<http://arxiv.example.net/web/20000621044156/http://a.example.org/>
+  ; rel="memento";datetime="Wed, 21 Jun 2000 04:41:56 GMT",
+<http://arxiv.example.net/web/20091027204954/http://a.example.org/>
+  ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT"
+"""
+
+
+class TestTimeGate(unittest.TestCase):
+
+    def request(self, timegate, path, accept_datetime=None):
+        environ = {'PATH_INFO': path}
+        if accept_datetime is not None:
+            environ['HTTP_ACCEPT_DATETIME'] = accept_datetime
+        setup_testing_defaults(environ)
+        response = []
+
+        def start_response(status, headers):
+            response.append(status)
+            response.append(dict(headers))
+
+        self.assertEquals([], list(timegate(environ, start_response)))
+        return response
+
+    def test_negotiate(self):
+
+        timemap = LinkTimemap.from_string(TIMEMAP, "http://arxiv.example.net")
+        timegate = TimeGate({"http://a.example.org": timemap})
+
+        status, headers = self.request(timegate,
+            "/timegate/http://a.example.org/",
+            "Wed, 21 Jun 2000 02:00:00 GMT")
+        self.assertEquals("302 Found", status)
+        self.assertEquals(
+            "http://arxiv.example.net/web/20000621011731/http://a.example.org/",
+            headers["Location"])
+        self.assertEquals("accept-datetime", headers["Vary"])
+        self.assertEquals(", ".join([
+            '<http://a.example.org/>; rel="original"',
+            '<http://arxiv.example.net/timemap/http://a.example.org/>; '
+                'rel="timemap"; type="application/link-format"',
+            '<http://arxiv.example.net/web/20000620180259/http://a.example.org/>; '
+                'rel="first prev memento"; '
+                'datetime="Tue, 20 Jun 2000 18:02:59 GMT"',
+            '<http://arxiv.example.net/web/20000621011731/http://a.example.org/>; '
+                'rel="memento"; datetime="Wed, 21 Jun 2000 01:17:31 GMT"',
+            '<http://arxiv.example.net/web/20000621044156/http://a.example.org/>; '
+                'rel="next memento"; datetime="Wed, 21 Jun 2000 04:41:56 GMT"',
+            '<http://arxiv.example.net/web/20091027204954/http://a.example.org/>; '
+                'rel="last memento"; datetime="Tue, 27 Oct 2009 20:49:54 GMT"',
+            ]), headers["Link"])
+
+        # without Accept-Datetime, the latest memento; merged slashes are
+        # restored
+        status, headers = self.request(timegate,
+            "/timegate/http:/a.example.org/")
+        self.assertEquals(
+            "http://arxiv.example.net/web/20091027204954/http://a.example.org/",
+            headers["Location"])
+        self.assertIn('/20000621044156/http://a.example.org/>; rel="prev memento"',
+                      headers["Link"])
+
+        status, headers = self.request(timegate,
+            "/timegate/http://a.example.org/", "yesterday-ish")
+        self.assertEquals("400 Bad Request", status)
+        status, headers = self.request(timegate,
+            "/timegate/http://b.example.org/")
+        self.assertEquals("404 Not Found", status)
+
+    def test_loader(self):
+
+        loaded = []
+
+        def loader(uri_r):
+            loaded.append(uri_r)
+            if uri_r.startswith("http://a.example.org/"):
+                return LinkTimemap.from_string(TIMEMAP,
+                                               "http://arxiv.example.net")
+            return None
+
+        timegate = TimeGate(loader=loader, maxsize=2)
+        for uri_r in ["http://a.example.org/", "http://a.example.org/?1",
+                      "http://a.example.org/", "http://a.example.org/?2",
+                      "http://a.example.org/?1", "http://a.example.org/"]:
+            self.assertIsNotNone(timegate.timemap(uri_r))
+        self.assertEquals(["http://a.example.org/", "http://a.example.org/?1",
+                           "http://a.example.org/?2", "http://a.example.org/?1",
+                           "http://a.example.org/"], loaded)
+        self.assertEquals((1, 5), (timegate.hits, timegate.misses))
+        self.assertIsNone(timegate.timemap("http://b.example.org/"))
+
+    def test_concurrent_load(self):
+
+        loaded = []
+        release = threading.Event()
+
+        def loader(uri_r):
+            loaded.append(uri_r)
+            release.wait(5)
+            return LinkTimemap.from_string(TIMEMAP, "http://arxiv.example.net")
+
+        timegate = TimeGate(loader=loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+                       timegate.timemap("http://a.example.org/")))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # every request but the loading one waits for it
+        deadline = time.time() + 5
+        while timegate.hits < 7 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(["http://a.example.org/"], loaded)
+        self.assertEquals(8, len(results))
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertIsNotNone(results[0])
+        self.assertEquals((7, 1), (timegate.hits, timegate.misses))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTimeGate)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pymemento
+from pymemento.TimemapCache import TimemapCache
+from stubserver import StubServer
+
+
+def memento(path, date, rel='memento'):
+    return '<%s>; rel="%s"; datetime="%s",\n' % (path, rel, date)
+
+
+class TestTimemapCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'timemaps.db')
+        self.session = pymemento.Session(max_retries=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_warm_start_and_revalidation(self):
+
+        timemap = ('<http://a.example.org>;rel="original",\n'
+                   + memento('/web/20000620180259/http://a.example.org',
+                             'Tue, 20 Jun 2000 18:02:59 GMT'))
+        routes = {'/tm': [(200, {'ETag': '"v1"'}, timemap), (304, {}, '')]}
+
+        with StubServer(routes) as server:
+            cache = TimemapCache(self.path, self.session)
+            tm = cache.get(server.url('/tm'))
+            cache.close()
+            self.assertEquals(1, len(server.log))
+
+            cache = TimemapCache(self.path, self.session)
+            warm = cache.get(server.url('/tm'))
+            self.assertEquals(1, len(server.log))
+            self.assertEquals("http://a.example.org", warm.original_uri)
+            self.assertEquals(tm[tm.first], warm[warm.first])
+
+            cache.get(server.url('/tm'), refresh=True)
+            self.assertEquals(2, len(server.log))
+            self.assertEquals('"v1"', server.log[1][2]['if-none-match'])
+
+    def test_warm_start_empty(self):
+
+        routes = {'/tm': (200, {}, '<http://a.example.org>;rel="original"')}
+
+        with StubServer(routes) as server:
+            for compact in (False, True):
+                cold = pymemento.LinkTimemap.from_uri(
+                    server.url('/tm'), compact=compact, session=self.session)
+                cache = TimemapCache(self.path, self.session)
+                cache.get(server.url('/tm'), compact=compact)
+                cache.close()
+
+                requests = len(server.log)
+                cache = TimemapCache(self.path, self.session)
+                warm = cache.get(server.url('/tm'), compact=compact)
+                cache.close()
+                self.assertEquals(requests, len(server.log))
+                self.assertEquals(type(cold.mementos), type(warm.mementos))
+                self.assertEquals(0, len(warm.mementos))
+                self.assertIsNone(warm.first)
+
+    def test_max_age(self):
+
+        def timemap(method, path, headers):
+            if 'if-none-match' in headers:
+                return (304, {}, '')
+            return (200, {'ETag': '"v1"'},
+                    '<http://a.example.org>;rel="original",\n' + memento(
+                        '/web/20000620180259/http://a.example.org',
+                        'Tue, 20 Jun 2000 18:02:59 GMT'))
+
+        now = [0]
+        with StubServer({'/tm': timemap}) as server:
+            cache = TimemapCache(self.path, self.session,
+                                 clock=lambda: now[0])
+            for _ in range(2):
+                tm = cache.get(server.url('/tm'), max_age=60)
+                self.assertEquals(1, len(tm.mementos))
+            self.assertEquals(1, len(server.log))
+
+            now[0] = 61
+            cache.get(server.url('/tm'), max_age=60)
+            self.assertEquals(2, len(server.log))
+            self.assertEquals('"v1"', server.log[1][2]['if-none-match'])
+            # a 304 counts as a refresh
+            tm = cache.get(server.url('/tm'), max_age=60)
+            self.assertEquals(2, len(server.log))
+            self.assertEquals(1, len(tm.mementos))
+            cache.get(server.url('/tm'))
+            self.assertEquals(2, len(server.log))
+
+    def test_incremental_pages(self):
+
+        def page(until, mementos):
+            return ('<http://a.example.org>;rel="original",\n'
+                    '</tm/1>;rel="timemap";until="Wed, 21 Jun 2000 00:00:00 GMT",\n'
+                    '</tm/2>;rel="timemap";from="Thu, 22 Jun 2000 00:00:00 GMT",\n'
+                    + ''.join(memento(*m) for m in mementos))
+
+        old = ('/web/20000620180259/http://a.example.org',
+               'Tue, 20 Jun 2000 18:02:59 GMT', 'first last memento')
+        new = ('/web/20000623000000/http://a.example.org',
+               'Fri, 23 Jun 2000 00:00:00 GMT')
+        newer = ('/web/20000624000000/http://a.example.org',
+                 'Sat, 24 Jun 2000 00:00:00 GMT', 'last memento')
+        routes = {'/tm': (200, {}, page(None, [])),
+                  '/tm/1': (200, {}, page(None, [old])),
+                  '/tm/2': [(200, {},
+                             page(None, [new + ('first last memento',)])),
+                            (200, {}, page(None, [new + ('first memento',),
+                                                  newer]))]}
+
+        with StubServer(routes) as server:
+            cache = TimemapCache(self.path, self.session)
+            tm = cache.get(server.url('/tm'))
+            self.assertEquals(2, len(tm.mementos))
+            self.assertEquals(['/tm', '/tm/1', '/tm/2'],
+                              [entry[1] for entry in server.log])
+
+            tm = cache.get(server.url('/tm'), refresh=True)
+            self.assertEquals(3, len(tm.mementos))
+            self.assertEquals(['/tm', '/tm/2'],
+                              [entry[1] for entry in server.log[3:]])
+            # the first and last relations are recomputed for the timemap
+            for compact in (False, True):
+                tm = cache.get(server.url('/tm'), compact=compact)
+                self.assertEquals(
+                    [['first', 'memento'], ['memento'], ['last', 'memento']],
+                    [list(m.rels) for key in sorted(tm.mementos.keys())
+                     for m in tm[key]])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTimemapCache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
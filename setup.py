@@ -12,7 +12,16 @@ setup(
     long_description=open('README.txt').read(),
     install_requires=[
         'python-dateutil',
+        'requests',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     keywords='memento http',
+    entry_points={
+        'console_scripts': [
+            'pymemento-ingest = pymemento.Ingest:main',
+        ],
+    },
 
 )